@@ -5,8 +5,42 @@ Created on Tue Sep 17 15:47:28 2024
 
 @author: Bodhi Global Analysis (Jungyeon Lee)
 """
+import datetime
+import importlib
+import os
+import sys
+import numpy as np
 import pandas as pd
 import bodhi_data_analysis as bodhi
+import bodhi_cache as bc
+import bodhi_partials as bpa
+import bodhi_cube as bcu
+import bodhi_export as bex
+import bodhi_sql as bsq
+import bodhi_shared as bsh
+import bodhi_writer as bw
+import bodhi_index as bix
+import bodhi_estimate as bes
+
+def load_preprocessing(folder, settings='data_preprocessing', name='sweetgum'):
+    """
+    - To import the data preprocessing settings of a project from their folder, without running them
+    - The folder is added to the module search path and the directories of the settings, which are relative to the
+      folder, are resolved from it (the preprocessing can then be run from the data analysis folder)
+    folder: str, Folder of the data preprocessing, e.g. '../../Data Preprocessing/CSO'
+    settings: str, Module of the settings (data_preprocessing.py)
+    name: str, Name of the Preprocessing object in the settings
+    """
+    folder = os.path.abspath(folder)
+    if not os.path.isfile(os.path.join(folder, f'{settings}.py')):
+        raise FileNotFoundError(f"No preprocessing settings have been found: {os.path.join(folder, settings)}.py")
+    if folder not in sys.path:
+        sys.path.insert(0, folder)
+    preprocessing = getattr(importlib.import_module(settings), name)
+    preprocessing.relocate(folder)
+    print(f"The preprocessing settings of {preprocessing.name} have been loaded from {folder}")
+    return preprocessing
+
 
 class PerformanceManagementFramework:
     
@@ -20,6 +54,162 @@ class PerformanceManagementFramework:
         self.name = name
         self.ptype = ptype
         self.indicators = []
+        self.cache = None
+        self.cube_store = None
+        self.results_path = None
+        self.backend = None
+        self.workers = None
+        self.writer = None
+        self.index = None
+        self.charts = 'png'
+        self.preprocessing = None
+        self.tool = None
+        self.partial = None
+
+    def preprocess(self, preprocessing, settings='data_preprocessing', name='sweetgum'):
+        """
+        - Run the data preprocessing and return the cleaned dataset in memory (no xlsx round trip, column types such as
+          categories and the derived indicator columns are kept, the Likert columns keep the labels which were given)
+        - The anonymised and cleaned datasets are still saved, in background threads (preprocessing.wait() waits for them)
+        - e.g. df = sweetgum.preprocess('../../Data Preprocessing/CSO') runs the settings of that folder (see load_preprocessing)
+
+        preprocessing: Preprocessing/str, Data preprocessing of the project (bodhi_data_preprocessing) or its folder
+        settings: str, Module of the preprocessing settings in the folder (data_preprocessing.py)
+        name: str, Name of the Preprocessing object in the settings
+        """
+        if isinstance(preprocessing, str):
+            preprocessing = load_preprocessing(preprocessing, settings, name)
+        if not preprocessing.processing(background=True):
+            raise RuntimeError(f"The data preprocessing of {preprocessing.name} has failed")
+        # The Likert columns are ordered categories of their whole scale: the labels nobody gave are dropped, so the
+        # tables have the same rows as with the dataset read from the xlsx file (no zero-count rows)
+        df = preprocessing.df
+        for col in preprocessing.codebook.columns:
+            if col in df.columns and isinstance(df[col].dtype, pd.CategoricalDtype):
+                df[col] = df[col].cat.remove_unused_categories()
+        self.preprocessing = preprocessing
+        print(f"The cleaned dataset ({len(preprocessing.df)} data points) has been handed to {self.name}")
+        return preprocessing.df
+
+    def enable_cache(self, folder, max_size=500, max_age=30):
+        """
+        - Reuse the tables and plots of unchanged indicators between runs
+
+        folder: str, Directory of the cache
+        max_size: int, Maximum size of the cache (MB)
+        max_age: int, Maximum age of an unused cache entry (days)
+        """
+        self.cache = bc.ResultCache(folder, max_size, max_age)
+        return True
+
+    def set_backend(self, backend='pandas', threads=None):
+        """
+        - Choose how the indicator tables are counted: 'pandas' (default) or 'duckdb' (in-process database,
+          multi-threaded grouped queries, faster on large merged multi-country datasets)
+
+        backend: str, 'pandas' or 'duckdb'
+        threads: int, Number of threads of the database (all cores by default)
+        """
+        if backend == 'pandas':
+            self.backend = None
+        elif backend == 'duckdb':
+            self.backend = bsq.SQLBackend(threads)
+        else:
+            raise ValueError(f"Unknown backend {backend}: please use 'pandas' or 'duckdb'")
+        print(f"The indicator tables will be counted with {backend}")
+        return True
+
+    def set_workers(self, workers=None):
+        """
+        - Compute the tables and statistical tests of several indicators at once within one run, in threads
+        - Plots and sheets are still made one by one in the order of the indicators, so the workbooks do not change
+        - Set before adding the indicators
+
+        workers: int, Number of threads (None: one indicator at a time)
+        """
+        self.workers = workers
+        print(f"The indicators will be computed by {workers or 1} thread(s)")
+        return True
+
+    def set_writer(self, threads=2, max_queue=32):
+        """
+        - Write the sheets and plots in background threads while the next indicators are computed
+        - The writer is flushed at the end of every run, so the files are complete when PMF_generation returns
+        - Set before adding the indicators
+
+        threads: int, Number of writer threads (0: write during the run, the default)
+        max_queue: int, Maximum number of outputs waiting for each writer thread (the run waits when it is full)
+        """
+        if self.writer is not None:
+            errors = self.writer.close()
+            if errors:
+                print(f"{errors} sheets or plots could not be written")
+        self.writer = bw.BackgroundWriter(threads, max_queue) if threads else None
+        print(f"The sheets and plots will be written by {threads} background thread(s)" if threads else "The sheets and plots will be written during the run")
+        return True
+
+    def set_charts(self, charts='png'):
+        """
+        - Choose the format of the plots: 'png' (rendered with matplotlib, the default), 'panels' (one PNG per table with
+          the overall plot and the count and percentage plots of every breakdown as small multiples) or 'vega' (one
+          Vega-Lite JSON spec per plot with its data, the Bodhi palette, labels and target/baseline/midline lines,
+          rendered on demand in a browser or notebook, much faster than rendering PNG files)
+        - Set before adding the indicators
+
+        charts: str, 'png', 'panels' or 'vega'
+        """
+        formats = {'png': 'PNG files', 'panels': 'one PNG of panels per table', 'vega': 'Vega-Lite specs (.vl.json)'}
+        if charts not in formats:
+            raise ValueError(f"Unknown chart format {charts}: please use 'png', 'panels' or 'vega'")
+        self.charts = charts
+        print(f"The plots will be saved as {formats[charts]}")
+        return True
+
+    def build_index(self, df, columns=None, max_values=100):
+        """
+        - Index the dataset once: one packed row bitmap per value of each column (bodhi_index)
+        - Conditions given as column values, e.g. indicator.add_condition({'a2': 'Female'}), are then resolved with
+          bitwise AND/OR of the bitmaps, and the indicators only take their rows from the dataset
+        - Returns the index, whose rows() also gives the row positions of breakdown subsets for add_plan(plan, df, rows=...)
+        - Set before adding the indicators
+
+        df: Dataframe, Dataset to index
+        columns: list, Columns to index (by default, all columns with at most max_values different values)
+        max_values: int, Largest number of different values of a column indexed by default
+        """
+        self.index = bix.BitmapIndex(df, columns, max_values)
+        return self.index
+
+    def flush(self):
+        """
+        - Wait until the background writer has written all the sheets and plots
+        """
+        if self.writer is not None:
+            errors = self.writer.flush()
+            if errors:
+                print(f"{errors} sheets or plots could not be written")
+        return True
+
+    def enable_export(self, file_path, run=None):
+        """
+        - Append the tables of every run to one long-format results file (run, country, indicator, table, breakdown, category, count, percentage, n)
+
+        file_path: str, Directory of the results file (.csv) or dataset folder (.parquet, one part file per run)
+        run: str, Name of this pipeline run (the current date and time by default)
+        """
+        self.results_path = file_path
+        self.run = run or datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        return True
+
+    def export_results(self):
+        """
+        - Append the tables of the last run to the results file (see enable_export)
+        """
+        results = bex.long_format(self.partial, self.run)
+        if not bex.append_results(results, self.results_path):
+            return False
+        print(f"{len(results)} result rows of {self.partial.label} have been added to {self.results_path}")
+        return True
 
     def add_indicators(self, indicators):
         """
@@ -31,17 +221,192 @@ class PerformanceManagementFramework:
             self.indicators.append(indicator)
             print(f'{indicator.indicator_name} has been added to the data analysis pipeline')
             
-        self.tool = bodhi.Data_analysis(self.name, self.indicators)
+        self.tool = bodhi.Data_analysis(self.name, self.indicators, cache=self.cache, backend=self.backend, workers=self.workers, writer=self.writer, index=self.index, charts=self.charts)
+        self.tool.indicator_analysis()
+        return True
+
+    def partition(self, df, by='country'):
+        """
+        - Split the dataset once into groups of row positions (no data is copied)
+        - Returns {group: row positions}, to be used with add_plan(plan, df, rows=...)
+        - Rows without a value are kept in their own group (NaN), so the groups always add up to the whole dataset
+
+        df: Dataframe, Dataset to split
+        by: str, Column to split the dataset by
+        """
+        groups = df.groupby(by, sort=False, dropna=False).indices
+        print(f"The dataset has been partitioned by {by}: {', '.join(f'{k} ({len(v)})' for k, v in groups.items())}")
+        return groups
+
+    def sample(self, df, fraction=0.05, size=None, by=('country', 'a2'), seed=0):
+        """
+        - Draw a reproducible stratified sample of the dataset (the same rows for the same seed)
+        - Every group (e.g. country x gender) keeps the same share of its rows, and at least one row
+        - Returns the row positions of the sample, to be used with add_plan(plan, df, rows=...)
+
+        df: Dataframe, Dataset to sample
+        fraction: float, Share of the rows to keep in each group
+        size: int, Number of rows to keep instead of a fraction (approximately, after rounding in each group)
+        by: tuple, Columns of the groups (columns missing from the dataset are left out)
+        seed: int, Seed of the random sample
+        """
+        if size is not None:
+            fraction = min(size / max(len(df), 1), 1)
+        by = [col for col in by if col in df.columns]
+        groups = df.groupby(by, sort=True, dropna=False).indices.values() if by else [np.arange(len(df))]
+        rng = np.random.default_rng(seed)
+        rows = [rng.choice(positions, max(1, round(len(positions) * fraction)), replace=False) for positions in groups]
+        rows = np.sort(np.concatenate(rows)) if rows else np.array([], dtype=np.int64)
+        print(f"A sample of {len(rows)} data points out of {len(df)} has been drawn (by {', '.join(by) or 'all rows'})")
+        return rows
+
+    def preview(self, plan, df, folder='preview/', fraction=0.05, size=None, by=('country', 'a2'), seed=0, dpi=100):
+        """
+        - Run the whole pipeline (tables, plots and tests) on a stratified sample of the dataset at draft quality,
+          to check the indicator definitions and chart layouts quickly before the full run
+        - The workbooks and plots are written to their own folder, the cache and the results file are not used
+        - The indicators, tool and partial aggregate of the PMF are restored afterwards, so the preview does not change
+          the next run or merge
+
+        plan: IndicatorPlan, Compiled indicator definitions (bodhi_plan)
+        df: Dataframe, Dataset to preview
+        folder: str, Directory of the preview workbooks and plots
+        fraction: float, Share of the rows of each group in the sample (see sample)
+        size: int, Number of rows of the sample instead of a fraction
+        by: tuple, Columns of the groups of the sample
+        seed: int, Seed of the sample
+        dpi: int, Resolution of the plots (and of the figures they are drawn on)
+        """
+        rows = self.sample(df, fraction, size, by, seed)
+        os.makedirs(os.path.join(folder, 'visuals'), exist_ok=True)
+        cache, results_path = self.cache, self.results_path
+        indicators, tool, partial = self.indicators, self.tool, self.partial
+        self.cache, self.results_path = None, None
+        try:
+            self.add_plan(plan, df, rows=rows)
+            self.tool.dpi = dpi
+            self.tool.figure_style = dict(self.tool.figure_style, dpi=dpi)
+            self.PMF_generation(os.path.join(folder, f'{self.name} Statistics.xlsx'), os.path.join(folder, f'{self.name} Test Results.xlsx'),
+                                os.path.join(folder, 'visuals', ''), label='Preview')
+        finally:
+            self.cache, self.results_path = cache, results_path
+            self.indicators, self.tool, self.partial = indicators, tool, partial
+        print(f"The preview has been saved: {folder}")
+        return True
+
+    def plan(self, plan, df, folder='', rows=None, label=None, timings=None):
+        """
+        - List every sheet, plot and statistical test a run would produce, with its estimated time, without running it
+        - The estimates come from the number of rows, the number of categories of the columns and the timings of each
+          operation (bes.calibrate() measures them on this machine)
+        - Returns the run plan (bodhi_estimate): its items can be selected, or its indicators split between workers
+
+        plan: IndicatorPlan, Compiled indicator definitions (bodhi_plan)
+        df: Dataframe, Dataset to analyse
+        folder: str, Directory where the plots would be saved
+        rows: array, Row positions of the dataset to analyse, e.g. one group from partition() (None for all rows)
+        label: str, Name of the run
+        timings: dic, Seconds of each operation (see bodhi_estimate.default_timings)
+        """
+        tool = bodhi.Data_analysis(self.name, plan.bind(df, rows), index=self.index, charts=self.charts)
+        run = bes.plan_run(tool, folder, timings, label)
+        run.report()
+        return run
+
+    def add_plan(self, plan, df, rows=None):
+        """
+        - Evaluate a compiled indicator plan on a dataset (replaces the indicators of the previous run)
+        - With rows, each indicator only takes the rows and columns it needs from the dataset
+
+        plan: IndicatorPlan, Compiled indicator definitions (bodhi_plan)
+        df: Dataframe, Dataset to analyse
+        rows: array, Row positions of the dataset to analyse, e.g. one group from partition() (None for all rows)
+        """
+        self.indicators = []
+        self.tool = bodhi.Data_analysis(self.name, self.indicators, cache=self.cache, backend=self.backend, workers=self.workers, writer=self.writer, index=self.index, charts=self.charts)
+        self.indicators.extend(plan.bind(df, rows))
+        print(f'{len(self.indicators)} indicators have been added to the data analysis pipeline')
         self.tool.indicator_analysis()
         return True
 
- 
-    def PMF_generation(self, file_path1, file_path2, folder):
+    def share(self, df, file_path):
+        """
+        - Write the dataset once to a memory-mapped Arrow file for worker processes (see parallel_partials)
+
+        df: Dataframe, Dataset to share
+        file_path: str, Directory of the file (.arrow)
+        """
+        return bsh.publish(df, file_path)
+
+    def parallel_partials(self, plan, dataset, groups, workers=None):
+        """
+        - Count an indicator plan on several groups of a shared dataset at once (e.g. one worker per country)
+        - Workers attach the shared file and only receive the plan and the row positions of their group, no dataframe is copied
+        - Returns {group: partial aggregate}, the reports are then written with merge_report without the dataset
+
+        plan: IndicatorPlan, Compiled indicator definitions (bodhi_plan)
+        dataset: SharedDataset, Dataset shared with share()
+        groups: dic, Row positions of each group, e.g. from partition() ({'Overall': None} for all rows)
+        workers: int, Number of worker processes (all cores by default)
+        """
+        partials = bsh.plan_partials(dataset, plan, groups, workers)
+        print(f"{len(partials)} runs have been counted: {', '.join(map(str, partials))}")
+        return partials
+
+    def count_partials(self, plan, df, groups):
+        """
+        - Count an indicator plan on several groups of the dataset in this process, without writing their reports
+          (e.g. the countries which were not run, before merging the regional and overall reports)
+        - Returns {group: partial aggregate}, the reports are then written with merge_report
+
+        plan: IndicatorPlan, Compiled indicator definitions (bodhi_plan)
+        df: Dataframe, Dataset
+        groups: dic, Row positions of each group, e.g. from partition()
+        """
+        partials = {}
+        for label, rows in groups.items():
+            tool = bodhi.Data_analysis(label, plan.bind(df, rows), backend=self.backend, index=self.index)
+            tool.indicator_analysis()
+            tool.partial_counts()
+            tool.partial.label = label
+            partials[label] = tool.partial
+        print(f"{len(partials)} runs have been counted: {', '.join(map(str, partials))}")
+        return partials
+
+    def PMF_generation(self, file_path1, file_path2, folder, label=None, cube_folder=None):
         """
         - Generate tables from all the indicators
+        - The counts and statistics of the run are kept in self.partial, to be merged with other runs (merge_report)
         file_path1: str, Directory to save the tables
         file_path2: str, Directory to save the chi2 test results
         folder: str, Directory to save the plots
+        label: str, Name of the run, e.g. country (the plot folder by default)
+        cube_folder: str, Directory to save the count cubes of the run for query() (not saved by default)
+        """
+        self.new_workbooks(file_path1, file_path2)
+            
+        if self.ptype == 'Evaluation':
+            self.tool.statistical_test(file_path2, folder)
+            self.tool.evaluation(file_path1, folder)
+        self.flush()
+        self.tool.save_workbooks()
+
+        self.partial = self.tool.partial
+        self.partial.label = label or folder
+        if cube_folder is not None:
+            self.save_cubes(cube_folder)
+        if self.results_path is not None:
+            self.export_results()
+        if self.cache is not None:
+            self.cache.evict()
+        
+        print("\nData analysis has been finished")
+
+    def new_workbooks(self, file_path1, file_path2):
+        """
+        - Create the empty workbooks of the tables and statistical tests
+        file_path1: str, Directory to save the tables
+        file_path2: str, Directory to save the chi2 test results
         """
         empty_df1 = pd.DataFrame()
         with pd.ExcelWriter(file_path1, engine='openpyxl') as writer:
@@ -50,10 +415,61 @@ class PerformanceManagementFramework:
         empty_df2 = pd.DataFrame()
         with pd.ExcelWriter(file_path2, engine='openpyxl') as writer:
             empty_df2.to_excel(writer, sheet_name='Chi2 Tests', index=False)
-            
-        if self.ptype == 'Evaluation':
-            self.tool.statistical_test(file_path2, folder)
-            self.tool.evaluation(file_path1, folder)
 
-        
-        print("\nData analysis has been finished")
\ No newline at end of file
+    def merge_report(self, partials, file_path1, file_path2, folder, label='Overall', cube_folder=None):
+        """
+        - Generate the tables and plots of several runs (e.g. a region) by merging their partial aggregates
+        - The dataset is not scanned again: the counts and sufficient statistics of each run are summed
+        - Medians and modes are not mergeable and are left empty in the statistical tests
+        partials: list, Partial aggregates of the runs (self.partial after each PMF_generation)
+        file_path1: str, Directory to save the tables
+        file_path2: str, Directory to save the statistical test results
+        folder: str, Directory to save the plots
+        label: str, Name of the merged run
+        cube_folder: str, Directory to save the merged count cubes for query() (not saved by default)
+        """
+        merged = bpa.PartialAggregate.merge(partials, label)
+        self.new_workbooks(file_path1, file_path2)
+        self.tool = bodhi.Data_analysis(self.name, [], cache=None, writer=self.writer, charts=self.charts)
+        self.tool.partial_report(merged, file_path1, file_path2, folder)
+        self.flush()
+        self.tool.save_workbooks()
+        self.partial = self.tool.partial
+        self.partial.label = label
+        if cube_folder is not None:
+            self.save_cubes(cube_folder)
+        if self.results_path is not None:
+            self.export_results()
+        print(f"\n{label} report has been generated from {len(partials)} runs")
+        return True
+
+    def save_cubes(self, folder):
+        """
+        - Save the count cubes of the last run (indicator x category x every breakdown column)
+        folder: str, Directory of the cubes
+        """
+        cubes = []
+        for sheet_name, table in self.partial.tables.items():
+            cube = table['counts'].get('cube')
+            if cube is not None:
+                indicator = table['indicator']
+                cubes.append((cube, {'sheet': sheet_name, 'indicator': indicator.indicator_name, 'name': indicator.name,
+                                     'description': indicator.description, 'run': self.partial.label}))
+        bcu.save_cubes(cubes, folder)
+        self.cube_store = bcu.CubeStore(folder)
+        return True
+
+    def query(self, indicator, by=None, where=None, folder=None):
+        """
+        - Get a count table from the saved count cubes, without the respondent-level data
+        - e.g. query('CA.2', by=['country', 'a2'], where={'Disability': 'Disability'})
+        indicator: str, Sheet name, indicator name or name of the indicator
+        by: str/list, Breakdown column or list of breakdown columns (None for the counts of all respondents)
+        where: dic, Values to keep for the other columns {'col1': 'value', 'col2': ['value1', 'value2']}
+        folder: str, Directory of the cubes (the cubes of the last run by default)
+        """
+        if folder is not None:
+            self.cube_store = bcu.CubeStore(folder)
+        if self.cube_store is None:
+            raise ValueError("No count cubes to query: run PMF_generation with cube_folder or give the folder of saved cubes")
+        return self.cube_store.query(indicator, by, where)
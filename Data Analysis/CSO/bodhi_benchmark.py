@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@author: Bodhi Global Analysis (Jungyeon Lee)
+"""
+
+"""
+Benchmarks for the data analysis pipeline
+- Run from this folder: python bodhi_benchmark.py (add --backend to compare the pandas and DuckDB backends)
+- Add --merge to check that the multi-tables merged from partial counts match a direct run
+"""
+import json
+import os
+import subprocess
+import sys
+
+# Modules which must not be loaded by simply importing the analysis package
+heavy_modules = ['matplotlib', 'seaborn', 'statsmodels', 'scipy', 'IPython']
+
+def import_time(module='bodhi_PMF', repeat=5, limit=1.0):
+    """
+    - To measure the import time of the analysis package in a fresh interpreter
+    - Fails when a heavy module is loaded at import or the best time is over the limit
+    module: str, Module to import
+    repeat: int, Number of fresh interpreters to run (the best time is reported)
+    limit: float, Maximum import time allowed (seconds)
+    """
+    code = ("import sys, time, json\n"
+            "start = time.perf_counter()\n"
+            f"import {module}\n"
+            "elapsed = time.perf_counter() - start\n"
+            f"heavy = [m for m in {heavy_modules!r} if m in sys.modules]\n"
+            "print(json.dumps({'seconds': elapsed, 'heavy': heavy}))")
+    folder = os.path.dirname(os.path.abspath(__file__))
+    times = []
+    heavy = []
+    for _ in range(repeat):
+        output = subprocess.run([sys.executable, '-c', code], cwd=folder, capture_output=True, text=True, check=True)
+        result = json.loads(output.stdout.strip().splitlines()[-1])
+        times.append(result['seconds'])
+        heavy = result['heavy']
+    best = min(times)
+    print(f"Import time of {module}: {best:.3f}s (best of {repeat})")
+    if heavy:
+        print(f"Heavy modules loaded at import: {', '.join(heavy)}")
+    return best <= limit and not heavy
+
+def backend_time(rows=1000000, repeat=3):
+    """
+    - To compare the time to count one table with five breakdown columns with the pandas and DuckDB backends
+    - The dataset is synthetic, both backends must give the same counts
+    rows: int, Number of respondents of the synthetic dataset
+    repeat: int, Number of repetitions (the best time is reported)
+    """
+    import time
+    import numpy as np
+    import pandas as pd
+    import bodhi_cube as bcu
+    import bodhi_sql as bsq
+    rng = np.random.default_rng(0)
+    dims = {'region_group': 3, 'country': 9, 'a2': 4, 'a3': 5, 'Disability': 2}
+    df = pd.DataFrame({col: rng.integers(0, n, rows).astype(str) for col, n in dims.items()})
+    df['var'] = rng.choice(['Yes', 'No', 'Not sure', None], rows)
+    backend = bsq.SQLBackend()
+    times = {}
+    for name, count in (('pandas', lambda: (df[['var']].value_counts(), bcu.CountCube.build(df, ['var'], list(dims)))),
+                        ('duckdb', lambda: backend.counts(df, ['var'], list(dims)))):
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            overall, cube = count()
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        times[name] = (best, overall, cube)
+        print(f"{name}: {best:.3f}s for {rows} rows (best of {repeat})")
+    same = times['pandas'][1].equals(times['duckdb'][1]) and (times['pandas'][2].counts == times['duckdb'][2].counts).all()
+    print("Both backends give the same counts" if same else "The backends give different counts")
+    return same
+
+def merge_check(rows=10000, groups=3):
+    """
+    - To check that a multi-table summed from the partial counts of several groups (e.g. countries) matches a direct run
+    - The variables of the synthetic multi-table ('x_2', 'x_10', 'x_1') are not in sorted order, their labels are set by position
+    rows: int, Number of respondents of the synthetic dataset
+    groups: int, Number of groups the counts are split into
+    """
+    import numpy as np
+    import pandas as pd
+    import bodhi_data_analysis as bodhi
+    import bodhi_partials as bpa
+    rng = np.random.default_rng(0)
+    columns = ['x_2', 'x_10', 'x_1']
+    labels = ['Option 2', 'Option 10', 'Option 1']
+    categories = ['Yes', 'No', 'Not sure']
+    df = pd.DataFrame({col: rng.choice(categories + [None], rows) for col in columns})
+    df['group'] = rng.integers(0, groups, rows)
+    tool = bodhi.Data_analysis('Benchmark', [])
+    merged = None
+    for _, rows_df in df.groupby('group'):
+        merged = bpa.add_counts(merged, tool.multi_counts(rows_df, columns, categories))
+    direct = tool.multi_format(tool.multi_counts(df, columns, categories), labels)
+    same = tool.multi_format(merged, labels).equals(direct)
+    print(f"The merged multi-table {'matches' if same else 'does not match'} the direct run ({groups} groups)")
+    return same
+
+
+if __name__ == '__main__':
+    ok = import_time()
+    if '--backend' in sys.argv:
+        ok = backend_time() and ok
+    if '--merge' in sys.argv:
+        ok = merge_check() and ok
+    sys.exit(0 if ok else 1)
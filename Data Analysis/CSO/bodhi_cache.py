@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@author: Bodhi Global Analysis (Jungyeon Lee)
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import time
+import pandas as pd
+
+
+class ResultCache:
+
+    def __init__(self, folder, max_size=500, max_age=30):
+        """
+        - Initialise the result cache (tables and plots of the indicators between runs)
+        - Entries are keyed on the dataset slice, the indicator definition and the render settings,
+          so an indicator is only recomputed and re-rendered when one of them has changed
+
+        folder: str, Directory of the cache
+        max_size: int, Maximum size of the cache (MB)
+        max_age: int, Maximum age of an unused cache entry (days)
+        """
+        self.folder = folder
+        self.max_size = max_size
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(folder, exist_ok=True)
+
+    def key(self, df, columns, definition, settings):
+        """
+        - To generate the key of a cache entry
+        df: Dataframe, Dataset slice of the indicator
+        columns: list, Columns of the dataset slice used by the indicator
+        definition: dic, Definition of the indicator (var, breakdown, var_order, var_change, labels, targets...)
+        settings: dic, Render settings (plot folder, dpi, etc.)
+        """
+        digest = hashlib.sha256()
+        data = df[columns]
+        digest.update(json.dumps([list(map(str, data.columns)), list(map(str, data.dtypes))]).encode())
+        digest.update(pd.util.hash_pandas_object(data, index=False).values.tobytes())
+        digest.update(json.dumps(definition, sort_keys=True, default=str).encode())
+        digest.update(json.dumps(settings, sort_keys=True, default=str).encode())
+        return digest.hexdigest()
+
+    def load(self, key):
+        """
+        - To load the tables of a cache entry and restore its plots
+        - Returns None when the entry does not exist
+        key: str, Key of the cache entry
+        """
+        entry = os.path.join(self.folder, key)
+        manifest_path = os.path.join(entry, 'manifest.json')
+        if not os.path.exists(manifest_path):
+            self.misses += 1
+            return None
+        try:
+            with open(manifest_path) as f:
+                manifest = json.load(f)
+            frames = pd.read_pickle(os.path.join(entry, 'frames.pkl'))
+            for name, output_file in manifest['images'].items():
+                shutil.copyfile(os.path.join(entry, name), output_file)
+        except (OSError, ValueError, EOFError) as e:
+            print(f"Cache entry {key} could not be used: {e}")
+            shutil.rmtree(entry, ignore_errors=True)
+            self.misses += 1
+            return None
+        os.utime(manifest_path)
+        self.hits += 1
+        return frames
+
+    def store(self, key, frames, images):
+        """
+        - To save the tables and plots of an indicator
+        - Nothing is saved when a table or plot of the indicator failed, so the indicator is computed again in the next run
+        key: str, Key of the cache entry
+        frames: tuple, Tables of the indicator
+        images: list, Files of the plots of the indicator (None for a table or plot which failed)
+        """
+        missing = [output_file for output_file in images if output_file is None or not os.path.exists(output_file)]
+        if missing:
+            print(f"The cache entry has not been saved: {len(missing)} tables or plots of the indicator are missing")
+            return False
+        entry = os.path.join(self.folder, key)
+        tmp = f'{entry}.tmp'
+        shutil.rmtree(tmp, ignore_errors=True)
+        os.makedirs(tmp)
+        manifest = {'images': {}}
+        for i, output_file in enumerate(images):
+            name = f'{i}{os.path.splitext(output_file)[1]}'
+            shutil.copyfile(output_file, os.path.join(tmp, name))
+            manifest['images'][name] = output_file
+        pd.to_pickle(frames, os.path.join(tmp, 'frames.pkl'))
+        with open(os.path.join(tmp, 'manifest.json'), 'w') as f:
+            json.dump(manifest, f)
+        shutil.rmtree(entry, ignore_errors=True)
+        os.replace(tmp, entry)
+        return True
+
+    def evict(self):
+        """
+        - To remove the entries older than max_age, then the least recently used entries above max_size
+        """
+        now = time.time()
+        entries = []
+        for name in os.listdir(self.folder):
+            entry = os.path.join(self.folder, name)
+            manifest_path = os.path.join(entry, 'manifest.json')
+            if not os.path.exists(manifest_path):
+                continue
+            used = os.path.getmtime(manifest_path)
+            if now - used > self.max_age * 86400:
+                shutil.rmtree(entry, ignore_errors=True)
+                continue
+            size = sum(os.path.getsize(os.path.join(entry, f)) for f in os.listdir(entry))
+            entries.append((used, size, entry))
+
+        total = sum(size for _, size, _ in entries)
+        removed = 0
+        for used, size, entry in sorted(entries):
+            if total <= self.max_size * 1024 * 1024:
+                break
+            shutil.rmtree(entry, ignore_errors=True)
+            total -= size
+            removed += 1
+        print(f"Result cache: {self.hits} reused, {self.misses} computed, {removed} evicted ({total / 1024 / 1024:.1f} MB)")
+        self.hits = 0
+        self.misses = 0
@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@author: Bodhi Global Analysis (Jungyeon Lee)
+"""
+
+import re
+import numpy as np
+import pandas as pd
+
+# Dashes of the raw exports (hyphen, en dash, em dash, minus...) are read as '-'
+dash_pattern = '[\u2010-\u2015\u2212-]'
+_dashes = re.compile(dash_pattern)
+_dash_spaces = re.compile(r'\s*-\s*')
+_spaces = re.compile(r'\s+')
+
+
+def normalise(label):
+    """
+    - To normalise an answer label (case, spaces and dashes), e.g. '4 - A Lot', '4 – a lot ' and '4-A lot' are the same label
+    - Values which are not text (numbers, missing values) are returned as they are
+    label: str, Answer label
+    """
+    if not isinstance(label, str):
+        return label
+    label = _dashes.sub('-', label.lower())
+    label = _dash_spaces.sub(' - ', label)
+    return _spaces.sub(' ', label).strip()
+
+
+def map_scores(values, score_map, default=0):
+    """
+    - To score the answers of a column with a score map (the labels are normalised, see normalise)
+    - Each different answer is looked up once, the column is then scored with its integer codes
+    values: Series, Answers
+    score_map: dic, Score of each label {'1 - Not at all': 1, '2 - Slightly': 2, ...}
+    default: int/float, Score of missing answers and of answers out of the map
+    """
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        codes, labels = values.cat.codes.to_numpy(), values.cat.categories
+    else:
+        codes, labels = pd.factorize(values)
+    lookup = {normalise(label): score for label, score in score_map.items()}
+    # The last position scores the missing answers (code -1)
+    table = np.array([lookup.get(normalise(label), default) for label in labels] + [default])
+    return table[codes]
+
+
+class Scale:
+
+    def __init__(self, labels, scores=None):
+        """
+        - Initialise the scale (answer labels of a Likert question, from the lowest to the highest)
+
+        labels: list, Labels as they are written in the reports, e.g. ['1 - Not at all', ..., '5 - Extremely']
+        scores: list, Score of each label (1, 2, 3... by default)
+        """
+        self.labels = list(labels)
+        self.scores = np.arange(1, len(self.labels) + 1) if scores is None else np.asarray(scores)
+        self.positions = {normalise(label): i for i, label in enumerate(self.labels)}
+
+    def position(self, label):
+        """
+        - To find a label in the scale (any variant of the label, see normalise), None when it is not in the scale
+        label: str, Answer label
+        """
+        return self.positions.get(normalise(label))
+
+    def score_map(self):
+        """
+        - To get the score of each label {label: score}, e.g. for the score maps of the indicators
+        """
+        return {label: score.item() for label, score in zip(self.labels, self.scores)}
+
+
+class Codebook:
+
+    def __init__(self, scales, columns):
+        """
+        - Initialise the codebook (the Likert scales of the project and the columns answered with each scale)
+        - The columns are compiled once into ordered categories of their scale (see compile), the scores are then
+          integer look-ups of the category codes instead of mapping the labels again for each indicator
+
+        scales: dic, Scales of the project {'extent': Scale([...])}
+        columns: dic, Scale of each Likert column {'b13a': 'extent', ...}
+        """
+        self.scales = scales
+        self.columns = columns
+        self.unmapped = {}
+
+    def scale(self, col):
+        """
+        - To get the scale of a Likert column
+        col: str, Likert column
+        """
+        return self.scales[self.columns[col]]
+
+    def compile(self, df):
+        """
+        - To store the Likert columns of a dataset as ordered categories of their scale (in place)
+        - Variants of the labels are written as the labels of the scale, labels which are not in the scale are kept
+          after the labels of the scale (they are not scored, see report)
+        df: Dataframe, Dataset
+        """
+        compiled = 0
+        for col in self.columns:
+            if col not in df.columns:
+                continue
+            scale = self.scale(col)
+            values = df[col].astype(object) if isinstance(df[col].dtype, pd.CategoricalDtype) else df[col]
+            codes, uniques = pd.factorize(values)
+            positions = np.array([scale.position(value) for value in uniques], dtype=object)
+            others = [i for i, position in enumerate(positions) if position is None]
+            positions[others] = len(scale.labels) + np.arange(len(others))
+            categories = scale.labels + [uniques[i] for i in others]
+            # The codes of the answers become the positions of their labels in the categories (-1 stays missing)
+            df[col] = pd.Categorical.from_codes(np.append(positions.astype(np.int64), -1)[codes], categories=categories, ordered=True)
+            counts = np.bincount(codes[codes >= 0], minlength=len(uniques))
+            self.unmapped.pop(col, None)
+            if others:
+                self.unmapped[col] = pd.Series({uniques[i]: counts[i] for i in others})
+            compiled += 1
+        print(f"{compiled} Likert columns have been coded with their scales")
+        return df
+
+    def scores(self, df, columns):
+        """
+        - To get the scores of the answers of Likert columns as an integer array (one row per data point, one column
+          per Likert column), missing answers and labels out of the scale score 0
+        df: Dataframe, Dataset (compiled, see compile)
+        columns: list, Likert columns
+        """
+        scores = []
+        for col in columns:
+            scale = self.scale(col)
+            values = df[col]
+            if not (isinstance(values.dtype, pd.CategoricalDtype) and list(values.cat.categories[:len(scale.labels)]) == scale.labels):
+                scores.append(map_scores(values, scale.score_map()))
+                continue
+            table = np.zeros(len(values.cat.categories) + 1, dtype=scale.scores.dtype)
+            table[:len(scale.labels)] = scale.scores
+            scores.append(table[values.cat.codes.to_numpy()])
+        return np.column_stack(scores) if scores else np.zeros((len(df), 0), dtype=np.int64)
+
+    def report(self):
+        """
+        - To list the answers of the Likert columns which are not in their scale (column, label, count)
+        """
+        rows = [(col, label, int(count)) for col, counts in self.unmapped.items() for label, count in counts.items()]
+        report = pd.DataFrame(rows, columns=['column', 'label', 'count'])
+        if report.empty:
+            print("All Likert answers are in their scales")
+        else:
+            print(f"{len(report)} Likert labels are not in their scales (not scored):")
+            for col, label, count in rows:
+                print(f"  {col}: {label!r} ({count} data points)")
+        return report
@@ -8,29 +8,115 @@ Created on Tue Sep 17 15:04:49 2024
 
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
-from matplotlib.ticker import MaxNLocator
-from matplotlib.patches import Patch
-from matplotlib.lines import Line2D
-import seaborn as sns
-from pandas.plotting import table
-from IPython.display import clear_output
 import warnings
-from openpyxl import load_workbook
-from openpyxl.utils.dataframe import dataframe_to_rows
 from openpyxl.styles import Font
-from statsmodels.stats.outliers_influence import variance_inflation_factor
-from statsmodels.tools.tools import add_constant
-from scipy.stats import normaltest
-from statsmodels.stats.diagnostic import lilliefors
+import os
 import re
-import statsmodels.api as sm
-from scipy import stats
-from scipy.stats import f_oneway
-from statsmodels.formula.api import ols
+import hashlib
+import functools
+from concurrent.futures import ThreadPoolExecutor
+import bodhi_partials as bpa
+import bodhi_cube as bcu
+import bodhi_bits as bb
+import bodhi_codebook as bcb
+import bodhi_vega as bv
 
+# Plotting, statsmodels and scipy are heavy to import and are only needed by the plots and
+# the statistical tests, so they are loaded on first use (see _figure, _stats and _sm)
 warnings.filterwarnings("ignore")
-plt.rcParams['figure.dpi'] = 600
+
+# Settings of every new figure, passed to each figure instead of the global matplotlib settings (see _figure)
+figure_style = {'dpi': 600}
+
+def _figure(figsize=None, style=None):
+    """
+    - To create a figure with its own Agg canvas, without pyplot
+    - The figure is not registered by pyplot and does not change the global matplotlib settings, so plots can be
+      drawn and saved by several threads at once
+    figsize: tuple, Size of the figure (inches)
+    style: dic, Settings of the figure (figure_style by default)
+    """
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    fig = Figure(figsize=figsize, **(figure_style if style is None else style))
+    FigureCanvasAgg(fig)
+    return fig
+
+def _stats():
+    """
+    - To import scipy.stats on first use
+    """
+    from scipy import stats
+    return stats
+
+def _sm():
+    """
+    - To import statsmodels.api on first use
+    """
+    import statsmodels.api as sm
+    return sm
+
+# Modules whose code changes the cached tables and plots, next to this module (see _source_digest)
+source_modules = ['bodhi_data_analysis', 'bodhi_vega', 'bodhi_cube', 'bodhi_sql', 'bodhi_codebook', 'bodhi_bits']
+
+@functools.lru_cache(maxsize=None)
+def _source_digest():
+    """
+    - To hash the source of this module and of the modules it counts and draws with (cached results are not reused
+      after a code change)
+    """
+    digest = hashlib.sha256()
+    folder = os.path.dirname(os.path.abspath(__file__))
+    for module in source_modules:
+        with open(os.path.join(folder, f'{module}.py'), 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+def _outcome(task):
+    """
+    - To run a task of the indicator scheduler, returns (result, None) or (None, error)
+    """
+    try:
+        return task(), None
+    except Exception as e:
+        return None, e
+
+def _ordered(tasks, workers=None):
+    """
+    - To run independent tasks (functions without arguments) and yield their outcomes in the order of the tasks
+    - A failing task does not stop the others, its error is returned in its outcome (see _outcome)
+    - With one worker, each task runs when its outcome is taken (the same as a plain loop)
+    tasks: list, Tasks to run
+    workers: int, Number of threads running the tasks at once
+    """
+    if workers is None or workers <= 1:
+        for task in tasks:
+            yield _outcome(task)
+        return
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(_outcome, task) for task in tasks]
+        for future in futures:
+            yield future.result()
+
+def _condition_mask(df, condition, masks=None):
+    """
+    - To evaluate a string condition on a dataset (DataFrame.eval, with numexpr when it is installed)
+    - With the masks of a run (see Data_analysis.condition_mask), an identical condition of several indicators is
+      evaluated once. Masks are not kept between runs, so a dataset changed in place is evaluated again
+    df: Dataframe, Dataset
+    condition: str, Condition, e.g. "age > 25 and a2 == 'Male'" (`column name` for names with spaces)
+    masks: dic, Masks of the run {(id(dataset), condition): mask}
+    """
+    key = (id(df), condition)
+    if masks is not None and key in masks:
+        return masks[key]
+    mask = df.eval(condition)
+    if not isinstance(mask, pd.Series) or mask.dtype != bool:
+        raise ValueError(f"The condition {condition} does not give True/False for each row")
+    mask = mask.to_numpy()
+    if masks is not None:
+        masks[key] = mask
+    return mask
 
 bodhi_blue = (0.0745, 0.220, 0.396)
 bodhi_grey = (0.247, 0.29, 0.322)
@@ -41,15 +127,33 @@ bodhi_complement = (0.604, 0.396, 0.071)
 
 class Data_analysis:
 
-    def __init__(self, name, indicators):
+    def __init__(self, name, indicators, cache=None, backend=None, workers=None, writer=None, index=None, charts='png'):
         """
         - Initialise the data analysis class
 
         name: str, Name of the project
         indicators: list, List of the project indicators
+        cache: ResultCache, Cache to reuse the tables and plots of unchanged indicators (bodhi_cache)
+        backend: SQLBackend, Database counting the tables instead of pandas (bodhi_sql)
+        workers: int, Number of threads computing the tables and tests of the indicators at once (one at a time by default)
+        writer: BackgroundWriter, Writer threads saving the sheets and plots (bodhi_writer), written in the run by default
+        index: BitmapIndex, Bitmap index of the dataset resolving the column value conditions of the indicators (bodhi_index)
+        charts: str, Format of the plots: 'png' (rendered with matplotlib), 'panels' (one figure of small multiples per table, see panel_bar)
+                or 'vega' (Vega-Lite JSON specs rendered on demand, bodhi_vega)
         """
         self.name = name
         self.indicators = indicators
+        self.cache = cache
+        self.backend = backend
+        self.workers = workers
+        self.writer = writer
+        self.index = index
+        self.charts = charts
+        self.dpi = 800
+        self.figure_style = dict(figure_style)
+        self.partial = bpa.PartialAggregate(name)
+        self.workbooks = {} # Sheets waiting to be written {workbook: [(output, sheet, title, write)]}, see save_workbooks
+        self.masks = {} # Masks of the string conditions of this run (see condition_mask)
 
     def count(self, df, var, index_name):
         """
@@ -58,7 +162,14 @@ class Data_analysis:
         var: list, Variables related to the indicator
         index_name: str, Index name for the new count dataframe
         """
-        count = df[var].value_counts()
+        return self.count_table(df[var].value_counts(), index_name)
+
+    def count_table(self, count, index_name):
+        """
+        - To generate a table showing the count and percentage from the counts of the indicator
+        count: series, Counts of each category
+        index_name: str, Index name for the new count dataframe
+        """
         count_df = pd.DataFrame({'Count': count})
         count_df['Percentage'] = round(count_df['Count'] / count_df['Count'].sum() * 100, 1)
         count_df.index.name = index_name
@@ -74,19 +185,50 @@ class Data_analysis:
         index_name: str, Name of the dataframe
         change: list, New indices
         """
-        table = pd.DataFrame(index=categories)
-        for col in columns:
-            table[col] = df[col].value_counts().reindex(categories, fill_value=0)
+        return self.multi_format(self.multi_counts(df, columns, categories), column_labels, change)
+
+    def multi_counts(self, df, columns, categories):
+        """
+        - To count the categories of each variable of a multi-table
+        - 0/1 options (multi-select questions) are counted from their bitmask (bodhi_bits), other answers are coded against
+          the categories at once and counted with one np.bincount
+        df: Dataframe, Dataframe of this project
+        columns: list, Variables related to the indicator
+        categories: list, Categories of the indices
+        """
+        index = pd.Index(categories) if categories is not None else None
+        if index is not None and index.is_unique and all(category in (0, 1) for category in categories) and len(columns) <= 64:
+            mask = bb.OptionMask.pack(df, columns)
+            if mask.binary:
+                return mask.option_counts(categories)
+        if index is None or not index.is_unique:
+            table = pd.DataFrame(index=categories)
+            for col in columns:
+                table[col] = df[col].value_counts().reindex(categories, fill_value=0)
+            return table
+        # Position of each answer in the categories (-1 for missing and other answers), one row per variable
+        codes = index.get_indexer(df[columns].to_numpy().ravel(order='F')).reshape(len(columns), -1)
+        valid = codes >= 0
+        offsets = np.arange(len(columns))[:, None] * len(index)
+        counts = np.bincount((codes + offsets)[valid], minlength=len(columns) * len(index))
+        return pd.DataFrame(counts.reshape(len(columns), len(index)).T, index=index, columns=columns)
+
+    def multi_format(self, table, column_labels, change = None):
+        """
+        - To add labels and percentages to the counts of a multi-table
+        table: Dataframe, Counts of the multi-table (multi_counts)
+        columns_labels: list, Labels of the columns
+        change: list, New indices
+        """
+        table = table.copy()
         if column_labels is not None:
             table.columns = column_labels
         if change is not None:
             table.index = change[:len(table)]
         column_sums = table.sum(axis=0)
         percentage_table = table.div(column_sums, axis=1) * 100
-
-        for i, idx in enumerate(table.index):
-            table.loc[f'{idx}(%)'] = percentage_table.loc[idx]
-        return table
+        percentage_table.index = pd.Index([f'{idx}(%)' for idx in table.index], name=table.index.name)
+        return pd.concat([table, percentage_table])
     
     def ols_table(self, df, indep_col, var):
         """
@@ -100,6 +242,7 @@ class Data_analysis:
         Returns:
         - pd.DataFrame: A DataFrame containing the OLS results
         """
+        sm = _sm()
         df_clean = df.dropna(subset= indep_col + var)
         X = df_clean[indep_col]
         Y = df_clean[var]
@@ -150,6 +293,7 @@ class Data_analysis:
         Returns:
         - pd.DataFrame: A DataFrame containing the ANOVA results (F-statistic and p-value) for each group
         """
+        stats = _stats()
         results = []
         for col, name in zip(indep_col,indep_name):
             groups = [df[var][df[col] == group] for group in df[col].unique()]
@@ -180,6 +324,7 @@ class Data_analysis:
         Returns:
         - pd.DataFrame: A DataFrame containing the T-test results (t-statistic and p-value) for each group
         """
+        stats = _stats()
         results = []
         for col, name in zip(indep_col,indep_name):
             groups = [df[var][df[col] == group] for group in df[col].unique()]
@@ -216,6 +361,7 @@ class Data_analysis:
         Returns:
         - pd.DataFrame: A DataFrame containing the chi-square statistic and p-value for each group
         """
+        stats = _stats()
         results = []
         for col, name in zip(indep_col, indep_name):
             contingency_table = pd.crosstab(df[col].values.ravel(), df[var].values.ravel())
@@ -272,162 +418,570 @@ class Data_analysis:
         return results_df
     
     def statistical_test(self, file_path, folder):
-        for indicator in self.indicators:
+        """
+        - To perform the statistical tests of the indicators and write their results
+        - The tests are computed by the indicator scheduler (self.workers threads), the sheets are written in the order of the indicators
+        file_path: str, Directory where statistical test results will be saved
+        folder: str, Folder where plots will be saved
+        """
+        indicators = [indicator for indicator in self.indicators if indicator.s_test is not None]
+        results = _ordered([functools.partial(self.test_result, indicator) for indicator in indicators], self.workers)
+        for indicator, (result, error) in zip(indicators, results):
             try:
-                if indicator.s_test is not None:
-                    sheet_name = indicator.indicator_name
-                    var_name = indicator.description
-                    df = indicator.df
-                    var = indicator.var
-                    indep_col = list(indicator.s_group.keys())
-                    indep_name = list(indicator.s_group.values())
-                    
-                    if indicator.s_test == 'chi':
-                        s_df = self.chi2_table(df, indep_col, indep_name, var)
-                    elif indicator.s_test == 't-test':
-                        s_df = self.t_test_table(df, indep_col, indep_name, var)
-                    elif indicator.s_test == 'anova':
-                        s_df = self.anova_table(df, indep_col, indep_name, var)
-                    elif indicator.s_test == 'stats':
-                        s_df = self.stats_table(df, indep_col, indep_name, var)
-                    elif indicator.s_test == 'ols':
-                        model_stats_df, coeff_df, diagnostics_df = self.ols_table(df, indep_col, var)
-                        
-                    with pd.ExcelWriter(file_path, engine='openpyxl', mode='a', if_sheet_exists='overlay') as writer:
-                        if indicator.s_test == 'ols':
-                            model_stats_df.to_excel(writer, sheet_name=sheet_name, index=True, header=True)
-                            startrow = model_stats_df.shape[0] + 2
-                            coeff_df.to_excel(writer, sheet_name=sheet_name, startrow=startrow, index=True, header=True)
-                            startrow = coeff_df.shape[0] + 2
-                            diagnostics_df.to_excel(writer, sheet_name=sheet_name, startrow=startrow, index=True, header=True)
-                        else: s_df.to_excel(writer, sheet_name=sheet_name, index=True, header=True)
-                        
-                    wb = load_workbook(file_path)
-                    ws = wb[sheet_name]
-                    ws.insert_rows(1)
-                    ws['B1'] = var_name
-                    ws['B1'].font = Font(bold=True)
-                    for column in ws.columns:
-                        max_length = 0
-                        column_letter = column[0].column_letter
-                        for cell in column:
-                            try:
-                                if cell.value:
-                                    max_length = max(max_length, len(str(cell.value)))
-                            except:
-                                pass
-                        adjusted_width = (max_length + 2)
-                        ws.column_dimensions[column_letter].width = adjusted_width
-            
-                    wb.save(file_path)
+                if error is not None:
+                    raise error
+                sheet_name = indicator.indicator_name
+                var_name = indicator.description
+                s_tables, statistics = result
+                if indicator.s_test != 'ols':
+                    self.partial.add_test(sheet_name, indicator, statistics)
+                self.output(f"indicator {indicator.name}", file_path, self.write_test, indicator, sheet_name, var_name, s_tables, file_path)
             except Exception as e:
                 print(f"Unexpected error statistically processing indicator {indicator.name}: {e}")
+
+    def write_test(self, indicator, sheet_name, title, s_tables, file_path):
+        """
+        - To add the result tables of a statistical test to the sheets of the workbook (written by save_workbooks)
+        sheet_name: str, Name of the sheet
+        title: str, Title of the tables
+        s_tables: tuple, Result tables of the test (test_result)
+        file_path: str, Directory where statistical test results will be saved
+        """
+        def write(writer):
+            if indicator.s_test == 'ols':
+                model_stats_df, coeff_df, diagnostics_df = s_tables
+                model_stats_df.to_excel(writer, sheet_name=sheet_name, index=True, header=True)
+                startrow = model_stats_df.shape[0] + 2
+                coeff_df.to_excel(writer, sheet_name=sheet_name, startrow=startrow, index=True, header=True)
+                startrow = coeff_df.shape[0] + 2
+                diagnostics_df.to_excel(writer, sheet_name=sheet_name, startrow=startrow, index=True, header=True)
+            else: s_tables[0].to_excel(writer, sheet_name=sheet_name, index=True, header=True)
+
+        self.workbooks.setdefault(file_path, []).append((f"indicator {indicator.name}", sheet_name, title, write))
+
+    def save_workbooks(self):
+        """
+        - To write the sheets of each workbook with one open and save of the workbook (after the background writer has finished)
+        - A sheet which cannot be written is reported, the other sheets are saved
+        """
+        workbooks, self.workbooks = self.workbooks, {}
+        for file_path, sheets in workbooks.items():
+            with pd.ExcelWriter(file_path, engine='openpyxl', mode='a', if_sheet_exists='overlay') as writer:
+                for name, sheet_name, title, write in sheets:
+                    try:
+                        write(writer)
+                        self.format_sheet(writer.book[sheet_name], title)
+                    except Exception as e:
+                        print(f"Unexpected error writing {name}: {e}")
+        return True
+
+    def output(self, name, lane, function, *args, **kwargs):
+        """
+        - To write an output (sheet, plot, cache entry) now, or queue it to the background writer when there is one (bodhi_writer)
+        - Outputs of the same lane are written in order, e.g. the sheets of one workbook
+        name: str, Description of the output for error messages
+        lane: str, Lane of the output (workbook or indicator)
+        function: function, Function writing the output
+        """
+        if self.writer is None:
+            return function(*args, **kwargs)
+        return self.writer.submit(name, function, *args, lane=lane, **kwargs)
+
+    def save_figure(self, fig, output_file):
+        """
+        - To save a finished plot (the figure is not kept by pyplot, so nothing has to be closed)
+        fig: Figure, Plot to save
+        output_file: str, Directory of the plot
+        """
+        fig.savefig(output_file, bbox_inches='tight', dpi=self.dpi)
+        return output_file
+
+    def render(self, indicator, output_file, draw, *args, **kwargs):
+        """
+        - To draw a plot with one of the draw functions on a new figure and save it
+        - With a background writer, the plot is drawn, rendered and saved by a writer thread, so the plots of
+          different indicators are drawn at once (the plots of an indicator are saved in order, before its cache entry)
+        indicator: indicator class, Indicator of the plot
+        output_file: str, Directory of the plot
+        draw: function, Draw function returning a plot area of the figure (e.g. draw_bar)
+        args, kwargs: Arguments of the draw function (the tables are not changed by the writer threads)
+        """
+        job = lambda: self.save_figure(draw(*args, **kwargs).figure, output_file)
+        if self.writer is None:
+            return job()
+        self.writer.submit(f"plot {output_file}", job, lane=indicator.indicator_name)
+        return output_file
+
+    def save_chart(self, spec, indicator, output_file):
+        """
+        - To save the chart spec of a plot instead of rendering it (charts='vega', bodhi_vega)
+        spec: dic, Chart spec
+        indicator: indicator class, Indicator of the plot (its plots are saved in order, before its cache entry)
+        output_file: str, Directory of the plot (.png is replaced by .vl.json)
+        """
+        output_file = output_file[:-len('.png')] + '.vl.json'
+        self.output(f"chart {output_file}", indicator.indicator_name, bv.save_chart, spec, output_file)
+        return output_file
+
+    def test_result(self, indicator):
+        """
+        - To perform the statistical test of an indicator without writing it (a task of the indicator scheduler)
+        - Returns (result tables, mergeable statistics or None for OLS)
+        indicator: indicator class, Indicator from indicator class (bodhi_indicator)
+        """
+        df = indicator.df
+        var = indicator.var
+        indep_col = list(indicator.s_group.keys())
+        indep_name = list(indicator.s_group.values())
+        
+        if indicator.s_test == 'chi':
+            s_tables = (self.chi2_table(df, indep_col, indep_name, var),)
+        elif indicator.s_test == 't-test':
+            s_tables = (self.t_test_table(df, indep_col, indep_name, var),)
+        elif indicator.s_test == 'anova':
+            s_tables = (self.anova_table(df, indep_col, indep_name, var),)
+        elif indicator.s_test == 'stats':
+            s_tables = (self.stats_table(df, indep_col, indep_name, var),)
+        elif indicator.s_test == 'ols':
+            return self.ols_table(df, indep_col, var), None
+        else:
+            raise ValueError(f"Unknown statistical test {indicator.s_test}")
+        return s_tables, self.test_statistics(df, indep_col, var, indicator.s_test)
+
+    def format_sheet(self, ws, title):
+        """
+        - To add the title above a table and fit the width of the columns
+        ws: Worksheet, Sheet of the table (openpyxl)
+        title: str, Title of the table (description of the indicator)
+        """
+        ws.insert_rows(1)
+        ws['B1'] = title
+        ws['B1'].font = Font(bold=True)
+        for column in ws.columns:
+            max_length = 0
+            column_letter = column[0].column_letter
+            for cell in column:
+                try:
+                    if cell.value:
+                        max_length = max(max_length, len(str(cell.value)))
+                except:
+                    pass
+            adjusted_width = (max_length + 2)
+            ws.column_dimensions[column_letter].width = adjusted_width
+
+    def test_statistics(self, df, indep_col, var, s_test):
+        """
+        - To calculate the mergeable statistics of a statistical test (sufficient statistics and crosstabs)
+        df: Dataframe, Dataframe of this project
+        indep_col: list, The variables to group by (categorical variables)
+        var: list, The variable to analyse
+        s_test: str, Type of statistical test
+        """
+        values = df[var]
+        if isinstance(values, pd.DataFrame):
+            values = values.iloc[:, 0]
+        statistics = {'overall': bpa.moments(values), 'groups': {}, 'crosstab': {}}
+        for col in indep_col:
+            groups = df[col].dropna()
+            statistics['groups'][col] = bpa.moments(values.loc[groups.index], groups)
+            if s_test == 'chi':
+                statistics['crosstab'][col] = pd.crosstab(df[col].values.ravel(), df[var].values.ravel())
+        return statistics
+
+    def merged_test_table(self, s_test, statistics, indep_col, indep_name):
+        """
+        - To perform a statistical test from mergeable statistics (see test_statistics)
+        - Medians and modes cannot be merged and are left empty
+        s_test: str, Type of statistical test ('chi', 't-test', 'anova', 'stats')
+        statistics: dic, Mergeable statistics of the test
+        indep_col: list, The variables to group by (categorical variables)
+        indep_name: list, Names of the variables to group by
+        """
+        stats = _stats()
+        results = []
+        overall = statistics['overall'].iloc[0]
+        for col, name in zip(indep_col, indep_name):
+            groups = statistics['groups'][col]
+            mean = groups['sum'] / groups['n']
+            variance = groups['sumsq'] / groups['n'] - mean ** 2
+            test = {}
+            if s_test == 'chi':
+                chi2_stat, p_value, dof, expected = stats.chi2_contingency(statistics['crosstab'][col])
+                test = {'Chi-Square Statistic': chi2_stat, 'p-value': p_value}
+            elif s_test == 'anova':
+                valid = groups[groups['n'] > 0]
+                grand_mean = valid['sum'].sum() / valid['n'].sum()
+                ssb = (valid['n'] * (valid['sum'] / valid['n'] - grand_mean) ** 2).sum()
+                ssw = (valid['sumsq'] - valid['sum'] ** 2 / valid['n']).sum()
+                dfb, dfw = len(valid) - 1, valid['n'].sum() - len(valid)
+                f_stat = (ssb / dfb) / (ssw / dfw)
+                test = {'F-statistic': f_stat, 'p-value': stats.f.sf(f_stat, dfb, dfw)}
+            elif s_test == 't-test':
+                if len(groups) < 2:
+                    raise ValueError("Insufficient valid groups for t-test.")
+                first, second = groups.iloc[0], groups.iloc[1]
+                std = [np.sqrt((g['sumsq'] - g['sum'] ** 2 / g['n']) / (g['n'] - 1)) for g in (first, second)]
+                t_stat, p_value = stats.ttest_ind_from_stats(first['sum'] / first['n'], std[0], first['n'],
+                                                             second['sum'] / second['n'], std[1], second['n'])
+                test = {'T-statistic': t_stat, 'p-value': p_value}
+            elif s_test == 'stats':
+                all_mean = overall['sum'] / overall['n']
+                test = {'Overall Mean': all_mean, 'Overall Std Dev': np.sqrt(overall['sumsq'] / overall['n'] - all_mean ** 2),
+                        'Overall Median': None, 'Overall min': overall['min'], 'Overall Max': overall['max'], 'Total': overall['sum']}
+            for group in groups.index:
+                row = {'Group': name, 'Category': group, 'Mean': mean[group], 'Std Dev': np.sqrt(variance[group]),
+                       'Variance': variance[group], 'Median': None, 'Mode': None}
+                row.update(test)
+                results.append(row)
+        return pd.DataFrame(results)
             
 
-    def tables(self, indicator, var, sheet_name, var_name, file_path, folder):
+    def render_settings(self, folder):
+        """
+        - To collect the settings which change the look of the plots (part of the cache key)
+        folder: str, Folder where plots will be saved
+        """
+        return {'folder': folder, 'dpi': self.dpi, 'charts': self.charts, 'style': self.figure_style, 'source': _source_digest()}
+
+    def definition(self, indicator, var, sheet_name, var_name):
+        """
+        - To collect the definition of the indicator which changes its tables (part of the cache key)
+        indicator: indicator class, Indicator from indicator class (bodhi_indicator)
+        var: list, Variables of the table
+        sheet_name: str, Name of the sheet
+        var_name: str, Index name of the multi-table
+        """
+        return {'indicator': indicator.indicator_name, 'description': indicator.description, 'var': var, 'all_var': indicator.var,
+                'var_type': indicator.var_type, 'i_type': indicator.i_type,
+                'breakdown': list(indicator.breakdown.items()) if indicator.breakdown is not None else None,
+                'var_order': indicator.var_order, 'var_change': indicator.var_change, 'kap_label': indicator.kap_label,
+                'target': indicator.target, 'baseline': indicator.baseline, 'midline': indicator.midline,
+                'visual': indicator.visual, 'sheet_name': sheet_name, 'var_name': var_name}
+
+    def sheets(self, indicator):
+        """
+        - To list the tables of the indicator: (variables, sheet name, index name) of each table
+        indicator: indicator class, Indicator from indicator class (bodhi_indicator)
+        """
+        if indicator.var_type == 'single':
+            return [(indicator.var, f"{indicator.indicator_name}", f"{indicator.number}")]
+        elif indicator.var_type == 'multi':
+            return [(var, f"{indicator.indicator_name}-{i}", f"{indicator.number}-{i}") for i, var in enumerate(indicator.var)]
+        return []
+
+    def outputs(self, indicator, folder):
+        """
+        - To list the outputs a run would produce for the indicator, without counting anything (see bodhi_estimate)
+        - Returns (kind, sheet name, plot file or None, breakdown column or None) of each output, kind is 'table', 'plot' or 'test'
+        indicator: indicator class, Indicator from indicator class (bodhi_indicator)
+        folder: str, Folder where plots would be saved
+        """
+        if indicator.s_test is not None:
+            return [('test', indicator.indicator_name, None, None)]
+        outputs = []
+        for var, sheet_name, var_name in self.sheets(indicator):
+            outputs.append(('table', sheet_name, None, None))
+            if indicator.var_type != 'single':
+                continue
+            extension = '.vl.json' if self.charts == 'vega' else '.png'
+            if self.charts == 'panels':
+                if indicator.visual == True:
+                    outputs.append(('plot', sheet_name, f'{folder}_{indicator.indicator_name}_panels.png', None))
+                continue
+            if indicator.visual == True:
+                outputs.append(('plot', sheet_name, f'{folder}_{indicator.indicator_name}{extension}', None))
+            if indicator.visual is True and indicator.breakdown is not None:
+                for col, breakdown in indicator.breakdown.items():
+                    outputs.append(('plot', sheet_name, f'{folder}_{indicator.indicator_name}_{breakdown}_count{extension}', col))
+                    outputs.append(('plot', sheet_name, f'{folder}_{indicator.indicator_name}_{breakdown}_percent{extension}', col))
+        return outputs
+
+    def table_job(self, indicator, var, sheet_name, var_name, folder):
+        """
+        - To count a table of the indicator or load it from the result cache, without writing or plotting (a task of the indicator scheduler)
+        - Returns (cache key, cached tables or None, counts or None)
+        var: list, Variables of the table
+        sheet_name: str, Name of the sheet
+        var_name: str, Index name of the multi-table
+        folder: str, Folder where plots will be saved
+        """
+        key = frames = counts = None
+        if self.cache is not None:
+            key = self.cache.key(indicator.df, indicator.columns(), self.definition(indicator, var, sheet_name, var_name), self.render_settings(folder))
+            frames = self.cache.load(key)
+        if frames is None:
+            counts = self.table_counts(indicator, var)
+        return key, frames, counts
+
+    def table_jobs(self, indicator, folder):
+        """
+        - To count all the tables of the indicator or load them from the result cache (a task of the indicator scheduler)
+        - The tables of a multi-table which are not in the cache are counted together (block_counts)
+        - Returns the result of table_job for each table (see sheets)
+        folder: str, Folder where plots will be saved
+        """
+        sheets = self.sheets(indicator)
+        if indicator.var_type != 'multi' or self.backend is not None:
+            return [self.table_job(indicator, var, sheet_name, var_name, folder) for var, sheet_name, var_name in sheets]
+        jobs = []
+        for var, sheet_name, var_name in sheets:
+            key = frames = None
+            if self.cache is not None:
+                key = self.cache.key(indicator.df, indicator.columns(), self.definition(indicator, var, sheet_name, var_name), self.render_settings(folder))
+                frames = self.cache.load(key)
+            jobs.append((key, frames))
+        counts = self.block_counts(indicator, [var for (var, _, _), (key, frames) in zip(sheets, jobs) if frames is None])
+        return [(key, frames, counts.get(var) if frames is None else None) for (var, _, _), (key, frames) in zip(sheets, jobs)]
+
+    def tables(self, indicator, var, sheet_name, var_name, file_path, folder, job=None):
         """
         - To generate tables including both general and breakdown data and related plots
+        - Tables and plots are reused from the result cache when the indicator has not changed
         file_path: str, Directory where tables files will be saved
         folder: str, Folder where plots will be saved
+        job: tuple, Counts of the table from table_job (counted here by default)
         """        
-        df = indicator.df.copy(deep=True)
         if indicator.s_test is None:
+            key, frames, counts = job if job is not None else self.table_job(indicator, var, sheet_name, var_name, folder)
+            if frames is None:
+                images = []
+                frames = self.format_tables(indicator, counts, var_name, folder, images) + (counts,)
+                if self.cache is not None:
+                    # Queued after the plots of the indicator (same lane), which the entry copies
+                    self.output(f"cache entry of indicator {indicator.name}", indicator.indicator_name, self.cache.store, key, frames, images)
+            final_df, overall_df, counts = frames
+            self.partial.add_table(sheet_name, indicator, var_name, counts)
+            self.output(f"indicator {indicator.name}", file_path, self.write_tables, indicator, sheet_name, final_df, overall_df, file_path)
+
+    def write_tables(self, indicator, sheet_name, final_df, overall_df, file_path):
+        """
+        - To add the breakdown and general tables of the indicator to the sheets of the workbook (written by save_workbooks)
+        final_df: Dataframe, Breakdown table (None without breakdown)
+        overall_df: Dataframe, General table
+        file_path: str, Directory where tables files will be saved
+        """
+        def write(writer):
             if indicator.breakdown != None:
-                dis_cols = list(indicator.breakdown.keys())
-            else: dis_cols = None
-            dfs = {}
-            book = load_workbook(file_path)
-                
+                final_df.to_excel(writer, sheet_name=sheet_name, merge_cells=False, index=True, header=True)
+                startrow = final_df.shape[0] + 2
+                overall_df.to_excel(writer, sheet_name=sheet_name, startrow=startrow, index=True, header=True)
+            else: overall_df.to_excel(writer, sheet_name=sheet_name, index=True, header=True)
+
+        self.workbooks.setdefault(file_path, []).append((f"indicator {indicator.name}", sheet_name, indicator.description, write))
+
+    def table_counts(self, indicator, var):
+        """
+        - To count the categories of the indicator, overall and by each breakdown column
+        - The breakdown tables (one column or a tuple of columns) are sums over the count cube of the indicator (bodhi_cube)
+        - With a SQL backend, the overall counts and the cube are calculated by the database (bodhi_sql)
+        - Returns {'overall': counts, 'breakdown': {col: counts by category and group} or None, 'cube': count cube or None}
+        - Counts are additive, so the counts of several datasets can be merged (bodhi_partials)
+        var: list, Variables of the table
+        """
+        if indicator.breakdown != None:
+            dis_cols = list(indicator.breakdown.keys())
+            dims = bcu.breakdown_columns(indicator.breakdown)
+        else:
+            dis_cols = None
+            dims = []
+        all_var = [indicator.var] if isinstance(indicator.var, str) else list(indicator.var)
+        df = indicator.df[list(dict.fromkeys(all_var + dims))].copy()
+            
+        try:
+            if indicator.var_order is not None:
+                for var_ in var:
+                    df[var_] = df[var_].astype('category')
+                    df[var_] = df[var_].cat.set_categories(indicator.var_order, ordered=True)
+        except (KeyError, ValueError) as e:
+            print("")
+            
+        breakdown = None
+        cube = None
+        if self.backend is not None:
             try:
-                if indicator.var_order is not None:
-                    for var_ in var:
-                        df[var_] = df[var_].astype('category')
-                        df[var_] = df[var_].cat.set_categories(indicator.var_order, ordered=True)
-            except (KeyError, ValueError) as e:
-                print("")
-                
+                multi_var = indicator.var if indicator.var_type == 'multi' else None
+                overall, cube = self.backend.counts(df, var, dims, multi_var, indicator.var_order)
+            except Exception as e:
+                print(f"[SKIPPED] SQL backend failed for indicator '{indicator.name}', counting with pandas: {e}")
+        if cube is None:
             if indicator.var_type == 'single':
-                overall_df = self.count(df, var, index_name=indicator.indicator_name)
-                if indicator.visual == True:
-                    self.plot_bar(indicator, overall_df, folder) 
-                        
+                overall = df[var].value_counts()
             elif indicator.var_type == 'multi':
-                if indicator.var_change != None:
-                    change = list(indicator.var_change.values())
-                    overall_df = self.multi_table(df, indicator.var, 
-                                  categories = indicator.var_order, column_labels = indicator.kap_label, index_name = var_name, change=change)
-                else:
-                    overall_df = self.multi_table(df, indicator.var, 
-                        categories = indicator.var_order, column_labels = indicator.kap_label, index_name = var_name)
-                    
-            if dis_cols is not None:
+                overall = self.multi_counts(df, indicator.var, indicator.var_order)
+    
+            try:
+                cube = bcu.CountCube.build(df, var, dims)
+            except Exception as e:
+                print(f"[SKIPPED] Count cube could not be built for indicator '{indicator.name}': {e}")
+        if dis_cols is not None:
+            breakdown = self.breakdown_tables(indicator, cube)
+        return {'overall': overall, 'breakdown': breakdown, 'cube': cube}
+
+    def block_counts(self, indicator, variables):
+        """
+        - To count several tables of a multi-table at once (multi-select questions, e.g. c4_1..c4_7)
+        - The overall multi-table is counted once and the breakdowns of all variables come from one block of count cubes (bodhi_cube)
+        - Returns {variable: counts} (see table_counts)
+        variables: list, Variables of the tables
+        """
+        dims = bcu.breakdown_columns(indicator.breakdown) if indicator.breakdown != None else []
+        try:
+            cubes = bcu.CountCube.build_block(indicator.df, variables, dims)
+        except Exception as e:
+            print(f"[SKIPPED] Count block could not be built for indicator '{indicator.name}', counting each variable: {e}")
+            return {var: self.table_counts(indicator, var) for var in variables}
+        overall = self.multi_counts(indicator.df, indicator.var, indicator.var_order)
+        return {var: {'overall': overall, 'breakdown': self.breakdown_tables(indicator, cube) if indicator.breakdown != None else None, 'cube': cube}
+                for var, cube in zip(variables, cubes)}
+
+    def breakdown_tables(self, indicator, cube):
+        """
+        - To get the breakdown tables of the indicator from its count cube
+        - Returns {col: counts by category and group}
+        cube: CountCube, Count cube of the table (bodhi_cube)
+        """
+        breakdown = {}
+        try:
+            for col in indicator.breakdown.keys():
                 try:
-                    melted = df.melt(id_vars=dis_cols, value_vars=var, var_name=' ', value_name='category_value')
-            
-                    for col in dis_cols:
-                        try:
-                            count_df = melted.groupby(['category_value', col]).size().unstack(fill_value=0)
-            
-                            if indicator.visual is True and indicator.var_type != 'multi':
-                                self.breakdown_count_bar(indicator, count_df, col, folder)
-            
-                            percent_df = round(count_df.div(count_df.sum(axis=0), axis=1) * 100, 1)
-            
-                            if indicator.visual is True and indicator.var_type != 'multi':
-                                self.breakdown_percentage_bar(indicator, percent_df, col, folder)
-            
-                            f_df = pd.concat([count_df, percent_df.add_suffix('(%)')], axis=1)
-            
-                            # Safely access indicator.breakdown
-                            breakdown = indicator.breakdown.get(col, col)  # fallback to col name if missing
-                            dfs[f'{breakdown}'] = f_df.transpose()
-            
-                        except KeyError as ke:
-                            print(f"[SKIPPED] Missing key during processing column '{col}' for indicator '{indicator.name}': {ke}")
-                        except Exception as e:
-                            print(f"[SKIPPED] Unexpected error in column '{col}' for indicator '{indicator.name}': {e}")
-            
-                    final_df = pd.concat(dfs, axis=0)
-            
-                    if indicator.var_change is not None:
-                        # Only rename columns that exist
-                        rename_dict = {k: v for k, v in indicator.var_change.items() if k in final_df.columns}
-                        final_df.rename(columns=rename_dict, inplace=True)
-            
+                    breakdown[col] = cube.table(col)
+                except KeyError as ke:
+                    print(f"[SKIPPED] Missing key during processing column '{col}' for indicator '{indicator.name}': {ke}")
                 except Exception as e:
-                    print(f"[FATAL] Failed to process indicator '{indicator.name}': {e}")
-                
-            with pd.ExcelWriter(file_path, engine='openpyxl', mode='a', if_sheet_exists='overlay') as writer:
-                if dis_cols != None:
-                    final_df.to_excel(writer, sheet_name=sheet_name, merge_cells=False, index=True, header=True)
-                    startrow = final_df.shape[0] + 2
-                    overall_df.to_excel(writer, sheet_name=sheet_name, startrow=startrow, index=True, header=True)
-                else: overall_df.to_excel(writer, sheet_name=sheet_name, index=True, header=True)
+                    print(f"[SKIPPED] Unexpected error in column '{col}' for indicator '{indicator.name}': {e}")
+        except Exception as e:
+            print(f"[FATAL] Failed to process indicator '{indicator.name}': {e}")
+        return breakdown
+
+    def format_tables(self, indicator, counts, var_name, folder, images):
+        """
+        - To generate the general and breakdown tables from the counts of the indicator and render the related plots
+        - Returns (breakdown table or None, general table)
+        counts: dic, Counts of the indicator (table_counts)
+        var_name: str, Index name of the multi-table
+        folder: str, Folder where plots will be saved
+        images: list, Files of the rendered plots are appended to this list (None for a table or plot which failed)
+        """
+        final_df = None
+        dfs = {}
+        if indicator.var_type == 'single':
+            overall_df = self.count_table(counts['overall'], index_name=indicator.indicator_name)
+            if indicator.visual == True and self.charts != 'panels':
+                images.append(self.plot_bar(indicator, overall_df, folder))
                     
-            wb = load_workbook(file_path)
-            ws = wb[sheet_name]
-            ws.insert_rows(1)
-            ws['B1'] = indicator.description
-            ws['B1'].font = Font(bold=True)
-            for column in ws.columns:
-                max_length = 0
-                column_letter = column[0].column_letter
-                for cell in column:
+        elif indicator.var_type == 'multi':
+            change = list(indicator.var_change.values()) if indicator.var_change != None else None
+            overall_df = self.multi_format(counts['overall'], column_labels = indicator.kap_label, change=change)
+            overall_df.index.name = None
+                
+        panels = {}
+        if counts['breakdown'] is not None:
+            try:
+                for col, count_df in counts['breakdown'].items():
                     try:
-                        if cell.value:
-                            max_length = max(max_length, len(str(cell.value)))
-                    except:
-                        pass
-                adjusted_width = (max_length + 2)
-                ws.column_dimensions[column_letter].width = adjusted_width
+                        if indicator.visual is True and indicator.var_type != 'multi':
+                            if self.charts == 'panels':
+                                self.label_index(indicator, count_df)
+                            else:
+                                images.append(self.breakdown_count_bar(indicator, count_df, col, folder))
+        
+                        percent_df = round(count_df.div(count_df.sum(axis=0), axis=1) * 100, 1)
+        
+                        if indicator.visual is True and indicator.var_type != 'multi':
+                            if self.charts == 'panels':
+                                panels[col] = (count_df, percent_df)
+                            else:
+                                images.append(self.breakdown_percentage_bar(indicator, percent_df, col, folder))
+        
+                        f_df = pd.concat([count_df, percent_df.add_suffix('(%)')], axis=1)
+        
+                        # Safely access indicator.breakdown
+                        breakdown = indicator.breakdown.get(col, col)  # fallback to col name if missing
+                        dfs[f'{breakdown}'] = f_df.transpose()
         
-            wb.save(file_path)
+                    except KeyError as ke:
+                        images.append(None)
+                        print(f"[SKIPPED] Missing key during processing column '{col}' for indicator '{indicator.name}': {ke}")
+                    except Exception as e:
+                        images.append(None)
+                        print(f"[SKIPPED] Unexpected error in column '{col}' for indicator '{indicator.name}': {e}")
+        
+                final_df = pd.concat(dfs, axis=0)
+        
+                if indicator.var_change is not None:
+                    # Only rename columns that exist
+                    rename_dict = {k: v for k, v in indicator.var_change.items() if k in final_df.columns}
+                    final_df.rename(columns=rename_dict, inplace=True)
+        
+            except Exception as e:
+                images.append(None)
+                print(f"[FATAL] Failed to process indicator '{indicator.name}': {e}")
+
+        if self.charts == 'panels' and indicator.visual == True and indicator.var_type == 'single':
+            try:
+                images.append(self.panel_bar(indicator, overall_df, panels, folder))
+            except Exception as e:
+                images.append(None)
+                print(f"[SKIPPED] Unexpected error in the panels of indicator '{indicator.name}': {e}")
+        return final_df, overall_df
+
+    def partial_counts(self):
+        """
+        - To record the counts and test statistics of all indicators in self.partial, without writing tables or plots
+        - Used by the workers of a shared dataset (bodhi_shared), the reports are then written from the partials (partial_report)
+        """
+        for indicator in self.indicators:
+            try:
+                if indicator.s_test is not None:
+                    if indicator.s_test != 'ols':
+                        statistics = self.test_statistics(indicator.df, list(indicator.s_group.keys()), indicator.var, indicator.s_test)
+                        self.partial.add_test(indicator.indicator_name, indicator, statistics)
+                elif indicator.var_type == 'multi' and self.backend is None:
+                    counts = self.block_counts(indicator, list(indicator.var))
+                    for var, sheet_name, var_name in self.sheets(indicator):
+                        self.partial.add_table(sheet_name, indicator, var_name, counts[var])
+                else:
+                    for var, sheet_name, var_name in self.sheets(indicator):
+                        self.partial.add_table(sheet_name, indicator, var_name, self.table_counts(indicator, var))
+            except Exception as e:
+                print(f"Unexpected error processing indicator {indicator.name}: {e}")
+        return True
+
+    def partial_report(self, partial, file_path1, file_path2, folder):
+        """
+        - To generate the tables, plots and statistical tests from merged partial aggregates (bodhi_partials)
+        - No dataset is needed: the counts and sufficient statistics of the runs are summed instead
+        partial: PartialAggregate, Merged partial aggregate
+        file_path1: str, Directory where tables files will be saved
+        file_path2: str, Directory where statistical test results will be saved
+        folder: str, Folder where plots will be saved
+        """
+        for sheet_name, test in partial.tests.items():
+            indicator = test['indicator']
+            try:
+                s_df = self.merged_test_table(indicator.s_test, test['statistics'], list(indicator.s_group.keys()), list(indicator.s_group.values()))
+                self.output(f"indicator {indicator.name}", file_path2, self.write_test, indicator, sheet_name, indicator.description, (s_df,), file_path2)
+            except Exception as e:
+                print(f"Unexpected error statistically processing indicator {indicator.name}: {e}")
+
+        for sheet_name, table in partial.tables.items():
+            indicator = table['indicator']
+            try:
+                counts = dict(table['counts'])
+                if indicator.var_type == 'single':
+                    counts['overall'] = counts['overall'].sort_values(ascending=False, kind='stable')
+                final_df, overall_df = self.format_tables(indicator, counts, table['var_name'], folder, [])
+                self.partial.add_table(sheet_name, indicator, table['var_name'], table['counts'])
+                self.output(f"indicator {indicator.name}", file_path1, self.write_tables, indicator, sheet_name, final_df, overall_df, file_path1)
+            except Exception as e:
+                print(f"Unexpected error processing indicator {indicator.name}: {e}")
 
     def calculation(self, indicator, method):
         """
         - To create a new column based on the calculation conditions of the indicators 
           to serve as the basis for data visualization and analysis
-        - Perform the calculations using the score_map from the Indicator class
+        - Perform the calculations using the score_map from the Indicator class (each different answer is scored once and
+          the labels are normalised, e.g. '4 - A Lot' and '4 - A lot' have the same score, see bodhi_codebook)
         indicator: indicator class, Indicator from indicator class (bodhi_indicator)
         method: str, How to calculate this indicator?
                 0. None: Descriptive Statistics
@@ -447,9 +1001,10 @@ class Data_analysis:
 
         if method == "score":
             if indicator.score_map != None:
-                df['score'] = df[indicator.var].map(indicator.score_map)
-                df[variable] = df['score'].apply(lambda x: 'Pass' if x >= indicator.valid_point else 'Not Pass')
-                df.drop(columns=['score'], inplace = True)
+                values = df[indicator.var[0]] if isinstance(indicator.var, list) else df[indicator.var]
+                # Answers out of the score map do not pass (missing score)
+                score = bcb.map_scores(values, indicator.score_map, default=np.nan)
+                df[variable] = np.where(score >= indicator.valid_point, 'Pass', 'Not Pass')
             else: df[variable] = df[indicator.var].apply(lambda x: 'Pass' if x >= indicator.valid_point else 'Not Pass')
 
         elif method == "divide":
@@ -488,51 +1043,32 @@ class Data_analysis:
             
         elif method == "score_average":
             if indicator.score_map != None:
-                def scoring(row):
-                    score = 0
-                    columns = indicator.var
-                    for col in columns:
-                        value = row[col]
-                        score += indicator.score_map.get(value, 0)
-                    return score / len(columns)
-                df['score'] = df.apply(scoring, axis=1)
-                df[variable] = df['score'].apply(lambda x: 'Pass' if x >= indicator.valid_point else 'Not Pass')
-                df.drop(columns=['score'], inplace = True)
+                score = sum(bcb.map_scores(df[col], indicator.score_map) for col in indicator.var) / len(indicator.var)
+                df[variable] = np.where(score >= indicator.valid_point, 'Pass', 'Not Pass')
             else: print("Please assign the score map for calculation")
 
         elif method == "score_sum":
             if indicator.score_map != None:
-                def scoring(row):
-                    score = 0
-                    columns = indicator.var
-                    for col in columns:
-                        score += indicator.score_map.get(row[col], 0)
-                    return score
-                df['score'] = df.apply(scoring, axis=1)
-                df[variable] = df['score'].apply(lambda x: 'Pass' if x >= indicator.valid_point else 'Not Pass')
-                df.drop(columns=['score'], inplace = True)
+                score = sum(bcb.map_scores(df[col], indicator.score_map) for col in indicator.var)
+                df[variable] = np.where(score >= indicator.valid_point, 'Pass', 'Not Pass')
             else: print("Please assign the score map for calculation")
 
             
         elif method == "score_select_allyes":
-            df['response'] = df.apply(lambda row: all(row[var] == 'Yes' for var in indicator.var), axis=1)
-            df[variable] = df['response'].apply(lambda x: 'Pass' if x else 'Not Pass')
-            df.drop(columns=['response'], inplace = True)
+            response = bb.OptionMask.pack(df, indicator.var, 'Yes').all()
+            df[variable] = np.where(response, 'Pass', 'Not Pass')
 
         elif method == "score_select_allno":
-            df['response'] = df.apply(lambda row: all(row[var] == 'No' for var in indicator.var), axis=1)
-            df[variable] = df['response'].apply(lambda x: 'Pass' if x else 'Not Pass')
-            df.drop(columns=['response'], inplace = True)
+            response = bb.OptionMask.pack(df, indicator.var, 'No').all()
+            df[variable] = np.where(response, 'Pass', 'Not Pass')
 
-        elif method == "score_select_anyyes":
-            df['response'] = df.apply(lambda row: any(row[var] == 'Yes' for var in indicator.var), axis=1)
-            df[variable] = df['response'].apply(lambda x: 'Pass' if x else 'Not Pass')
-            df.drop(columns=['response'], inplace = True)
+        elif method == "score_select_anyyes":
+            response = bb.OptionMask.pack(df, indicator.var, 'Yes').any()
+            df[variable] = np.where(response, 'Pass', 'Not Pass')
 
         elif method == "score_select_anyno":
-            df['response'] = df.apply(lambda row: any(row[var] == 'No' for var in indicator.var), axis=1)
-            df[variable] = df['response'].apply(lambda x: 'Pass' if x else 'Not Pass')
-            df.drop(columns=['response'], inplace = True)
+            response = bb.OptionMask.pack(df, indicator.var, 'No').any()
+            df[variable] = np.where(response, 'Pass', 'Not Pass')
 
         elif method == "score_select_manual":
             def scoring(row):
@@ -557,22 +1093,69 @@ class Data_analysis:
         if indicator.var_change is not None:
             df[variable] = df[variable].replace(indicator.var_change)
             
+    def condition_mask(self, indicator):
+        """
+        - To get the rows of the dataset meeting the condition of the indicator as a boolean array (one entry per row)
+        - Column values {'col': values} are resolved with the bitmap index of the dataset when there is one
+        - String conditions are evaluated on the dataset being analysed, once per dataset and run (see _condition_mask)
+        - Returns None when there is no condition, or when the condition cannot be resolved into rows (e.g. a series
+          with another index), which is then applied to the dataframe of the indicator
+        indicator: indicator class, Indicator from indicator class (bodhi_indicator)
+        """
+        condition = indicator.condition
+        if isinstance(condition, str):
+            return _condition_mask(indicator.df, condition, self.masks)
+        if isinstance(condition, dict):
+            if self.index is not None and self.index.df is indicator.df:
+                return self.index.mask(condition)
+            mask = np.ones(len(indicator.df), dtype=bool)
+            for col, values in condition.items():
+                values = list(values) if isinstance(values, (list, tuple, set)) else [values]
+                mask &= indicator.df[col].isin(values).to_numpy()
+            return mask
+        if isinstance(condition, pd.Series) and condition.dtype == bool and condition.index.equals(indicator.df.index):
+            return condition.to_numpy()
+        return None
+
     def indicator_analysis(self):
         """
         - To run the calculation function for all indicators
         """         
+        self.masks = {}
         for indicator in self.indicators:
-            if indicator.condition is None:
+            rows = indicator.rows
+            condition = indicator.condition
+            mask = self.condition_mask(indicator)
+            if mask is not None:
+                # The condition is turned into row positions, so the dataset is only copied once
+                rows = np.flatnonzero(mask) if rows is None else np.asarray(rows)[mask[rows]]
+                condition = None
+            if rows is None:
                 df_copy = indicator.df
             else:
-                df_copy = indicator.df
-                df_copy = df_copy[indicator.condition]
+                # Only the rows and columns of this indicator are taken from the shared dataset
+                columns = indicator.df.columns.get_indexer(indicator.columns())
+                df_copy = indicator.df.iloc[rows, columns[columns >= 0]]
+            if condition is not None:
+                df_copy = df_copy[condition]
             
             indicator.df = df_copy
             if indicator.i_cal != None:
                 self.calculation(indicator, indicator.i_cal)
+        self.masks = {}
         return print("All indicators have been calculated")
         
+    def label_index(self, indicator, df):
+        """
+        - To label the categories of a table the way the plots show them (tuples of values are joined)
+        - Done in place like the plots, so the sheets do not depend on the format of the plots
+        indicator: indicator class, Indicator from indicator class (bodhi_indicator)
+        df: Dataframe, Table of the plot
+        """
+        if indicator.var_order == None:
+            df.index = df.index.map(lambda x: x if isinstance(x, str) else ''.join(x))
+        return df
+
     def breakdown_count_bar(self, indicator, df, colname, file_path, figsize=(12, 8), rotation=0, fontsize=12):
         """
         - To generate bar plots through the breakdown data (Count only)
@@ -584,13 +1167,33 @@ class Data_analysis:
         rotation: int, Rotation angle for the x-axis ticks
         fontsize: int, Font size for plots
         """         
+        output_file = f'{file_path}_{indicator.indicator_name}_{indicator.breakdown[colname]}_count.png'
+        self.label_index(indicator, df)
+        if self.charts == 'vega':
+            return self.save_chart(bv.breakdown_chart(indicator, df, colname), indicator, output_file)
+        return self.render(indicator, output_file, self.draw_breakdown_count, indicator, df.copy(), colname,
+                           figsize=figsize, rotation=rotation, fontsize=fontsize)
+
+    def draw_breakdown_count(self, indicator, df, colname, ax=None, figsize=None, rotation=0, fontsize=12):
+        """
+        - To draw the bar plot of the breakdown data (Count only) on a plot area
+        indicator: indicator class, Indicator from indicator class (bodhi_indicator)
+        df: Dataframe, Disaggregated dataframe
+        colname: str, Reference column for the breakdown
+        ax: Axes, Plot area (a new figure of figsize by default)
+        figsize: tuple, Size of the new figure
+        rotation: int, Rotation angle for the x-axis ticks
+        fontsize: int, Font size for plots
+        """
+        from matplotlib.ticker import MaxNLocator
         breakdown = indicator.breakdown[colname]
         palette = [bodhi_complement, bodhi_blue, bodhi_tertiary, bodhi_primary_1, bodhi_grey, bodhi_secondary]
         if indicator.var_order != None:
             df = df.loc[indicator.var_order]
-        ax = df.plot(kind='bar', stacked=False, width=0.6, figsize=figsize, color=palette)
+        if ax is None:
+            ax = _figure(figsize, self.figure_style).add_subplot()
+        ax = df.plot(kind='bar', stacked=False, width=0.6, color=palette, ax=ax)
         title = f'{indicator.description}\nby {breakdown}'
-        output_file = f'{file_path}_{indicator.indicator_name}_{breakdown}_count.png'
         
         ax.set_ylabel('Count')
         ax.set_title(title)
@@ -628,19 +1231,18 @@ class Data_analysis:
                     text = text[:spaces[0]] + '\n' + text[spaces[0]+1:]
             return text
         
-        plt.title(title, fontsize=fontsize + 4)
-        plt.xlabel(" ", fontsize=fontsize)
-        plt.ylabel("Count", fontsize = fontsize)
+        ax.set_title(title, fontsize=fontsize + 4)
+        ax.set_xlabel(" ", fontsize=fontsize)
+        ax.set_ylabel("Count", fontsize = fontsize)
         df.index = df.index.map(lambda x: x if isinstance(x, str) else ''.join(x))
         labels = [''.join(label) if isinstance(label, tuple) else label for label in df.index]
         labels = [replace_spaces(label) for label in labels]
         ax.set_xticklabels(labels, rotation=rotation, fontsize=fontsize)
-        plt.legend(title=f'{breakdown} and Target', fontsize=fontsize-1)
+        ax.legend(title=f'{breakdown} and Target', fontsize=fontsize-1)
         max_height = df.max().max()
-        plt.ylim(0, max_height * 1.1)
+        ax.set_ylim(0, max_height * 1.1)
         ax.yaxis.set_major_locator(MaxNLocator(integer=True))
-        plt.savefig(output_file, bbox_inches='tight', dpi=800)
-        plt.close()
+        return ax
 
     def breakdown_percentage_bar(self, indicator, df, colname, file_path, figsize=(12, 8), rotation=0, fontsize=12):
         """
@@ -653,13 +1255,32 @@ class Data_analysis:
         rotation: int, Rotation angle for the x-axis ticks
         fontsize: int, Font size for plots
         """      
+        output_file = f'{file_path}_{indicator.indicator_name}_{indicator.breakdown[colname]}_percent.png'
+        self.label_index(indicator, df)
+        if self.charts == 'vega':
+            return self.save_chart(bv.breakdown_chart(indicator, df, colname, percent=True), indicator, output_file)
+        return self.render(indicator, output_file, self.draw_breakdown_percentage, indicator, df.copy(), colname,
+                           figsize=figsize, rotation=rotation, fontsize=fontsize)
+
+    def draw_breakdown_percentage(self, indicator, df, colname, ax=None, figsize=None, rotation=0, fontsize=12):
+        """
+        - To draw the bar plot of the breakdown data (Percentage only) on a plot area
+        indicator: indicator class, Indicator from indicator class (bodhi_indicator)
+        df: Dataframe, Disaggregated dataframe
+        colname: str, Reference column for the breakdown
+        ax: Axes, Plot area (a new figure of figsize by default)
+        figsize: tuple, Size of the new figure
+        rotation: int, Rotation angle for the x-axis ticks
+        fontsize: int, Font size for plots
+        """
         breakdown = indicator.breakdown[colname]
         palette = [bodhi_complement, bodhi_blue, bodhi_tertiary, bodhi_primary_1, bodhi_grey, bodhi_secondary]
         if indicator.var_order != None:
             df = df.loc[indicator.var_order]
-        ax = df.plot(kind='bar', stacked=False, width=0.6, figsize=figsize, color=palette)
+        if ax is None:
+            ax = _figure(figsize, self.figure_style).add_subplot()
+        ax = df.plot(kind='bar', stacked=False, width=0.6, color=palette, ax=ax)
         title = f'{indicator.description}\nby {breakdown}'
-        output_file = f'{file_path}_{indicator.indicator_name}_{breakdown}_percent.png'
         
         ax.set_ylabel('Percentage')
         ax.set_title(title)
@@ -686,19 +1307,19 @@ class Data_analysis:
                     text = text[:spaces[0]] + '\n' + text[spaces[0]+1:]
             return text
     
-        plt.title(title, fontsize=fontsize + 4)
-        plt.xlabel(" ", fontsize=fontsize)
-        plt.ylabel("Percentage", fontsize = fontsize)
-        plt.ylim(0, 105)
-        plt.yticks([0, 20, 40, 60, 80, 100])
+        ax.set_title(title, fontsize=fontsize + 4)
+        ax.set_xlabel(" ", fontsize=fontsize)
+        ax.set_ylabel("Percentage", fontsize = fontsize)
+        ax.set_ylim(0, 105)
+        ax.set_yticks([0, 20, 40, 60, 80, 100])
         df.index = df.index.map(lambda x: x if isinstance(x, str) else ''.join(x))
         labels = [''.join(label) if isinstance(label, tuple) else label for label in df.index]
         labels = [replace_spaces(label) for label in labels]
         ax.set_xticklabels(labels, rotation=rotation, fontsize=fontsize)
-        plt.xticks(rotation=rotation, fontsize=fontsize)
-        plt.legend(title=f'{breakdown} and Target', fontsize=fontsize-1)
-        plt.savefig(output_file, bbox_inches='tight', dpi=800)
-        plt.close()
+        for label in ax.get_xticklabels():
+            label.set(rotation=rotation, fontsize=fontsize)
+        ax.legend(title=f'{breakdown} and Target', fontsize=fontsize-1)
+        return ax
 
     def plot_bar(self, indicator, df_, file_path, figsize=(12, 8), rotation=0, fontsize=12):
         """
@@ -710,16 +1331,37 @@ class Data_analysis:
         rotation: int, Rotation angle for the x-axis ticks
         fontsize: int, Font size for plots
         """      
-        title = indicator.description
         output_file = f'{file_path}_{indicator.indicator_name}.png'
+        if indicator.var_order == None:
+            df_.dropna(subset=['Count', 'Percentage'], inplace=True)
+        self.label_index(indicator, df_)
+        if self.charts == 'vega':
+            return self.save_chart(bv.overall_chart(indicator, df_), indicator, output_file)
+        return self.render(indicator, output_file, self.draw_bar, indicator, df_.copy(),
+                           figsize=figsize, rotation=rotation, fontsize=fontsize)
+
+    def draw_bar(self, indicator, df_, ax=None, figsize=None, rotation=0, fontsize=12):
+        """
+        - To draw the bar plot of the overall information on a plot area
+        indicator: indicator class, Indicator from indicator class (bodhi_indicator)
+        df_: Dataframe, Dataframe
+        ax: Axes, Plot area (a new figure of figsize by default)
+        figsize: tuple, Size of the new figure
+        rotation: int, Rotation angle for the x-axis ticks
+        fontsize: int, Font size for plots
+        """
+        from matplotlib.ticker import MaxNLocator
+        from matplotlib.patches import Patch
+        title = indicator.description
         palette = [bodhi_complement, bodhi_blue, bodhi_tertiary, bodhi_primary_1, bodhi_grey, bodhi_secondary]
         if indicator.var_order != None:
             df_ = df_.loc[indicator.var_order]
         df_.dropna(subset=['Count', 'Percentage'], inplace=True)
-        fig, ax = plt.subplots(figsize=figsize)
+        if ax is None:
+            ax = _figure(figsize, self.figure_style).add_subplot()
         if indicator.i_type == 'Count':
             df2 = df_['Count']
-            df2.plot(kind='bar', color=palette, figsize=figsize, ax = ax)
+            df2.plot(kind='bar', color=palette, ax = ax)
             bars = ax.patches
             total = df_['Count'].values.sum()
             for bar in bars:
@@ -730,18 +1372,18 @@ class Data_analysis:
                      ha='center', va='bottom', fontsize=fontsize+2)
             max_height = df_.max().max()
             ax.yaxis.set_major_locator(MaxNLocator(integer=True))
-            plt.ylim(0, max_height * 1.1)
+            ax.set_ylim(0, max_height * 1.1)
             
         elif indicator.i_type == 'Percentage':
-            df_['Percentage'].plot(kind='bar', color=palette, figsize=figsize, ax = ax)
+            df_['Percentage'].plot(kind='bar', color=palette, ax = ax)
             bars = ax.patches
             for bar, (idx, row) in zip(bars, df_.iterrows()):
                 percentage = row['Percentage']
                 count = row['Count']
                 label = f'{percentage:.1f}% ({int(count)})'
                 ax.text(bar.get_x() + bar.get_width() / 2, bar.get_height(), label,ha='center', va='bottom', fontsize=fontsize + 2)
-            plt.ylim(0, 105)
-            plt.yticks([0, 20, 40, 60, 80, 100])
+            ax.set_ylim(0, 105)
+            ax.set_yticks([0, 20, 40, 60, 80, 100])
 
         if indicator.target is not None:
             ax.axhline(y=indicator.target, color='red', linestyle='--', linewidth=0.5, label='Target')
@@ -766,36 +1408,81 @@ class Data_analysis:
             return text
 
         labels = [replace_spaces(label) for label in labels]
-        plt.title(title, fontsize=fontsize + 4)
-        plt.xlabel(" ", fontsize=fontsize)
-        plt.ylabel(indicator.i_type, fontsize = fontsize)
+        ax.set_title(title, fontsize=fontsize + 4)
+        ax.set_xlabel(" ", fontsize=fontsize)
+        ax.set_ylabel(indicator.i_type, fontsize = fontsize)
         ax.set_xticks(range(len(labels)))
         ax.set_xticklabels(labels, rotation=rotation, fontsize=fontsize)
         bar_handles = [Patch(color=palette[i], label=label) for i, label in enumerate(labels)]
         line_handles, _ = ax.get_legend_handles_labels()
         handles = bar_handles + line_handles[:-1]
         ax.legend(handles=handles, title="Category", loc='best')
-        plt.savefig(output_file, bbox_inches='tight', dpi=800)
-        plt.close()
+        return ax
+
+    def panel_bar(self, indicator, overall_df, breakdown, file_path, panel_size=(7, 4.5), fontsize=9):
+        """
+        - To draw the overall plot and the count and percentage plots of every breakdown column as the panels of
+          one figure (small multiples), saved once instead of one figure per plot (charts='panels')
+        indicator: indicator class, Indicator from indicator class (bodhi_indicator)
+        overall_df: Dataframe, General table
+        breakdown: dic, Count and percentage tables of each breakdown column {col: (count_df, percent_df)}
+        file_path: str, Directory where the figure will be saved
+        panel_size: tuple, Size of each panel
+        fontsize: int, Font size for plots
+        """
+        output_file = f'{file_path}_{indicator.indicator_name}_panels.png'
+        if indicator.var_order == None:
+            overall_df.dropna(subset=['Count', 'Percentage'], inplace=True)
+        self.label_index(indicator, overall_df)
+        for count_df, percent_df in breakdown.values():
+            self.label_index(indicator, count_df)
+            self.label_index(indicator, percent_df)
+        tables = {col: (count_df.copy(), percent_df.copy()) for col, (count_df, percent_df) in breakdown.items()}
+        return self.render(indicator, output_file, self.draw_panels, indicator, overall_df.copy(), tables,
+                           panel_size=panel_size, fontsize=fontsize)
+
+    def draw_panels(self, indicator, overall_df, breakdown, panel_size=(7, 4.5), fontsize=9):
+        """
+        - To draw the panels of panel_bar on a new figure, returns the plot area of the overall plot
+        indicator: indicator class, Indicator from indicator class (bodhi_indicator)
+        overall_df: Dataframe, General table
+        breakdown: dic, Count and percentage tables of each breakdown column {col: (count_df, percent_df)}
+        panel_size: tuple, Size of each panel
+        fontsize: int, Font size for plots
+        """
+        rows = 1 + len(breakdown)
+        fig = _figure((panel_size[0] * 2, panel_size[1] * rows), self.figure_style)
+        axes = fig.subplots(rows, 2, squeeze=False)
+        self.draw_bar(indicator, overall_df, ax=axes[0][0], fontsize=fontsize)
+        axes[0][1].axis('off')
+        for (count_ax, percent_ax), (col, (count_df, percent_df)) in zip(axes[1:], breakdown.items()):
+            self.draw_breakdown_count(indicator, count_df, col, ax=count_ax, fontsize=fontsize)
+            self.draw_breakdown_percentage(indicator, percent_df, col, ax=percent_ax, fontsize=fontsize)
+        fig.suptitle(f'{indicator.indicator_name}: {indicator.description}', fontsize=fontsize + 6)
+        # Half an inch is kept above the panels for the title of the figure
+        fig.tight_layout(rect=(0, 0, 1, 1 - 0.5 / fig.get_figheight()))
+        return axes[0][0]
         
     def evaluation(self, file_path, folder):
         """
         - Function to run the kap_tables function for each indicator or question
+        - The tables are counted by the indicator scheduler (self.workers threads), then plotted and written in the order of the indicators
         file_path: str, Directory where tables files will be saved
         folder: str, Folder where plots will be saved
         """
+        def counts(indicator):
+            if indicator.s_test is not None:
+                return []
+            return self.table_jobs(indicator, folder)
+
+        results = _ordered([functools.partial(counts, indicator) for indicator in self.indicators], self.workers)
         for indicator in self.indicators:
             print(f'{indicator.name} analysis starts')
             try:
-                if indicator.var_type == 'single':
-                   sheet_name = f"{indicator.indicator_name}"
-                   var_name = f"{indicator.number}" 
-                   self.tables(indicator, indicator.var, sheet_name, var_name, file_path, folder)
-                elif indicator.var_type == 'multi':
-                    names = range(len(indicator.var))
-                    for var, i in zip(indicator.var, names):
-                        sheet_name = f"{indicator.indicator_name}-{i}"
-                        var_name = f"{indicator.number}-{i}"
-                        self.tables(indicator, var, sheet_name, var_name, file_path, folder)
+                jobs, error = next(results)
+                if error is not None:
+                    raise error
+                for (var, sheet_name, var_name), job in zip(self.sheets(indicator), jobs):
+                    self.tables(indicator, var, sheet_name, var_name, file_path, folder, job)
             except Exception as e:
                 print(f"Unexpected error processing indicator {indicator.name}: {e}")
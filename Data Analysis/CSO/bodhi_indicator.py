@@ -25,14 +25,16 @@ class Indicator:
         targets: int, Target number for the indicator
         score_map: dic, Way to calculate the score for this indicator
         valid_point: float, Valid points for indicator calculation
-        breakdown: dic, Variables for data disaggregation {"col1":"name1"}
+        breakdown: dic, Variables for data disaggregation {"col1":"name1", ("col1", "col2"):"name2"}
         condition: condition, Conditions for indicator calculation
         kap_label: list, Labels for multi-table
         s_test: str, Type of statistical tests ('ols', 'anova', 't-test','chi')
         s_group: dic, independent variables for statistical tests {"col":"name"}
         visual: True/False, Option for data visualisation
+        rows: array, Row positions of the dataset analysed by this indicator (None for all rows)
         """
         self.df = df
+        self.rows = None
         self.name = name
         self.number = number
         self.var = var
@@ -60,6 +62,18 @@ class Indicator:
         self.s_group = s_group
         self.visual = visual
 
+    def columns(self):
+        """
+        - Get the dataset columns used by the indicator (variables, breakdown and statistical test groups)
+        """
+        columns = [self.var] if isinstance(self.var, str) else list(self.var)
+        if self.breakdown is not None:
+            for key in self.breakdown.keys():
+                columns += list(key) if isinstance(key, tuple) else [key]
+        if self.s_group is not None:
+            columns += list(self.s_group.keys())
+        return list(dict.fromkeys(columns))
+
     def info(self):
         """
         - Display the details of the indicator
@@ -123,6 +137,7 @@ class Indicator:
     def add_breakdown(self, breakdown):
         """
         - Add the condition for the breakdown of the data
+        - A tuple of columns gives an intersectional table: {('col1', 'col2'):'Gender x Disability'}
         breakdown: dic, Combination of breakdown columns and its name: {'col1':'gender'}
         """
         self.breakdown = breakdown
@@ -131,7 +146,9 @@ class Indicator:
     def add_condition(self, conditions):
         """
         - Add the condition for the indicator
-        conditions: series, Filtering criteria for the indicator: (df['2'] > 25) & (df['4'] == 'Male')
+        conditions: str/dic/series, Filtering criteria for the indicator, evaluated on the dataset being analysed: "`2` > 25 and `4` == 'Male'",
+                    or values to keep for each column: {'4': 'Male', 'country': ['Kenya', 'Uganda']} (see build_index),
+                    or a boolean series of the dataset: (df['2'] > 25) & (df['4'] == 'Male')
         """
         self.condition = conditions
         
@@ -6,6 +6,7 @@
 
 import bodhi_indicator as bd
 import bodhi_PMF as pmf
+import bodhi_plan as bp
 import pandas as pd
 
 """
@@ -51,6 +52,7 @@ def statistics(df, indicators):
     indicators.append(disability)
     
     role_cso = bd.Indicator(df, "Role_CSO", 0, ['a6'], i_cal=None, i_type='count', description='What is your main role in your organisation?', period='endline', target = None, visual= False)
+    # Intersectional tables take a tuple of columns, e.g. ('a2', 'Disability', 'region_group'):'Gender x Disability x Region'
     role_cso.add_breakdown({'region_group':'Region', 'country':'Country','a2':'Gender', 'a3':'Age Group', 'Disability' : 'Disability'})
     role_cso.add_var_order(['Director or senior leadership',
                             'Programme manager or coordinator',
@@ -279,137 +281,141 @@ def statistical_indicators(df, indicators):
 
 
 
+# Compile the indicator definitions once (the plan is evaluated on every country dataset)
+plan = bp.compile_plan(statistics, statistical_indicators)
+# plan.save('data/Sweetgum Indicators.yaml') # Save the definitions as a YAML/JSON spec (reload with bp.load_plan)
+
 # Create the PMF class ('Project Title', 'Evaluation')
 sweetgum = pmf.PerformanceManagementFramework('Sweetgum', 'Evaluation')
+# sweetgum.enable_cache('cache/') # Reuse the tables and plots of unchanged indicators between runs
+sweetgum.enable_export('data/Sweetgum Results.csv') # Long-format results of every run, appended across runs (.csv or .parquet)
+# sweetgum.set_backend('duckdb') # Count the tables with an in-process database (large merged datasets)
+# sweetgum.set_workers(4) # Compute the tables and tests of several indicators at once (threads, the workbooks are the same)
+# sweetgum.set_writer(2) # Write the sheets and plots in background threads while the next indicators are computed
+# sweetgum.set_charts('vega') # Save the plots as Vega-Lite specs (.vl.json) rendered on demand ('panels': one PNG of small multiples per table)
+# df = sweetgum.preprocess('../../Data Preprocessing/CSO') # Or clean the raw export (with the respondent names) and analyse it in memory, new anonymised and cleaned datasets are saved
+# sweetgum.build_index(df) # Bitmap index of the answers: conditions such as add_condition({'a2': 'Female'}) are resolved without copying the dataset
+# sweetgum.preview(plan, df, 'preview/', fraction=0.05) # Quick draft run on a stratified sample (country x gender) to check the definitions and charts
+countries = sweetgum.partition(df, 'country') # Row positions of each country (the dataset is split once)
+partials = {} # Partial aggregates of the countries (sweetgum.partial after each run)
+# sweetgum.plan(plan, df, 'visuals/Overall/').summary() # Sheets, plots and tests a run would produce, with their estimated time (dry run)
 
 """
-df_eth = df[df['country'] == 'Ethiopia']
-
-indicators = []
-indicators = statistics(df_eth, indicators)
-indicators = statistical_indicators(df_eth, indicators)
-sweetgum.add_indicators(indicators)
+sweetgum.add_plan(plan, df, rows=countries['Ethiopia'])
 
 file_path1 = 'data/Sweetgum Statistics_ETH.xlsx' # File path to save the statistics (including breakdown data)
 file_path2 = 'data/Sweetgum Test Results_ETH.xlsx'  # File path to save the chi2 test results
 folder = 'visuals/Ethiopia/' # File path for saving visuals
 
-sweetgum.PMF_generation(file_path1, file_path2, folder) # Run the PMF
+sweetgum.PMF_generation(file_path1, file_path2, folder, label='Ethiopia', cube_folder='cubes/Ethiopia/') # Run the PMF
+partials['Ethiopia'] = sweetgum.partial # Counts and statistics of the country (merged below)
 
-df_ken = df[df['country'] == 'Kenya']
-
-indicators = []
-indicators = statistics(df_ken, indicators)
-indicators = statistical_indicators(df_ken, indicators)
-sweetgum.add_indicators(indicators)
+sweetgum.add_plan(plan, df, rows=countries['Kenya'])
 
 file_path1 = 'data/Sweetgum Statistics_KEN.xlsx' # File path to save the statistics (including breakdown data)
 file_path2 = 'data/Sweetgum Test Results_KEN.xlsx'  # File path to save the chi2 test results
 folder = 'visuals/Kenya/' # File path for saving visuals
 
-sweetgum.PMF_generation(file_path1, file_path2, folder) # Run the PMF
-
-df_ug = df[df['country'] == 'Uganda']
+sweetgum.PMF_generation(file_path1, file_path2, folder, label='Kenya', cube_folder='cubes/Kenya/') # Run the PMF
+partials['Kenya'] = sweetgum.partial # Counts and statistics of the country (merged below)
 
-indicators = []
-indicators = statistics(df_ug, indicators)
-indicators = statistical_indicators(df_ug, indicators)
-sweetgum.add_indicators(indicators)
+sweetgum.add_plan(plan, df, rows=countries['Uganda'])
 
 file_path1 = 'data/Sweetgum Statistics_UG.xlsx' # File path to save the statistics (including breakdown data)
 file_path2 = 'data/Sweetgum Test Results_UG.xlsx'  # File path to save the chi2 test results
 folder = 'visuals/Uganda/' # File path for saving visuals
 
-sweetgum.PMF_generation(file_path1, file_path2, folder) # Run the PMF
+sweetgum.PMF_generation(file_path1, file_path2, folder, label='Uganda', cube_folder='cubes/Uganda/') # Run the PMF
+partials['Uganda'] = sweetgum.partial # Counts and statistics of the country (merged below)
 
-df_jd = df[df['country'] == 'Jordan']
-
-indicators = []
-indicators = statistics(df_jd, indicators)
-indicators = statistical_indicators(df_jd, indicators)
-sweetgum.add_indicators(indicators)
+sweetgum.add_plan(plan, df, rows=countries['Jordan'])
 
 file_path1 = 'data/Sweetgum Statistics_jd.xlsx' # File path to save the statistics (including breakdown data)
 file_path2 = 'data/Sweetgum Test Results_jd.xlsx'  # File path to save the chi2 test results
 folder = 'visuals/Jordan/' # File path for saving visuals
 
-sweetgum.PMF_generation(file_path1, file_path2, folder) # Run the PMF
-
+sweetgum.PMF_generation(file_path1, file_path2, folder, label='Jordan', cube_folder='cubes/Jordan/') # Run the PMF
+partials['Jordan'] = sweetgum.partial # Counts and statistics of the country (merged below)
 
-df_lb = df[df['country'] == 'Lebanon']
 
-indicators = []
-indicators = statistics(df_lb, indicators)
-indicators = statistical_indicators(df_lb, indicators)
-sweetgum.add_indicators(indicators)
+sweetgum.add_plan(plan, df, rows=countries['Lebanon'])
 
 file_path1 = 'data/Sweetgum Statistics_lb.xlsx' # File path to save the statistics (including breakdown data)
 file_path2 = 'data/Sweetgum Test Results_lb.xlsx'  # File path to save the chi2 test results
 folder = 'visuals/Lebanon/' # File path for saving visuals
 
-sweetgum.PMF_generation(file_path1, file_path2, folder) # Run the PMF
+sweetgum.PMF_generation(file_path1, file_path2, folder, label='Lebanon', cube_folder='cubes/Lebanon/') # Run the PMF
+partials['Lebanon'] = sweetgum.partial # Counts and statistics of the country (merged below)
 
-df_liberia = df[df['country'] == 'Liberia']
-
-indicators = []
-indicators = statistics(df_liberia, indicators)
-indicators = statistical_indicators(df_liberia, indicators)
-sweetgum.add_indicators(indicators)
+sweetgum.add_plan(plan, df, rows=countries['Liberia'])
 
 file_path1 = 'data/Sweetgum Statistics_liberia.xlsx' # File path to save the statistics (including breakdown data)
 file_path2 = 'data/Sweetgum Test Results_liberia.xlsx'  # File path to save the chi2 test results
 folder = 'visuals/Liberia/' # File path for saving visuals
 
-sweetgum.PMF_generation(file_path1, file_path2, folder) # Run the PMF
-
+sweetgum.PMF_generation(file_path1, file_path2, folder, label='Liberia', cube_folder='cubes/Liberia/') # Run the PMF
+partials['Liberia'] = sweetgum.partial # Counts and statistics of the country (merged below)
 
-df_sl = df[df['country'] == 'Sierra Leone']
 
-indicators = []
-indicators = statistics(df_sl, indicators)
-indicators = statistical_indicators(df_sl, indicators)
-sweetgum.add_indicators(indicators)
+sweetgum.add_plan(plan, df, rows=countries['Sierra Leone'])
 
 file_path1 = 'data/Sweetgum Statistics_sl.xlsx' # File path to save the statistics (including breakdown data)
 file_path2 = 'data/Sweetgum Test Results_sl.xlsx'  # File path to save the chi2 test results
 folder = 'visuals/Sierra Leone/' # File path for saving visuals
 
-sweetgum.PMF_generation(file_path1, file_path2, folder) # Run the PMF
+sweetgum.PMF_generation(file_path1, file_path2, folder, label='Sierra Leone', cube_folder='cubes/Sierra Leone/') # Run the PMF
+partials['Sierra Leone'] = sweetgum.partial # Counts and statistics of the country (merged below)
 
-df_mali = df[df['country'] == 'Mali']
-
-indicators = []
-indicators = statistics(df_mali, indicators)
-indicators = statistical_indicators(df_mali, indicators)
-sweetgum.add_indicators(indicators)
+sweetgum.add_plan(plan, df, rows=countries['Mali'])
 
 file_path1 = 'data/Sweetgum Statistics_mali.xlsx' # File path to save the statistics (including breakdown data)
 file_path2 = 'data/Sweetgum Test Results_mali.xlsx'  # File path to save the chi2 test results
 folder = 'visuals/Mali/' # File path for saving visuals
 
-sweetgum.PMF_generation(file_path1, file_path2, folder) # Run the PMF
-
-df_ghana = df[df['country'] == 'Ghana']
+sweetgum.PMF_generation(file_path1, file_path2, folder, label='Mali', cube_folder='cubes/Mali/') # Run the PMF
+partials['Mali'] = sweetgum.partial # Counts and statistics of the country (merged below)
 
-indicators = []
-indicators = statistics(df_ghana, indicators)
-indicators = statistical_indicators(df_ghana, indicators)
-sweetgum.add_indicators(indicators)
+sweetgum.add_plan(plan, df, rows=countries['Ghana'])
 
 file_path1 = 'data/Sweetgum Statistics_ghana.xlsx' # File path to save the statistics (including breakdown data)
 file_path2 = 'data/Sweetgum Test Results_ghana.xlsx'  # File path to save the chi2 test results
 folder = 'visuals/Ghana/' # File path for saving visuals
 
-sweetgum.PMF_generation(file_path1, file_path2, folder) # Run the PMF
+sweetgum.PMF_generation(file_path1, file_path2, folder, label='Ghana', cube_folder='cubes/Ghana/') # Run the PMF
+partials['Ghana'] = sweetgum.partial # Counts and statistics of the country (merged below)
 """
 # Overall
-indicators = []
-indicators = statistics(df, indicators)
-indicators = statistical_indicators(df, indicators)
-sweetgum.add_indicators(indicators)
+sweetgum.add_plan(plan, df)
 
 file_path1 = 'data/Sweetgum Statistics.xlsx' # File path to save the statistics (including breakdown data)
 file_path2 = 'data/Sweetgum Test Results.xlsx'  # File path to save the chi2 test results
 folder = 'visuals/Overall/' # File path for saving visuals
 
-sweetgum.PMF_generation(file_path1, file_path2, folder) # Run the PMF
\ No newline at end of file
+sweetgum.PMF_generation(file_path1, file_path2, folder, label='Overall', cube_folder='cubes/Overall/') # Run the PMF
+
+# Regional reports merged from the country runs, without scanning the dataset again (countries which were not run
+# above are only counted). Medians and modes cannot be merged and are left empty in the tests, categories with the
+# same count may be listed in another order than in a run on the whole dataset
+"""
+partials.update(sweetgum.count_partials(plan, df, {c: rows for c, rows in countries.items() if c not in partials}))
+
+regions = {'West Africa': ['Sierra Leone', 'Ghana', 'Liberia', 'Mali'],
+           'East Africa': ['Kenya', 'Uganda', 'Ethiopia'],
+           'MENA': ['Lebanon', 'Jordan']}
+for region, members in regions.items():
+    members = [partials[c] for c in members if c in partials] # Countries of the region found in the dataset
+    if members:
+        sweetgum.merge_report(members, f'data/Sweetgum Statistics_{region}.xlsx', f'data/Sweetgum Test Results_{region}.xlsx',
+                              f'visuals/{region}/', label=region, cube_folder=f'cubes/{region}/')
+
+# sweetgum.merge_report([partials[c] for c in countries], 'data/Sweetgum Statistics_merged.xlsx',
+#                       'data/Sweetgum Test Results_merged.xlsx', 'visuals/Overall merged/', label='Overall') # Overall merged as well
+"""
+
+# Or count all countries at once in worker processes sharing one memory-mapped copy of the dataset, e.g.
+# dataset = sweetgum.share(df, 'cache/Sweetgum dataset.arrow')
+# partials = sweetgum.parallel_partials(plan, dataset, countries)
+# (instead of count_partials above), then write the reports with merge_report as above
+
+# Query the saved count cubes without rerunning the pipeline, e.g.
+# sweetgum.query('CA.2', by=['country', 'a2'], where={'Disability': 'Disability'}, folder='cubes/Overall/')
@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@author: Bodhi Global Analysis (Jungyeon Lee)
+"""
+
+import json
+from dataclasses import dataclass, fields
+import bodhi_indicator as bd
+
+# Indicator settings which are dictionaries (stored as tuples of pairs so that the specs stay immutable)
+mapping_fields = ('var_change', 'score_map', 'valid_point', 'breakdown', 's_group')
+# Indicator settings which are lists (stored as tuples)
+list_fields = ('var', 'var_order', 'kap_label')
+
+
+@dataclass(frozen=True)
+class IndicatorSpec:
+    """
+    - Immutable definition of an indicator, separate from the data
+    - Settings are the same as the Indicator class (bodhi_indicator)
+    """
+    name: str
+    number: object
+    var: tuple
+    i_cal: str
+    i_type: str
+    description: str
+    period: str = None
+    target: object = None
+    baseline: object = None
+    midline: object = None
+    var_order: tuple = None
+    var_change: tuple = None
+    score_map: tuple = None
+    valid_point: object = None
+    breakdown: tuple = None
+    condition: object = None
+    kap_label: tuple = None
+    s_test: str = None
+    s_group: tuple = None
+    visual: bool = True
+
+    @classmethod
+    def from_dict(cls, values):
+        """
+        - To create the spec from a dictionary (one entry of a YAML/JSON file)
+        values: dic, Settings of the indicator
+        """
+        names = {f.name for f in fields(cls)}
+        unknown = set(values) - names
+        if unknown:
+            raise ValueError(f"Unknown settings for indicator {values.get('name')}: {', '.join(sorted(unknown))}")
+        values = dict(values)
+        for field in list_fields:
+            if values.get(field) is not None:
+                values[field] = tuple(values[field])
+        for field in mapping_fields:
+            value = values.get(field)
+            if isinstance(value, dict):
+                values[field] = tuple(value.items())
+            elif isinstance(value, list):
+                values[field] = tuple((tuple(k) if isinstance(k, list) else k, v) for k, v in value)
+        if isinstance(values.get('condition'), dict):
+            # Column value conditions {'col': values} (see Indicator.add_condition)
+            values['condition'] = tuple((k, tuple(v) if isinstance(v, (list, tuple, set)) else v)
+                                        for k, v in values['condition'].items())
+        return cls(**values)
+
+    @classmethod
+    def from_indicator(cls, indicator):
+        """
+        - To freeze an indicator built with the Indicator class
+        indicator: indicator class, Indicator from indicator class (bodhi_indicator)
+        """
+        if indicator.condition is not None and not isinstance(indicator.condition, (str, dict)):
+            raise ValueError(f"{indicator.indicator_name}: conditions bound to a dataframe cannot be compiled into a plan")
+        return cls.from_dict({f.name: getattr(indicator, f.name) for f in fields(cls)})
+
+    def to_dict(self):
+        """
+        - To convert the spec into a dictionary (one entry of a YAML/JSON file)
+        - Dictionaries with non-text keys are written as lists of [key, value] pairs
+        """
+        values = {}
+        for f in fields(self):
+            value = getattr(self, f.name)
+            if value is None or value == f.default:
+                if f.name in ('name', 'number', 'var', 'i_cal', 'i_type', 'description'):
+                    values[f.name] = value
+                continue
+            if f.name in list_fields:
+                value = list(value)
+            elif f.name in mapping_fields and isinstance(value, tuple):
+                if all(isinstance(k, str) for k, _ in value):
+                    value = dict(value)
+                else:
+                    value = [[list(k) if isinstance(k, tuple) else k, v] for k, v in value]
+            elif f.name == 'condition' and isinstance(value, tuple):
+                value = {k: list(v) if isinstance(v, tuple) else v for k, v in value}
+            values[f.name] = value
+        return values
+
+    def bind(self, df, rows=None):
+        """
+        - To create the Indicator of this spec for a dataset
+        df: Dataframe, Dataset to analyse
+        rows: array, Row positions of the dataset to analyse (None for all rows)
+        """
+        indicator = bd.Indicator(df, self.name, self.number, list(self.var), self.i_cal, self.i_type, self.description,
+                                 period=self.period, target=self.target, s_test=self.s_test,
+                                 s_group=dict(self.s_group) if self.s_group is not None else None, visual=self.visual)
+        indicator.baseline = self.baseline
+        indicator.midline = self.midline
+        indicator.var_order = list(self.var_order) if self.var_order is not None else None
+        indicator.var_change = dict(self.var_change) if self.var_change is not None else None
+        indicator.score_map = dict(self.score_map) if self.score_map is not None else None
+        indicator.valid_point = dict(self.valid_point) if isinstance(self.valid_point, tuple) else self.valid_point
+        indicator.breakdown = dict(self.breakdown) if self.breakdown is not None else None
+        indicator.condition = dict(self.condition) if isinstance(self.condition, tuple) else self.condition
+        indicator.kap_label = list(self.kap_label) if self.kap_label is not None else None
+        indicator.rows = rows
+        return indicator
+
+
+class IndicatorPlan:
+
+    def __init__(self, specs):
+        """
+        - Initialise the indicator plan (compiled indicator definitions which can be evaluated on any dataset)
+
+        specs: list, Indicator specs (IndicatorSpec)
+        """
+        self.specs = tuple(specs)
+
+    def __len__(self):
+        return len(self.specs)
+
+    def __iter__(self):
+        return iter(self.specs)
+
+    def bind(self, df, rows=None):
+        """
+        - To create the indicators of the plan for a dataset
+        df: Dataframe, Dataset to analyse
+        rows: array, Row positions of the dataset to analyse (None for all rows)
+        """
+        return [spec.bind(df, rows) for spec in self.specs]
+
+    def select(self, indicators):
+        """
+        - To keep some indicators of the plan, e.g. one group of RunPlan.split (bodhi_estimate)
+        indicators: list, Indicator names (number.name) or names of the indicators to keep
+        """
+        indicators = set(map(str, indicators))
+        return IndicatorPlan(spec for spec in self.specs
+                             if spec.name in indicators or (f'{spec.number}.{spec.name}' if spec.number is not None else spec.name) in indicators)
+
+    def save(self, file_path):
+        """
+        - To save the plan as a YAML (.yaml, .yml) or JSON file
+        file_path: str, Directory of the file
+        """
+        entries = {'indicators': [spec.to_dict() for spec in self.specs]}
+        with open(file_path, 'w', encoding='utf-8') as f:
+            if file_path.endswith(('.yaml', '.yml')):
+                _yaml().safe_dump(entries, f, allow_unicode=True, sort_keys=False)
+            else:
+                json.dump(entries, f, ensure_ascii=False, indent=2)
+        print(f"The indicator plan has been saved: {file_path}")
+        return True
+
+
+def _yaml():
+    """
+    - To import PyYAML (only needed for YAML plans)
+    """
+    try:
+        import yaml
+    except ImportError:
+        raise ImportError("Please install PyYAML to use YAML indicator plans (or use a JSON file)")
+    return yaml
+
+def load_plan(file_path):
+    """
+    - To load an indicator plan from a YAML (.yaml, .yml) or JSON file
+    - The file has a list of indicators (or {'indicators': [...]}) with the same settings as the Indicator class
+    file_path: str, Directory of the file
+    """
+    with open(file_path, encoding='utf-8') as f:
+        if file_path.endswith(('.yaml', '.yml')):
+            entries = _yaml().safe_load(f)
+        else:
+            entries = json.load(f)
+    if isinstance(entries, dict):
+        entries = entries['indicators']
+    plan = IndicatorPlan(IndicatorSpec.from_dict(entry) for entry in entries)
+    print(f"{len(plan)} indicators have been loaded from {file_path}")
+    return plan
+
+def compile_plan(*builders):
+    """
+    - To compile functions building the indicators (e.g. statistics(df, indicators)) into a plan
+    - The functions are run once without a dataset
+    builders: functions, Functions with the (df, indicators) arguments returning the list of indicators
+    """
+    indicators = []
+    for builder in builders:
+        indicators = builder(None, indicators)
+    return IndicatorPlan(IndicatorSpec.from_indicator(indicator) for indicator in indicators)
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@author: Bodhi Global Analysis (Jungyeon Lee)
+"""
+
+import queue
+import threading
+
+
+class BackgroundWriter:
+
+    def __init__(self, threads=2, max_queue=32):
+        """
+        - Initialise the background writer (sheets and plots are written by dedicated threads while the next indicators are computed)
+        - Jobs of the same lane (e.g. one workbook) are run by the same thread, in the order they were submitted
+        - The queues are bounded: submitting a job waits while its writer is max_queue jobs behind (back-pressure)
+
+        threads: int, Number of writer threads
+        max_queue: int, Maximum number of waiting jobs of each writer thread
+        """
+        self.queues = [queue.Queue(maxsize=max_queue) for _ in range(threads)]
+        self.lanes = {}
+        self.errors = 0
+        self.lock = threading.Lock()
+        self.threads = [threading.Thread(target=self.drain, args=(jobs,), name=f'bodhi-writer-{i}', daemon=True)
+                        for i, jobs in enumerate(self.queues)]
+        for thread in self.threads:
+            thread.start()
+
+    def submit(self, name, function, *args, lane=None, **kwargs):
+        """
+        - To queue a job, e.g. writing a sheet or saving a plot (waits while the queue of its writer is full)
+        name: str, Description of the job for error messages
+        function: function, Job to run
+        lane: str, Lane of the job (lanes are shared out between the writer threads in turn)
+        """
+        if lane not in self.lanes:
+            self.lanes[lane] = len(self.lanes) % len(self.queues)
+        self.queues[self.lanes[lane]].put((name, function, args, kwargs))
+        return True
+
+    def drain(self, jobs):
+        """
+        - To run the jobs of a queue (writer thread), a failing job is reported and the next jobs still run
+        - The thread stops at the None job queued by close
+        jobs: Queue, Queue of the writer thread
+        """
+        while True:
+            job = jobs.get()
+            if job is None:
+                jobs.task_done()
+                return
+            name, function, args, kwargs = job
+            try:
+                function(*args, **kwargs)
+            except Exception as e:
+                with self.lock:
+                    self.errors += 1
+                print(f"Unexpected error writing {name}: {e}")
+            finally:
+                jobs.task_done()
+
+    def flush(self):
+        """
+        - To wait until all the queued jobs have been run
+        - The lanes are shared out again from the next job (the queues are empty, so the order of a lane is kept)
+        - Returns the number of jobs which have failed since the last flush
+        """
+        for jobs in self.queues:
+            jobs.join()
+        self.lanes = {}
+        with self.lock:
+            errors, self.errors = self.errors, 0
+        return errors
+
+    def close(self):
+        """
+        - To run the queued jobs and stop the writer threads
+        - Returns the number of jobs which have failed since the last flush
+        """
+        errors = self.flush()
+        for jobs in self.queues:
+            jobs.put(None)
+        for thread in self.threads:
+            thread.join()
+        return errors
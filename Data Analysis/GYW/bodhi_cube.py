@@ -0,0 +1,280 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@author: Bodhi Global Analysis (Jungyeon Lee)
+"""
+
+import json
+import os
+import shutil
+import numpy as np
+import pandas as pd
+
+# Separator of the group names of intersectional tables (e.g. 'Female / Disability')
+separator = ' / '
+
+
+def breakdown_columns(breakdown):
+    """
+    - To list the dataset columns of the breakdown settings (keys can be one column or a tuple of columns)
+    breakdown: dic, Breakdown settings of the indicator {'col1':'name1', ('col1', 'col2'):'name2'}
+    """
+    columns = []
+    for key in breakdown:
+        columns += list(key) if isinstance(key, tuple) else [key]
+    return list(dict.fromkeys(columns))
+
+def _codes(values):
+    """
+    - To convert a column into categorical codes (missing values are -1)
+    - Returns (codes, levels, all_levels), all_levels is True when the unused levels are kept (categorical columns)
+    """
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        return np.asarray(values.cat.codes), values.cat.categories, True
+    try:
+        codes, levels = pd.factorize(values, sort=True)
+    except TypeError:
+        codes, levels = pd.factorize(values)
+    return codes, pd.Index(levels), False
+
+
+class CountCube:
+
+    def __init__(self, var, categories, dims, levels, counts, all_levels):
+        """
+        - Initialise the count cube (counts of the categories of a variable by every breakdown column at once)
+        - Any one-way or intersectional table is a sum over the other axes of the cube
+
+        var: str, Variable of the indicator
+        categories: index, Categories of the variable (first axis)
+        dims: list, Breakdown columns (one axis each)
+        levels: list, Values of each breakdown column (the last position of each axis counts missing values)
+        counts: array, Counts with the shape (categories, levels + 1, ...)
+        all_levels: list, For the variable and each column, True when levels without data are kept in tables (categorical columns)
+        """
+        self.var = var
+        self.categories = categories
+        self.dims = list(dims)
+        self.levels = list(levels)
+        self.counts = counts
+        self.all_levels = list(all_levels)
+
+    @classmethod
+    def build(cls, df, var, dims):
+        """
+        - To count the dataset once over the combined codes of the variable and all breakdown columns (np.bincount)
+        df: Dataframe, Dataset of the indicator
+        var: str, Variable of the indicator
+        dims: list, Breakdown columns
+        """
+        values = df[var].iloc[:, 0] if isinstance(df[var], pd.DataFrame) else df[var]
+        codes, categories, all_categories = _codes(values)
+        all_codes = [codes]
+        levels = []
+        all_levels = [all_categories]
+        shape = [len(categories)]
+        for dim in dims:
+            dim_codes, dim_levels, keep = _codes(df[dim])
+            dim_codes = np.where(dim_codes < 0, len(dim_levels), dim_codes)
+            all_codes.append(dim_codes)
+            levels.append(dim_levels)
+            all_levels.append(keep)
+            shape.append(len(dim_levels) + 1)
+
+        valid = codes >= 0
+        flat = np.ravel_multi_index([c[valid] for c in all_codes], shape)
+        counts = np.bincount(flat, minlength=int(np.prod(shape))).reshape(shape)
+        return cls(var[0] if isinstance(var, list) else var, categories, dims, levels, counts, all_levels)
+
+    @classmethod
+    def build_block(cls, df, variables, dims):
+        """
+        - To count several variables (e.g. the answers of a multi-select question) by the same breakdown columns at once
+        - The breakdown columns are coded once into cells, then the (variable, category, cell) codes of the whole block are
+          counted with one np.bincount (the product of the one-hot codes of the answers and of the breakdown cells)
+        - Returns one count cube per variable, the same as build
+        df: Dataframe, Dataset of the indicator
+        variables: list, Variables of the block
+        dims: list, Breakdown columns
+        """
+        cells = np.zeros(len(df), dtype=np.int64)
+        levels = []
+        all_levels = []
+        shape = []
+        for dim in dims:
+            dim_codes, dim_levels, keep = _codes(df[dim])
+            cells = cells * (len(dim_levels) + 1) + np.where(dim_codes < 0, len(dim_levels), dim_codes)
+            levels.append(dim_levels)
+            all_levels.append(keep)
+            shape.append(len(dim_levels) + 1)
+        size = int(np.prod(shape))
+
+        flat = []
+        coded = []
+        offset = 0
+        for var in variables:
+            codes, categories, all_categories = _codes(df[var])
+            valid = codes >= 0
+            flat.append(offset + codes[valid] * size + cells[valid])
+            coded.append((var, categories, all_categories, offset))
+            offset += len(categories) * size
+        counts = np.bincount(np.concatenate(flat), minlength=offset) if flat else np.zeros(0, dtype=np.int64)
+        return [cls(var, categories, dims, levels, counts[start:start + len(categories) * size].reshape([len(categories)] + shape),
+                    [all_categories] + all_levels) for var, categories, all_categories, start in coded]
+
+    def select(self, where=None):
+        """
+        - To slice the cube on the values of some breakdown columns
+        where: dic, Values to keep for each column {'col1': 'value', 'col2': ['value1', 'value2']}
+        """
+        if not where:
+            return self
+        counts = self.counts
+        for col, values in where.items():
+            axis = self.dims.index(col) + 1
+            values = values if isinstance(values, (list, tuple)) else [values]
+            positions = self.levels[axis - 1].get_indexer(values)
+            if (positions < 0).any():
+                raise KeyError(f"{col}: {[v for v, p in zip(values, positions) if p < 0]} not found")
+            # The counts outside the slice (including missing values) are set to zero
+            kept = np.zeros(counts.shape[axis], dtype=bool)
+            kept[positions] = True
+            counts = np.where(np.expand_dims(kept, tuple(i for i in range(counts.ndim) if i != axis)), counts, 0)
+        return CountCube(self.var, self.categories, self.dims, self.levels, counts, self.all_levels)
+
+    def table(self, by, where=None):
+        """
+        - To get a count table by one or several breakdown columns (e.g. Gender x Disability x Region)
+        - Missing values of the selected columns are left out, like groupby
+        by: str/tuple, Breakdown column or tuple of breakdown columns (None for the counts of all respondents)
+        where: dic, Values to keep for the other columns (see select)
+        """
+        cube = self.select(where)
+        if not by:
+            counts = cube.counts.sum(axis=tuple(range(1, cube.counts.ndim)))
+            table = pd.DataFrame({'Count': counts}, index=pd.Index(self.categories, name='category_value'))
+            return table if self.all_levels[0] else table.loc[table['Count'] > 0]
+        by = list(by) if isinstance(by, (tuple, list)) else [by]
+        axes = [self.dims.index(col) + 1 for col in by]
+        others = tuple(i for i in range(1, cube.counts.ndim) if i not in axes)
+        counts = cube.counts.sum(axis=others)
+        # Drop the missing position of the selected columns (axes are kept in the order of the cube)
+        counts = counts[(slice(None),) + tuple(slice(0, -1) for _ in axes)]
+        ranks = np.argsort(np.argsort(axes))
+        counts = np.moveaxis(counts, [r + 1 for r in ranks], list(range(1, len(axes) + 1)))
+        counts = counts.reshape(len(self.categories), -1)
+
+        levels = [self.levels[axis - 1] for axis in axes]
+        if len(by) == 1:
+            columns = pd.Index(levels[0], name=by[0])
+        else:
+            columns = pd.MultiIndex.from_product(levels)
+            columns = pd.Index([separator.join(map(str, c)) for c in columns], name=separator.join(by))
+        table = pd.DataFrame(counts, index=pd.Index(self.categories, name='category_value'), columns=columns)
+
+        if not self.all_levels[0]:
+            table = table.loc[table.sum(axis=1) > 0]
+        if not (len(by) == 1 and (self.all_levels[0] or self.all_levels[axes[0]])):
+            table = table.loc[:, table.sum(axis=0) > 0]
+        return table
+
+    def merge(self, other):
+        """
+        - To add the counts of another cube of the same variable and breakdown columns (e.g. another country)
+        other: CountCube, Count cube to add
+        """
+        if self.dims != other.dims:
+            raise ValueError(f"Count cubes with different breakdown columns cannot be merged: {self.dims} / {other.dims}")
+        categories = self.categories.append(other.categories).unique()
+        levels = [a.append(b).unique() for a, b in zip(self.levels, other.levels)]
+        try:
+            levels = [pd.Index(sorted(level)) for level in levels]
+        except TypeError:
+            pass
+        shape = [len(categories)] + [len(level) + 1 for level in levels]
+        counts = np.zeros(shape, dtype=self.counts.dtype)
+        for cube in (self, other):
+            positions = [categories.get_indexer(cube.categories)]
+            positions += [np.append(level.get_indexer(old), len(level)) for level, old in zip(levels, cube.levels)]
+            counts[np.ix_(*positions)] += cube.counts
+        all_levels = [a or b for a, b in zip(self.all_levels, other.all_levels)]
+        return CountCube(self.var, categories, self.dims, levels, counts, all_levels)
+
+    def info(self):
+        """
+        - To describe the cube without its counts (saved in the index of a cube folder)
+        """
+        return {'var': self.var, 'categories': self.categories.tolist(), 'dims': self.dims,
+                'levels': [level.tolist() for level in self.levels], 'all_levels': self.all_levels}
+
+
+def save_cubes(cubes, folder):
+    """
+    - To save count cubes to a folder (one .npy file per cube and an index.json describing them)
+    - The folder is replaced as a whole, so readers never see a half-written set of cubes
+    cubes: list, (count cube, description of the table) pairs, the description has at least the sheet name {'sheet': ...}
+    folder: str, Directory of the cubes
+    """
+    folder = folder.rstrip('/\\')
+    tmp = f'{folder}.tmp'
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    index = []
+    for i, (cube, description) in enumerate(cubes):
+        np.save(os.path.join(tmp, f'{i}.npy'), cube.counts)
+        index.append(dict(description, file=f'{i}.npy', **cube.info()))
+    with open(os.path.join(tmp, 'index.json'), 'w', encoding='utf-8') as f:
+        json.dump(index, f, ensure_ascii=False, default=str)
+    shutil.rmtree(folder, ignore_errors=True)
+    os.replace(tmp, folder)
+    print(f"{len(index)} count cubes have been saved: {folder}")
+    return True
+
+
+class CubeStore:
+
+    def __init__(self, folder):
+        """
+        - Initialise the cube store (answers count queries from the saved cubes of a run, see save_cubes)
+        - Cubes are memory-mapped when they are first queried, the respondent-level data is not needed
+
+        folder: str, Directory of the cubes
+        """
+        self.folder = folder
+        with open(os.path.join(folder, 'index.json'), encoding='utf-8') as f:
+            self.index = json.load(f)
+        self.cubes = {}
+
+    def find(self, indicator):
+        """
+        - To find the entry of an indicator by sheet name, indicator name (number.name) or name
+        indicator: str, Sheet name, indicator name or name of the indicator
+        """
+        for key in ('sheet', 'indicator', 'name'):
+            entries = [entry for entry in self.index if str(entry.get(key)) == str(indicator)]
+            if len(entries) == 1:
+                return entries[0]
+            if len(entries) > 1:
+                raise KeyError(f"{indicator} has several tables, please use one of the sheet names: {', '.join(e['sheet'] for e in entries)}")
+        raise KeyError(f"{indicator} was not found in {self.folder}")
+
+    def cube(self, indicator):
+        """
+        - To get the memory-mapped count cube of an indicator
+        indicator: str, Sheet name, indicator name or name of the indicator
+        """
+        entry = self.find(indicator)
+        if entry['sheet'] not in self.cubes:
+            counts = np.load(os.path.join(self.folder, entry['file']), mmap_mode='r')
+            self.cubes[entry['sheet']] = CountCube(entry['var'], pd.Index(entry['categories']), entry['dims'],
+                                                   [pd.Index(level) for level in entry['levels']], counts, entry['all_levels'])
+        return self.cubes[entry['sheet']]
+
+    def query(self, indicator, by=None, where=None):
+        """
+        - To get a count table of an indicator by any combination of its breakdown columns
+        indicator: str, Sheet name, indicator name or name of the indicator
+        by: str/list, Breakdown column or list of breakdown columns (None for the counts of all respondents)
+        where: dic, Values to keep for the other columns {'col1': 'value', 'col2': ['value1', 'value2']}
+        """
+        return self.cube(indicator).table(tuple(by) if isinstance(by, list) else by, where)
@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@author: Bodhi Global Analysis (Jungyeon Lee)
+"""
+
+import os
+import tempfile
+import time
+import numpy as np
+import pandas as pd
+
+# Seconds of each operation of a run (measured on a laptop, calibrate() measures them on this machine)
+default_timings = {
+    'count': 0.002,         # Counting one table (fixed part)
+    'count_cell': 4e-8,     # Counting one row of one column (the variable and each breakdown column)
+    'sheet': 0.015,         # Writing one sheet to a workbook (fixed part)
+    'sheet_reload': 0.004,  # Writing one sheet, for each sheet already in the workbook (the workbook is reopened)
+    'plot': 0.12,           # Rendering one plot (fixed part)
+    'plot_pixel': 2e-8,     # Encoding one pixel of a plot (12 x 8 inches at the dpi of the run)
+    'chart': 0.001,         # Saving the Vega-Lite spec of one plot instead of rendering it (bodhi_vega)
+    'test': 0.02,           # Running one statistical test (fixed part)
+    'test_cell': 5e-8,      # Testing one row for each group column
+}
+
+# Size of the plots (inches)
+plot_size = (12, 8)
+
+
+def _cardinality(indicator, col, cache):
+    """
+    - To count the different values of a column in the rows of the indicator (2 for the columns made by the calculations, e.g. Pass/Not Pass)
+    """
+    if col not in cache:
+        df = indicator.df
+        if df is None or col not in df.columns:
+            cache[col] = 2
+        else:
+            values = df[col] if indicator.rows is None else df[col].iloc[indicator.rows]
+            cache[col] = int(values.nunique())
+    return cache[col]
+
+
+class RunPlan:
+
+    def __init__(self, items, label=None):
+        """
+        - Initialise the plan of a run (every sheet, plot and test a run would produce, with its estimated cost)
+
+        items: Dataframe, One row per output: indicator, kind ('table', 'plot', 'test'), sheet, file, rows, cells, seconds
+        label: str, Name of the run
+        """
+        self.items = items
+        self.label = label
+
+    def __len__(self):
+        return len(self.items)
+
+    def seconds(self):
+        """
+        - To get the estimated time of the run (seconds, one thread)
+        """
+        return float(self.items['seconds'].sum())
+
+    def summary(self):
+        """
+        - To count the outputs and their estimated time by kind
+        """
+        return self.items.groupby('kind', sort=False).agg(outputs=('kind', 'size'), seconds=('seconds', 'sum'))
+
+    def indicators(self):
+        """
+        - To get the estimated time of each indicator, the most expensive first
+        """
+        return self.items.groupby('indicator', sort=False)['seconds'].sum().sort_values(ascending=False, kind='stable')
+
+    def select(self, indicators=None, kinds=None):
+        """
+        - To keep some outputs of the plan
+        indicators: list, Indicator names (number.name) to keep (all by default)
+        kinds: list, Kinds of outputs to keep, e.g. ['table', 'test'] (all by default)
+        """
+        items = self.items
+        if indicators is not None:
+            items = items.loc[items['indicator'].isin(indicators)]
+        if kinds is not None:
+            items = items.loc[items['kind'].isin(kinds)]
+        return RunPlan(items.reset_index(drop=True), self.label)
+
+    def split(self, workers):
+        """
+        - To share the indicators between workers with about the same estimated time each (the longest indicators first)
+        - Returns a list of indicator names per worker, e.g. to run each list with IndicatorPlan.select
+        workers: int, Number of workers
+        """
+        groups = [[] for _ in range(workers)]
+        loads = [0.0] * workers
+        for indicator, seconds in self.indicators().items():
+            i = loads.index(min(loads))
+            groups[i].append(indicator)
+            loads[i] += seconds
+        return groups
+
+    def report(self):
+        """
+        - To print the number of outputs and the estimated time of the run
+        """
+        summary = self.summary()
+        outputs = ', '.join(f"{int(row.outputs)} {kind}s" for kind, row in summary.iterrows())
+        print(f"{self.label or 'The run'} would produce {outputs or 'nothing'} (about {self.seconds():.0f}s)")
+        return True
+
+
+def plan_run(tool, folder, timings=None, label=None):
+    """
+    - To list the outputs of a run and estimate their cost, without counting, plotting or writing anything
+    - The cost of each output comes from the number of rows, the number of categories of its columns and the timings
+    tool: Data_analysis, Data analysis of the run, with its indicators bound to the dataset (bodhi_data_analysis)
+    folder: str, Folder where plots would be saved
+    timings: dic, Seconds of each operation (see default_timings and calibrate)
+    label: str, Name of the run
+    """
+    timings = dict(default_timings, **(timings or {}))
+    pixels = plot_size[0] * plot_size[1] * tool.dpi ** 2
+    cardinalities = {}
+    sheets = {'table': 0, 'test': 0}
+    items = []
+    for indicator in tool.indicators:
+        n = len(indicator.df) if indicator.rows is None else len(indicator.rows)
+        mask = tool.condition_mask(indicator)
+        if mask is not None:
+            n = int(mask.sum()) if indicator.rows is None else int(mask[indicator.rows].sum())
+        for kind, sheet_name, output_file, col in tool.outputs(indicator, folder):
+            var = [indicator.var] if isinstance(indicator.var, str) else list(indicator.var)
+            categories = max(_cardinality(indicator, v, cardinalities) for v in var)
+            if kind == 'test':
+                groups = list(indicator.s_group.keys())
+                seconds = timings['test'] * len(groups) + timings['test_cell'] * n * len(groups)
+                cells = categories * sum(_cardinality(indicator, c, cardinalities) for c in groups)
+            elif kind == 'table':
+                keys = list(indicator.breakdown.keys()) if indicator.breakdown is not None else []
+                dims = list(dict.fromkeys(c for key in keys for c in (key if isinstance(key, tuple) else [key])))
+                seconds = timings['count'] + timings['count_cell'] * n * (1 + len(dims))
+                cells = categories * (1 + 2 * sum(int(np.prod([_cardinality(indicator, c, cardinalities) for c in (key if isinstance(key, tuple) else [key])]))
+                                                  for key in keys))
+            elif output_file.endswith('_panels.png'):
+                # Two panels of 7 x 4.5 inches for the overall plot and for each breakdown column (see panel_bar)
+                panels = 1 + (len(indicator.breakdown) if indicator.breakdown is not None else 0)
+                seconds = timings['plot'] * panels + timings['plot_pixel'] * 14 * 4.5 * panels * tool.dpi ** 2
+                cells = 0
+            elif output_file.endswith('.png'):
+                seconds = timings['plot'] + timings['plot_pixel'] * pixels
+                cells = 0
+            else:
+                seconds = timings['chart']
+                cells = 0
+            if kind in sheets:
+                seconds += timings['sheet'] + timings['sheet_reload'] * sheets[kind]
+                sheets[kind] += 1
+            items.append({'indicator': indicator.indicator_name, 'kind': kind, 'sheet': sheet_name, 'file': output_file,
+                          'breakdown': col, 'rows': n, 'cells': cells, 'seconds': seconds})
+    columns = ['indicator', 'kind', 'sheet', 'file', 'breakdown', 'rows', 'cells', 'seconds']
+    return RunPlan(pd.DataFrame(items, columns=columns), label)
+
+
+def calibrate(rows=100000, dpi=800):
+    """
+    - To measure the timings of the operations of a run on this machine (see default_timings)
+    - A synthetic table is counted, written to a temporary workbook, plotted and tested
+    rows: int, Number of rows of the synthetic dataset
+    dpi: int, Resolution of the plot
+    """
+    import bodhi_cube as bcu
+    from scipy import stats
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    rng = np.random.default_rng(0)
+    dims = {'region_group': 3, 'country': 9, 'a2': 4, 'a3': 5, 'Disability': 2}
+    df = pd.DataFrame({col: rng.integers(0, n, rows).astype(str) for col, n in dims.items()})
+    df['var'] = rng.choice(['Yes', 'No', 'Not sure'], rows)
+    timings = dict(default_timings)
+
+    start = time.perf_counter()
+    bcu.CountCube.build(df, ['var'], list(dims))
+    timings['count_cell'] = (time.perf_counter() - start) / (rows * (1 + len(dims)))
+
+    table = pd.DataFrame(rng.integers(0, 100, (30, 10)))
+    with tempfile.TemporaryDirectory() as folder:
+        file_path = os.path.join(folder, 'calibration.xlsx')
+        table.to_excel(file_path, sheet_name='0')
+        seconds = []
+        for i in range(1, 6):
+            start = time.perf_counter()
+            with pd.ExcelWriter(file_path, engine='openpyxl', mode='a', if_sheet_exists='overlay') as writer:
+                table.to_excel(writer, sheet_name=str(i))
+            seconds.append(time.perf_counter() - start)
+        timings['sheet_reload'] = max((seconds[-1] - seconds[0]) / (len(seconds) - 1), 0)
+        timings['sheet'] = seconds[0] - timings['sheet_reload']
+
+        seconds = {}
+        for resolution in (dpi / 4, dpi):
+            fig = Figure(figsize=plot_size)
+            FigureCanvasAgg(fig)
+            ax = fig.add_subplot()
+            ax.bar(range(5), rng.integers(0, 100, 5))
+            ax.set_title('Calibration')
+            start = time.perf_counter()
+            fig.savefig(os.path.join(folder, 'calibration.png'), bbox_inches='tight', dpi=resolution)
+            seconds[resolution] = time.perf_counter() - start
+        pixels = {resolution: plot_size[0] * plot_size[1] * resolution ** 2 for resolution in seconds}
+        timings['plot_pixel'] = max((seconds[dpi] - seconds[dpi / 4]) / (pixels[dpi] - pixels[dpi / 4]), 0)
+        timings['plot'] = max(seconds[dpi] - timings['plot_pixel'] * pixels[dpi], 0)
+
+    start = time.perf_counter()
+    stats.chi2_contingency(pd.crosstab(df['a2'], df['var']))
+    timings['test_cell'] = (time.perf_counter() - start) / rows
+    print("The timings have been calibrated: " + ', '.join(f"{k} {v:.2g}s" for k, v in timings.items()))
+    return timings
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@author: Bodhi Global Analysis (Jungyeon Lee)
+"""
+
+import os
+import pandas as pd
+
+# Columns of the long-format results table
+result_columns = ['run', 'country', 'indicator', 'table', 'variable', 'description', 'breakdown', 'group', 'category', 'count', 'percentage', 'n']
+
+
+def category_labels(indicator, overall, categories):
+    """
+    - To label the categories of a table as its sheet does: var_change (by position for a multi-table, see multi_format)
+      and tuples of values joined as in the plots
+    indicator: indicator class, Indicator of the table (bodhi_indicator)
+    overall: Series/Dataframe, Overall counts of the indicator (the rows a multi-table is labelled in)
+    categories: Index, Categories to label
+    """
+    if indicator.var_change is not None:
+        if indicator.var_type == 'multi':
+            change = dict(zip(overall.index, indicator.var_change.values()))
+        else:
+            change = indicator.var_change
+        categories = [change.get(category, category) for category in categories]
+    return pd.Index([''.join(map(str, category)) if isinstance(category, tuple) else category for category in categories])
+
+def long_format(partial, run):
+    """
+    - To convert the tables of a run into one long-format table (one row per table, breakdown group and category)
+    - Overall counts have the breakdown 'Overall' and the group 'All', the tables of a multi-table indicator have
+      their own sheet name in the table column
+    partial: PartialAggregate, Partial aggregate of the run (bodhi_partials)
+    run: str, Name of the pipeline run (e.g. date of the run)
+    """
+    frames = []
+    for sheet_name, table in partial.tables.items():
+        cube = table['counts'].get('cube')
+        if cube is None:
+            continue
+        indicator = table['indicator']
+        tables = [('Overall', cube.table(None).rename(columns={'Count': 'All'}))]
+        if indicator.breakdown is not None:
+            for col, name in indicator.breakdown.items():
+                tables.append((name, cube.table(col)))
+        for breakdown, counts in tables:
+            counts = counts.set_axis(category_labels(indicator, table['counts']['overall'], counts.index), axis=0)
+            n = counts.sum(axis=0)
+            long = counts.rename_axis(index='category', columns='group').stack().rename('count').reset_index()
+            long['n'] = long['group'].map(n).astype(int)
+            long['percentage'] = round(long['count'] / long['n'].where(long['n'] > 0) * 100, 1)
+            long['breakdown'] = breakdown
+            long['indicator'] = indicator.indicator_name
+            long['table'] = sheet_name
+            long['variable'] = cube.var
+            long['description'] = indicator.description
+            frames.append(long)
+    if not frames:
+        return pd.DataFrame(columns=result_columns)
+    results = pd.concat(frames, ignore_index=True)
+    results['run'] = run
+    results['country'] = partial.label
+    results['category'] = results['category'].astype(str)
+    results['group'] = results['group'].astype(str)
+    return results[result_columns]
+
+def append_results(results, file_path):
+    """
+    - To append long-format results to a CSV file or a Parquet dataset (created with the first run)
+    - A Parquet dataset is a folder with one part file per run, read at once with pd.read_parquet(file_path)
+    results: Dataframe, Long-format results (long_format)
+    file_path: str, Directory of the CSV file or of the Parquet folder (.csv or .parquet)
+    """
+    if file_path.endswith('.parquet'):
+        if os.path.isfile(file_path):
+            print(f"{file_path} is a single Parquet file, please use a new name for the results dataset")
+            return False
+        os.makedirs(file_path, exist_ok=True)
+        parts = [name for name in os.listdir(file_path) if name.endswith('.parquet')]
+        part = os.path.join(file_path, f'part-{len(parts):05d}.parquet')
+        tmp = f'{part}.tmp'
+        results.to_parquet(tmp, index=False)
+        os.replace(tmp, part)
+        return True
+    if os.path.exists(file_path) and list(pd.read_csv(file_path, nrows=0).columns) != list(results.columns):
+        print(f"{file_path} has other columns than the results, please use a new results file")
+        return False
+    results.to_csv(file_path, mode='a', header=not os.path.exists(file_path), index=False, encoding='utf-8')
+    return True
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@author: Bodhi Global Analysis (Jungyeon Lee)
+"""
+
+import numpy as np
+import pandas as pd
+
+
+def _values(values):
+    """
+    - To get the values of a condition as a list (one value or a list of values)
+    """
+    return list(values) if isinstance(values, (list, tuple, set)) else [values]
+
+
+class BitmapIndex:
+
+    def __init__(self, df, columns=None, max_values=100):
+        """
+        - Initialise the bitmap index of a dataset (one packed row bitmap per value of each column, built once)
+        - Bit i of a bitmap is set when row i has the value, conditions are resolved with bitwise AND/OR of the
+          bitmaps instead of comparing and copying the columns again for every indicator
+        - Missing values are not indexed
+
+        df: Dataframe, Dataset to index
+        columns: list, Columns to index (by default, all columns with at most max_values different values)
+        max_values: int, Largest number of different values of a column indexed by default
+        """
+        self.df = df
+        self.size = len(df)
+        self.bitmaps = {}
+        for col in (df.columns if columns is None else columns):
+            try:
+                codes, values = pd.factorize(df[col])
+            except TypeError:
+                # Columns of unhashable values (e.g. lists) are compared with the dataset when needed
+                continue
+            if columns is None and len(values) > max_values:
+                continue
+            self.bitmaps[col] = {value: np.packbits(codes == code, bitorder='little') for code, value in enumerate(values)}
+        print(f"The dataset has been indexed: {len(self.bitmaps)} columns, {self.nbytes() / 1024:.0f} KB of bitmaps")
+
+    def bitmap(self, col, values):
+        """
+        - To get the bitmap of the rows having one of the values in a column (OR of the value bitmaps)
+        - Columns which are not indexed are compared with the dataset
+        col: str, Column
+        values: str/list, Value or list of values
+        """
+        if col not in self.bitmaps:
+            return np.packbits(self.df[col].isin(_values(values)).to_numpy(), bitorder='little')
+        bits = np.zeros((self.size + 7) // 8, dtype=np.uint8)
+        for value in _values(values):
+            if value in self.bitmaps[col]:
+                bits |= self.bitmaps[col][value]
+        return bits
+
+    def select(self, where):
+        """
+        - To get the bitmap of the rows meeting all the conditions (AND of the column bitmaps)
+        where: dic, Values to keep for each column {'col1': 'value', 'col2': ['value1', 'value2']}
+        """
+        bits = np.full((self.size + 7) // 8, 255, dtype=np.uint8)
+        for col, values in where.items():
+            bits &= self.bitmap(col, values)
+        return bits
+
+    def mask(self, where):
+        """
+        - To get the rows meeting the conditions as a boolean array (one entry per row of the dataset)
+        where: dic, Values to keep for each column (see select)
+        """
+        return np.unpackbits(self.select(where), count=self.size, bitorder='little').astype(bool)
+
+    def rows(self, where):
+        """
+        - To get the positions of the rows meeting the conditions, e.g. for add_plan(plan, df, rows=...)
+        where: dic, Values to keep for each column (see select)
+        """
+        return np.flatnonzero(self.mask(where))
+
+    def count(self, where):
+        """
+        - To count the rows meeting the conditions
+        where: dic, Values to keep for each column (see select)
+        """
+        return int(np.unpackbits(self.select(where), count=self.size, bitorder='little').sum(dtype=np.int64))
+
+    def nbytes(self):
+        """
+        - To get the memory used by the bitmaps (bytes)
+        """
+        return sum(bits.nbytes for bitmaps in self.bitmaps.values() for bits in bitmaps.values())
@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@author: Bodhi Global Analysis (Jungyeon Lee)
+"""
+
+import copy
+import numpy as np
+import pandas as pd
+
+
+def _union(first, second):
+    """
+    - To combine two indices, keeping the order of the first one
+    """
+    union = first.append(second).unique()
+    return union if isinstance(union, pd.Index) else pd.Index(union)
+
+def _sorted(index):
+    """
+    - To check if the labels of an index are sorted (labels which cannot be compared are not)
+    """
+    try:
+        return index.is_monotonic_increasing
+    except TypeError:
+        return False
+
+def _labels(first, second, keep_sorted):
+    """
+    - To combine the labels of two count tables (see add_counts)
+    """
+    union = _union(first, second)
+    if keep_sorted and _sorted(first) and _sorted(second):
+        try:
+            return pd.Index(sorted(union), name=union.name)
+        except TypeError:
+            pass
+    return union
+
+def add_counts(first, second, keep_sorted=False):
+    """
+    - To add two count tables (Series or Dataframes), keeping the order of the categories
+    - Labels are kept in the order they are first seen (e.g. the variables of a multi-table, labelled by position)
+    keep_sorted: bool, Sort the labels of an axis when they are sorted in both tables, e.g. the categories and groups of a
+                 breakdown table, which are sorted in a direct run unless they follow an order (var_order, categories)
+    """
+    if first is None:
+        return second.copy()
+    if second is None:
+        return first.copy()
+    index = _labels(first.index, second.index, keep_sorted)
+    if isinstance(first, pd.DataFrame):
+        columns = _labels(first.columns, second.columns, keep_sorted)
+        # Both tables are aligned first: a cell missing from both (e.g. a category and a group seen in different runs) is 0
+        total = first.reindex(index=index, columns=columns, fill_value=0) + second.reindex(index=index, columns=columns, fill_value=0)
+    else:
+        total = first.reindex(index, fill_value=0) + second.reindex(index, fill_value=0)
+    return total.astype(first.values.dtype if np.issubdtype(first.values.dtype, np.integer) else float)
+
+def moments(values, groups=None):
+    """
+    - To calculate the sufficient statistics of a numeric variable (n, sum, sum of squares, min, max)
+    - Returns one row per group (a single 'All' row without groups)
+    values: series, Numeric values (missing values are ignored)
+    groups: series, Groups to calculate the statistics for (None for all values)
+    """
+    values = pd.to_numeric(values, errors='coerce')
+    if groups is None:
+        groups = pd.Series('All', index=values.index)
+    frame = pd.DataFrame({'value': values.values, 'square': values.values ** 2})
+    grouped = frame.groupby(groups.values, sort=False, dropna=False)
+    result = pd.DataFrame({'n': grouped['value'].count(), 'sum': grouped['value'].sum(),
+                           'sumsq': grouped['square'].sum(), 'min': grouped['value'].min(),
+                           'max': grouped['value'].max()})
+    return result.reindex(pd.unique(groups.values))
+
+def add_moments(first, second):
+    """
+    - To combine the sufficient statistics of two datasets (see moments)
+    """
+    if first is None:
+        return second.copy()
+    index = _union(first.index, second.index)
+    first = first.reindex(index)
+    second = second.reindex(index)
+    total = first[['n', 'sum', 'sumsq']].fillna(0) + second[['n', 'sum', 'sumsq']].fillna(0)
+    total['min'] = pd.concat([first['min'], second['min']], axis=1).min(axis=1)
+    total['max'] = pd.concat([first['max'], second['max']], axis=1).max(axis=1)
+    return total
+
+
+class PartialAggregate:
+
+    def __init__(self, label):
+        """
+        - Initialise the partial aggregate of a run (mergeable counts and sufficient statistics)
+        - Partial aggregates of several runs (e.g. countries) are summed to produce an overall report
+
+        label: str, Name of the run (e.g. country)
+        """
+        self.label = label
+        self.tables = {}
+        self.tests = {}
+
+    def add_table(self, sheet_name, indicator, var_name, counts):
+        """
+        - To record the counts of an indicator table
+        sheet_name: str, Name of the sheet
+        indicator: indicator class, Indicator from indicator class (bodhi_indicator)
+        var_name: str, Index name of the multi-table
+        counts: dic, Counts of the table {'overall': counts, 'breakdown': {col: counts by category and group}, 'cube': count cube}
+        """
+        self.tables[sheet_name] = {'indicator': _snapshot(indicator), 'var_name': var_name, 'counts': counts}
+
+    def add_test(self, sheet_name, indicator, statistics):
+        """
+        - To record the sufficient statistics of a statistical test
+        sheet_name: str, Name of the sheet
+        indicator: indicator class, Indicator from indicator class (bodhi_indicator)
+        statistics: dic, {'overall': moments, 'groups': {col: moments by category}, 'crosstab': {col: crosstab}}
+        """
+        self.tests[sheet_name] = {'indicator': _snapshot(indicator), 'statistics': statistics}
+
+    def save(self, file_path):
+        """
+        - To save the partial aggregate (e.g. to merge runs from several processes)
+        file_path: str, Directory of the file (.pkl)
+        """
+        pd.to_pickle(self, file_path)
+        return True
+
+    @classmethod
+    def merge(cls, partials, label):
+        """
+        - To sum the partial aggregates of several runs
+        partials: list, Partial aggregates (PartialAggregate)
+        label: str, Name of the merged run (e.g. 'Overall', 'West Africa')
+        """
+        merged = cls(label)
+        for partial in partials:
+            for sheet_name, table in partial.tables.items():
+                current = merged.tables.get(sheet_name)
+                if current is None:
+                    merged.tables[sheet_name] = {'indicator': table['indicator'], 'var_name': table['var_name'],
+                                                 'counts': {'overall': table['counts']['overall'].copy(),
+                                                            'breakdown': _copy_breakdown(table['counts']['breakdown']),
+                                                            'cube': table['counts'].get('cube')}}
+                    continue
+                counts = current['counts']
+                counts['overall'] = add_counts(counts['overall'], table['counts']['overall'])
+                if table['counts']['breakdown'] is not None:
+                    breakdown = counts['breakdown'] if counts['breakdown'] is not None else {}
+                    for col, count_df in table['counts']['breakdown'].items():
+                        breakdown[col] = add_counts(breakdown.get(col), count_df, keep_sorted=True)
+                    counts['breakdown'] = breakdown
+                if table['counts'].get('cube') is not None:
+                    cube = counts.get('cube')
+                    counts['cube'] = table['counts']['cube'] if cube is None else cube.merge(table['counts']['cube'])
+
+            for sheet_name, test in partial.tests.items():
+                current = merged.tests.get(sheet_name)
+                statistics = test['statistics']
+                if current is None:
+                    merged.tests[sheet_name] = {'indicator': test['indicator'], 'statistics': copy.deepcopy(statistics)}
+                    continue
+                total = current['statistics']
+                total['overall'] = add_moments(total['overall'], statistics['overall'])
+                for col, group_moments in statistics['groups'].items():
+                    total['groups'][col] = add_moments(total['groups'].get(col), group_moments)
+                for col, crosstab in statistics['crosstab'].items():
+                    total['crosstab'][col] = add_counts(total['crosstab'].get(col), crosstab, keep_sorted=True)
+        print(f"{label}: {len(merged.tables)} tables and {len(merged.tests)} tests have been merged from {', '.join(str(p.label) for p in partials)}")
+        return merged
+
+
+def _snapshot(indicator):
+    """
+    - To keep the settings of an indicator without its data
+    """
+    snapshot = copy.copy(indicator)
+    snapshot.df = None
+    snapshot.rows = None
+    snapshot.condition = None
+    return snapshot
+
+def _copy_breakdown(breakdown):
+    if breakdown is None:
+        return None
+    return {col: count_df.copy() for col, count_df in breakdown.items()}
+
+def load_partial(file_path):
+    """
+    - To load a partial aggregate saved with PartialAggregate.save
+    file_path: str, Directory of the file (.pkl)
+    """
+    return pd.read_pickle(file_path)
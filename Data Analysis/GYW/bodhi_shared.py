@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@author: Bodhi Global Analysis (Jungyeon Lee)
+"""
+
+import os
+import re
+import pandas as pd
+import bodhi_data_analysis as bodhi
+import bodhi_workers as bw
+
+# Memory-mapped tables and other columns of this process {file: (modification time, data)}, opened once per worker
+_mapped = {}
+_others = {}
+
+
+def _arrow():
+    """
+    - To import pyarrow (only needed for shared datasets)
+    """
+    try:
+        import pyarrow
+        import pyarrow.ipc
+    except ImportError:
+        raise ImportError("Please install pyarrow to share the dataset with worker processes")
+    return pyarrow
+
+def _table(file_path):
+    """
+    - To memory-map an Arrow IPC file (no data is read until columns are converted)
+    """
+    mtime = os.path.getmtime(file_path)
+    if file_path not in _mapped or _mapped[file_path][0] != mtime:
+        pa = _arrow()
+        _mapped[file_path] = (mtime, pa.ipc.open_file(pa.memory_map(file_path, 'r')).read_all())
+    return _mapped[file_path][1]
+
+def _other_columns(file_path):
+    """
+    - To read the pickle of the columns Arrow cannot hold, once per worker
+    """
+    mtime = os.path.getmtime(file_path)
+    if file_path not in _others or _others[file_path][0] != mtime:
+        _others[file_path] = (mtime, pd.read_pickle(file_path))
+    return _others[file_path][1]
+
+
+class SharedDataset:
+
+    def __init__(self, file_path, columns, others=None):
+        """
+        - Initialise the shared dataset (a small handle sent to the workers instead of the dataframe)
+
+        file_path: str, Directory of the Arrow IPC file of the dataset (see publish)
+        columns: list, Columns of the dataset
+        others: str, Directory of the columns Arrow cannot hold (pickle), None if there are none
+        """
+        self.file_path = file_path
+        self.columns = columns
+        self.others = others
+
+    def attach(self, columns=None, rows=None):
+        """
+        - To get columns and rows of the dataset as a dataframe
+        - The file is memory-mapped: only the selected columns and rows are converted, nothing else is read
+        columns: list, Columns to get (all columns by default, unknown columns are left out)
+        rows: array, Row positions to get (all rows by default)
+        """
+        table = _table(self.file_path)
+        other_columns = _other_columns(self.others) if self.others is not None else pd.DataFrame(index=range(table.num_rows))
+        columns = self.columns if columns is None else columns
+        names = [col for col in columns if col in table.column_names]
+        table = table.select(names)
+        if rows is not None:
+            table = table.take(_arrow().array(rows, type='int64'))
+        # Columns are kept as separate blocks: numbers without missing values are not copied out of the mapped file
+        df = table.to_pandas(split_blocks=True)
+        others = [col for col in columns if col in other_columns.columns and col not in names]
+        if others:
+            values = other_columns[others] if rows is None else other_columns[others].iloc[rows]
+            df = pd.concat([df, values.reset_index(drop=True)], axis=1)
+        return df[[col for col in columns if col in df.columns]]
+
+
+def publish(df, file_path):
+    """
+    - To write the dataset once as an uncompressed Arrow IPC (Feather) file, which workers memory-map
+    - Column types (including categories) are kept. Columns Arrow cannot hold (e.g. numbers and text mixed
+      in one column) are saved in a pickle next to the file
+    df: Dataframe, Dataset to share
+    file_path: str, Directory of the file (.arrow)
+    """
+    pa = _arrow()
+    others = []
+    for col in df.columns:
+        try:
+            pa.Table.from_pandas(df[[col]], preserve_index=False)
+        except (pa.ArrowInvalid, pa.ArrowTypeError, TypeError):
+            others.append(col)
+    table = pa.Table.from_pandas(df.drop(columns=others).reset_index(drop=True), preserve_index=False)
+    tmp = f'{file_path}.tmp'
+    with pa.OSFile(tmp, 'wb') as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    os.replace(tmp, file_path)
+    other_path = None
+    if others:
+        other_path = f'{file_path}.others.pkl'
+        df[others].reset_index(drop=True).to_pickle(other_path)
+        print(f"Columns kept outside the shared file (mixed types): {others}")
+    print(f"The dataset ({len(df)} data points, {len(df.columns)} columns) has been shared: {file_path}")
+    return SharedDataset(file_path, list(df.columns), other_path)
+
+def condition_columns(condition):
+    """
+    - To list the names used by a string condition (`quoted names` and identifiers, names which are not columns are left out by attach)
+    condition: str, Condition of an indicator, e.g. "age > 25 and `a2` == 'Male'"
+    """
+    names = re.findall(r'`([^`]+)`', condition)
+    expression = re.sub(r'`[^`]+`|"[^"]*"|\'[^\']*\'', ' ', condition)
+    names += [name for name in re.findall(r'(?<![\w.])[A-Za-z_]\w*', expression) if name not in ('and', 'or', 'not', 'in', 'True', 'False')]
+    return list(dict.fromkeys(names))
+
+def plan_columns(plan):
+    """
+    - To list the dataset columns used by the indicators of a plan (a worker only converts these columns)
+    plan: IndicatorPlan, Compiled indicator definitions (bodhi_plan)
+    """
+    columns = []
+    for spec in plan:
+        columns += spec.bind(None).columns()
+        if isinstance(spec.condition, str):
+            columns += condition_columns(spec.condition)
+        elif isinstance(spec.condition, tuple):
+            columns += [col for col, _ in spec.condition]
+    return list(dict.fromkeys(columns))
+
+def plan_partial(dataset, plan, label, rows=None):
+    """
+    - To count the tables and test statistics of a plan on rows of a shared dataset (run in a worker)
+    - Returns the partial aggregate of the run (bodhi_partials), only counts are sent back
+    dataset: SharedDataset, Shared dataset (see publish)
+    plan: IndicatorPlan, Compiled indicator definitions (bodhi_plan)
+    label: str, Name of the run (e.g. country)
+    rows: array, Row positions of the run (None for all rows)
+    """
+    df = dataset.attach(plan_columns(plan), rows)
+    tool = bodhi.Data_analysis(label, plan.bind(df))
+    tool.indicator_analysis()
+    tool.partial_counts()
+    tool.partial.label = label
+    return tool.partial
+
+def plan_partials(dataset, plan, groups, workers=None):
+    """
+    - To count a plan on several groups of rows at once, one task per group
+    - Returns {group: partial aggregate} in the order of the groups
+    dataset: SharedDataset, Shared dataset (see publish)
+    plan: IndicatorPlan, Compiled indicator definitions (bodhi_plan)
+    groups: dic, Row positions of each group {group: rows} (None for all rows)
+    workers: int, Number of workers (all cores by default)
+    """
+    workers = workers or os.cpu_count() or 1
+    partials = bw.run([(plan_partial, (dataset, plan, label, rows)) for label, rows in groups.items()], workers)
+    return dict(zip(groups, partials))
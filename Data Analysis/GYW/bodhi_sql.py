@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@author: Bodhi Global Analysis (Jungyeon Lee)
+"""
+
+import threading
+import numpy as np
+import pandas as pd
+import bodhi_cube as bcu
+
+
+def _duckdb():
+    """
+    - To import DuckDB (only needed for the SQL backend)
+    """
+    try:
+        import duckdb
+    except ImportError:
+        raise ImportError("Please install duckdb to use the SQL backend (or use the default pandas backend)")
+    return duckdb
+
+def _name(col):
+    """
+    - To quote a column name for SQL
+    """
+    return '"' + str(col).replace('"', '""') + '"'
+
+def _sorted(values):
+    """
+    - To sort the values of a column like pd.factorize(sort=True) (unsortable values keep their order)
+    """
+    values = pd.Index(values).dropna().unique()
+    try:
+        return pd.Index(sorted(values))
+    except TypeError:
+        return values
+
+
+class SQLBackend:
+
+    def __init__(self, threads=None):
+        """
+        - Initialise the SQL backend (counts of the indicator tables calculated by an in-process DuckDB database)
+        - The dataset of each table is scanned in place (no copy) and counted with multi-threaded grouped queries
+
+        threads: int, Number of threads of the database (all cores by default)
+        """
+        self.con = _duckdb().connect(database=':memory:')
+        # The dataset of a query is registered as 'data': tables counted in threads (indicator scheduler) take turns
+        self.lock = threading.RLock()
+        if threads is not None:
+            self.con.execute(f'SET threads TO {int(threads)}')
+
+    def query(self, df, sql):
+        """
+        - To run a query on a dataframe (available as the table 'data')
+        df: Dataframe, Dataset of the query
+        sql: str, Query
+        """
+        with self.lock:
+            self.con.register('data', df)
+            try:
+                return self.con.execute(sql).fetchdf()
+            finally:
+                self.con.unregister('data')
+
+    def counts(self, df, var, dims, multi_var=None, categories=None):
+        """
+        - To count a table with one query: GROUPING SETS over the variable with all breakdown columns (count cube)
+          and the variable alone (overall counts)
+        - Returns (overall counts, count cube), the same as the pandas backend
+        df: Dataframe, Dataset of the table
+        var: list, Variable of the table
+        dims: list, Breakdown columns
+        multi_var: list, Variables of the multi-table (None for single variables)
+        categories: list, Categories of the multi-table
+        """
+        as_frame = isinstance(var, list)
+        var = var[0] if as_frame else var
+        columns = [var] + list(dims)
+        # Categorical columns are counted on their codes (ENUM columns only take text categories)
+        data = pd.DataFrame({f'c{i}': (df[col].cat.codes.where(df[col].cat.codes >= 0) if isinstance(df[col].dtype, pd.CategoricalDtype)
+                                       else df[col]) for i, col in enumerate(columns)})
+        names = ', '.join(f'c{i}' for i in range(len(columns)))
+        sets = f'({names}), (c0)' if dims else '(c0)'
+        result = self.query(data, f"""
+            SELECT {names}, GROUPING({names}) AS grouping_id, count(*) AS n
+            FROM data
+            GROUP BY GROUPING SETS ({sets})
+        """)
+        # The full grouping set has the id 0, the variable alone has all the bits of the breakdown columns
+        full = result[result['grouping_id'] == 0]
+        alone = result[result['grouping_id'] == (1 << len(dims)) - 1]
+
+        codes = []
+        levels = []
+        all_levels = []
+        for i, col in enumerate(columns):
+            if isinstance(df[col].dtype, pd.CategoricalDtype):
+                level = df[col].cat.categories
+                all_levels.append(True)
+            else:
+                level = _sorted(full[f'c{i}'])
+                all_levels.append(False)
+            level_codes = self.codes(full[f'c{i}'], level, all_levels[-1])
+            codes.append(level_codes if i == 0 else np.where(level_codes < 0, len(level), level_codes))
+            levels.append(level)
+        shape = [len(levels[0])] + [len(level) + 1 for level in levels[1:]]
+        valid = codes[0] >= 0
+        flat = np.ravel_multi_index([c[valid] for c in codes], shape)
+        counts = np.bincount(flat, weights=full['n'].values[valid], minlength=int(np.prod(shape)))
+        cube = bcu.CountCube(var, levels[0], dims, levels[1:], counts.astype(np.int64).reshape(shape), all_levels)
+
+        if multi_var is not None:
+            overall = self.multi_counts(df, multi_var, categories)
+        else:
+            # Counts in the order of the categories, then sorted like value_counts
+            index = pd.CategoricalIndex(levels[0], dtype=df[var].dtype) if all_levels[0] else levels[0]
+            alone_codes = self.codes(alone['c0'], levels[0], all_levels[0])
+            counts = np.bincount(alone_codes[alone_codes >= 0], weights=alone['n'].values[alone_codes >= 0], minlength=len(levels[0]))
+            overall = pd.Series(counts.astype(np.int64), index=index, name='count')
+            if not all_levels[0]:
+                overall = overall[overall > 0]
+            overall.index = pd.MultiIndex.from_arrays([overall.index], names=[var]) if as_frame else overall.index.rename(var)
+            overall = overall.sort_values(ascending=False)
+        return overall, cube
+
+    def codes(self, values, level, categorical):
+        """
+        - To convert the values of a query result into positions in the levels of a column (missing values are -1)
+        values: series, Values of the query result (codes for categorical columns)
+        level: index, Levels of the column
+        categorical: True/False, Whether the column was counted on its categorical codes
+        """
+        if categorical:
+            return values.fillna(-1).astype(np.int64).values
+        return level.get_indexer(values)
+
+    def multi_counts(self, df, columns, categories):
+        """
+        - To count the categories of each variable of a multi-table
+        df: Dataframe, Dataset of the table
+        columns: list, Variables related to the indicator
+        categories: list, Categories of the indices
+        """
+        table = pd.DataFrame(index=categories)
+        with self.lock:
+            self.con.register('data', df)
+            try:
+                for col in columns:
+                    counts = self.con.execute(f"SELECT {_name(col)}, count(*) AS n FROM data WHERE {_name(col)} IS NOT NULL "
+                                              f"GROUP BY {_name(col)}").fetchdf().set_index(col)['n']
+                    table[col] = counts.reindex(categories, fill_value=0)
+            finally:
+                self.con.unregister('data')
+        return table
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@author: Bodhi Global Analysis (Jungyeon Lee)
+"""
+
+import json
+import math
+import os
+
+schema = 'https://vega.github.io/schema/vega-lite/v5.json'
+
+# Bodhi palette of the bar charts (same order as the PNG plots of bodhi_data_analysis)
+palette = ['#9a6512', '#133865', '#0c654c', '#3d618d', '#3f4a52', '#22196b']
+
+# Reference lines of the charts: (indicator attribute, label, colour)
+reference_lines = [('target', 'Target', 'red'), ('baseline', 'Baseline', 'blue'), ('midline', 'Midline', 'green')]
+
+
+def _label(value):
+    """
+    - To get the text of a category (tuples of an intersectional table are joined)
+    """
+    return ''.join(map(str, value)) if isinstance(value, tuple) else str(value)
+
+def _number(value):
+    """
+    - To convert a NumPy number into a JSON number (missing values are null)
+    """
+    value = value.item() if hasattr(value, 'item') else value
+    return None if isinstance(value, float) and math.isnan(value) else value
+
+def _lines(indicator):
+    """
+    - To get the reference lines (target, baseline, midline) of the indicator as a rule layer, None without lines
+    """
+    values = [{'line': label, 'value': _number(getattr(indicator, attribute))}
+              for attribute, label, _ in reference_lines if getattr(indicator, attribute) is not None]
+    if not values:
+        return None
+    return {'data': {'values': values},
+            'mark': {'type': 'rule', 'strokeDash': [4, 4], 'strokeWidth': 1},
+            'encoding': {'y': {'field': 'value', 'type': 'quantitative'},
+                         'stroke': {'field': 'line', 'type': 'nominal', 'title': 'Target',
+                                    'scale': {'domain': [label for _, label, _ in reference_lines],
+                                              'range': [colour for _, _, colour in reference_lines]}}}}
+
+def _chart(title, values, x_order, y_field, y_title, y_domain, color, text, lines, x_offset=None):
+    """
+    - To assemble a layered bar chart (bars, value labels and reference lines)
+    """
+    x = {'field': 'category', 'type': 'nominal', 'title': None, 'sort': x_order, 'axis': {'labelAngle': 0}}
+    y = {'field': y_field, 'type': 'quantitative', 'title': y_title}
+    if y_domain is not None:
+        y['scale'] = {'domain': y_domain}
+    encoding = {'x': x, 'y': y, 'color': color}
+    if x_offset is not None:
+        encoding['xOffset'] = x_offset
+    layers = [{'mark': 'bar', 'encoding': encoding},
+              {'mark': {'type': 'text', 'baseline': 'bottom', 'dy': -2, 'lineBreak': '\n'},
+               'encoding': dict(encoding, text={'field': text}, color={'value': 'black'})}]
+    if lines is not None:
+        layers.append(lines)
+    return {'$schema': schema, 'title': {'text': title.split('\n'), 'fontSize': 16},
+            'width': 720, 'height': 480, 'data': {'values': values}, 'layer': layers,
+            'resolve': {'scale': {'color': 'independent'}}}
+
+def overall_chart(indicator, df):
+    """
+    - To build the chart spec of the overall table (same content as plot_bar)
+    indicator: indicator class, Indicator from indicator class (bodhi_indicator)
+    df: Dataframe, General table (Count, Percentage)
+    """
+    if indicator.var_order != None:
+        df = df.loc[indicator.var_order]
+    df = df.dropna(subset=['Count', 'Percentage'])
+    total = df['Count'].sum()
+    values = []
+    for category, row in df.iterrows():
+        count, percentage = _number(row['Count']), _number(row['Percentage'])
+        if indicator.i_type == 'Count':
+            text = f'{count:.0f} ({count / total * 100:.1f}%)'
+        else:
+            text = f'{percentage:.1f}% ({int(count)})'
+        values.append({'category': _label(category), 'Count': count, 'Percentage': percentage, 'label': text})
+    order = [value['category'] for value in values]
+    color = {'field': 'category', 'type': 'nominal', 'title': 'Category', 'sort': order,
+             'scale': {'domain': order, 'range': [palette[i % len(palette)] for i in range(len(order))]}}
+    y_domain = [0, 105] if indicator.i_type == 'Percentage' else None
+    return _chart(indicator.description, values, order, indicator.i_type, indicator.i_type, y_domain, color, 'label', _lines(indicator))
+
+def breakdown_chart(indicator, df, colname, percent=False):
+    """
+    - To build the chart spec of a breakdown table (same content as breakdown_count_bar / breakdown_percentage_bar)
+    indicator: indicator class, Indicator from indicator class (bodhi_indicator)
+    df: Dataframe, Disaggregated counts or percentages (categories x groups)
+    colname: str, Reference column for the breakdown
+    percent: True/False, Whether df has percentages (percentage chart) or counts (count chart)
+    """
+    breakdown = indicator.breakdown[colname]
+    if indicator.var_order != None:
+        df = df.loc[indicator.var_order]
+    totals = df.sum(axis=0)
+    groups = [_label(group) for group in df.columns]
+    values = []
+    for category, row in df.iterrows():
+        for group, value in zip(groups, row):
+            value = _number(value)
+            if value is None:
+                text = ''
+            elif percent:
+                text = f'{value:.0f}%'
+            else:
+                share = value / totals.iloc[groups.index(group)] * 100 if totals.iloc[groups.index(group)] else 0
+                text = f'{value}\n({share:.1f}%)'
+            values.append({'category': _label(category), 'group': group, 'value': value, 'label': text})
+    color = {'field': 'group', 'type': 'nominal', 'title': breakdown, 'sort': groups,
+             'scale': {'domain': groups, 'range': [palette[i % len(palette)] for i in range(len(groups))]}}
+    lines = _lines(indicator) if indicator.i_type == ('Percentage' if percent else 'Count') else None
+    return _chart(f'{indicator.description}\nby {breakdown}', values, [_label(c) for c in df.index], 'value',
+                  'Percentage' if percent else 'Count', [0, 105] if percent else None, color, 'label', lines,
+                  x_offset={'field': 'group', 'sort': groups})
+
+def save_chart(spec, file_path):
+    """
+    - To save a chart spec as a Vega-Lite JSON file (rendered on demand, e.g. by the Vega editor, vega-embed or altair)
+    spec: dic, Chart spec
+    file_path: str, Directory of the file (.vl.json)
+    """
+    tmp = f'{file_path}.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(spec, f, ensure_ascii=False, default=str)
+    os.replace(tmp, file_path)
+    return file_path
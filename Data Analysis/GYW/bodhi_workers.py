@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@author: Bodhi Global Analysis (Jungyeon Lee)
+"""
+
+"""
+Worker processes of the bodhi modules
+- A worker is a new Python process running this file (python bodhi_workers.py tasks results): it only imports the
+  modules of its tasks, never the pipeline script, so workers can be started on every system and while other
+  threads of the pipeline are running (nothing is forked)
+- Tasks are (function, arguments) pairs of module-level functions, sent and returned through pickle files
+"""
+
+import os
+import sys
+import pickle
+import shutil
+import subprocess
+import tempfile
+
+
+def _environment():
+    """
+    - To get the environment of the workers: the modules found by this process are found by the workers
+    """
+    paths = [os.path.abspath(path or os.curdir) for path in sys.path]
+    return dict(os.environ, PYTHONPATH=os.pathsep.join(dict.fromkeys(paths)))
+
+def run(tasks, workers):
+    """
+    - To run tasks in worker processes (the tasks are shared out in turn, one batch per worker)
+    - Returns the results in the order of the tasks, the first failed task raises its error again
+    - The tasks are run one after another in this process when there is one worker or workers cannot be started
+    tasks: list, Tasks [(function, arguments)]
+    workers: int, Number of worker processes
+    """
+    workers = max(1, min(workers, len(tasks)))
+    if workers == 1:
+        return [function(*args) for function, args in tasks]
+    folder = tempfile.mkdtemp(prefix='bodhi_workers_')
+    try:
+        processes = []
+        try:
+            for worker in range(workers):
+                task_file = os.path.join(folder, f'tasks_{worker}.pkl')
+                with open(task_file, 'wb') as file:
+                    pickle.dump(tasks[worker::workers], file)
+                processes.append(subprocess.Popen([sys.executable, os.path.abspath(__file__), task_file, f'{task_file}.out'],
+                                                  env=_environment()))
+        except OSError as e:
+            for process in processes:
+                process.kill()
+                process.wait()
+            print(f"WARNING: worker processes cannot be started ({e}), {len(tasks)} tasks are run one after another", file=sys.stderr)
+            return [function(*args) for function, args in tasks]
+
+        for process in processes:
+            process.wait()
+        batches = []
+        for worker, process in enumerate(processes):
+            result_file = os.path.join(folder, f'tasks_{worker}.pkl.out')
+            if process.returncode != 0 or not os.path.exists(result_file):
+                raise RuntimeError(f"Worker process {worker} has stopped (exit code {process.returncode})")
+            with open(result_file, 'rb') as file:
+                batches.append(pickle.load(file))
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+
+    results = [None] * len(tasks)
+    for worker, batch in enumerate(batches):
+        for position, (done, result) in zip(range(worker, len(tasks), workers), batch):
+            if not done:
+                raise result
+            results[position] = result
+    return results
+
+
+if __name__ == '__main__':
+    with open(sys.argv[1], 'rb') as file:
+        tasks = pickle.load(file)
+    results = []
+    for function, args in tasks:
+        try:
+            results.append((True, function(*args)))
+        except Exception as e:
+            results.append((False, e))
+    with open(sys.argv[2], 'wb') as file:
+        pickle.dump(results, file)
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@author: Bodhi Global Analysis (Jungyeon Lee)
+"""
+
+"""
+Benchmarks for the data preprocessing pipeline
+- Run from this folder: python bodhi_benchmark.py [rows]
+"""
+import os
+import sys
+import tempfile
+import time
+import numpy as np
+import pandas as pd
+import bodhi_data_preprocessing as dp
+
+answers = ['1 - Not at all', '2 - Slightly', '3 - Moderately', '4 - A Lot', '5 - Extremely']
+# Other spellings of the answers and an answer out of the scale (read by the codebook, see bodhi_codebook)
+variants = ['4 - A LOT', '3 – Moderately', ' 5-Extremely', "Don't know"]
+countries = ['Sierra Leone', 'Ghana', 'Liberia', 'Mali', 'Kenya', 'Uganda', 'Ethiopia', 'Lebanon', 'Jordan']
+
+def synthetic_export(file_path, rows=200000, extra_cols=150, seed=0):
+    """
+    - To write a synthetic raw export with the columns used by the preprocessing steps and the indicators
+    - Returns the settings of Preprocessing for the export
+    file_path: str, Directory of the raw dataset (without the extension, saved as csv)
+    rows: int, Number of respondents
+    extra_cols: int, Number of other questions (a real export has a few hundred columns)
+    seed: int, Seed of the random answers
+    """
+    rng = np.random.default_rng(seed)
+
+    def choice(values, missing=0.0):
+        column = rng.choice(np.array(values, dtype=object), rows)
+        column[rng.random(rows) < missing] = None
+        return column
+
+    data = {'SubmissionDate': choice(['2024-07-18', '2024-07-19', '2024-07-22', '2024-07-23']),
+            'formhub-uuid': choice([f'form{i}' for i in range(3)]),
+            'start': choice([f'2024-07-{d} 10:{m:02d}' for d in range(18, 24) for m in range(60)]),
+            'today': choice(['2024-07-18', '2024-07-19', '2024-07-22', '2024-07-23']),
+            'country': choice(countries), 'cso': choice(['DCI', 'TdH', 'Yadnet', 'GIRL UP INITIATIVE UGANDA', 'Plan']),
+            'a1': choice([f'Respondent {i}' for i in range(rows // 2)])}
+    for col in ['a2', 'a3', 'a4', 'a6', 'a7', 'a8']:
+        data[col] = choice(['Option 1', 'Option 2', 'Option 3'], missing=0.01)
+    for col in ['a2_oth', 'closeout']:
+        data[col] = choice([f'Answer {i}' for i in range(50)], missing=0.9)
+    for col in ['a5_1', 'a5_2', 'a5_3', 'a5_4', 'a5_5', 'a5_6', 'b6_2', 'b8_1', 'b9_1', 'b9_3', 'b10_4']:
+        data[col] = rng.integers(0, 2, rows)
+    for col in ['b13a', 'b13b', 'b13c', 'b13d', 'b13e', 'b14a', 'b14b', 'b14c']:
+        data[col] = choice(answers * 9 + variants, missing=0.02)
+    data['f4'] = choice(['Yes – always', 'Yes – sometimes', 'No'])
+    for i in range(extra_cols):
+        data[f'q{i}'] = choice(['Yes', 'No', "Don't know"], missing=0.05)
+    pd.DataFrame(data).to_csv(f'{file_path}.csv', index=False)
+
+    cols = list(data)
+    return {'name': 'Benchmark', 'file_path': file_path, 'file_path_others': f'{file_path} others.xlsx',
+            'list_del_cols': ['SubmissionDate', 'formhub-uuid', 'start', 'today'], 'dates': ['2024-07-18'],
+            'miss_col': ['a2', 'a3', 'a4', 'a6', 'a7', 'a8'], 'anon_col': 'a1', 'identifiers': ['a1', 'start', 'formhub-uuid'],
+            'opened_cols': ['a2_oth', 'closeout'], 'cols_new': cols, 'new_cols_order': cols,
+            'diss_cols': ['a5_1', 'a5_2', 'a5_3', 'a5_4', 'a5_5', 'a5_6'], 'file_type': 'csv'}
+
+def engine_time(rows=200000, extra_cols=150):
+    """
+    - To compare the pandas and Polars engines on a synthetic raw export
+    - Both engines must give the same cleaned dataset (anonymised names are random, only their grouping is compared)
+    rows: int, Number of respondents of the synthetic export
+    extra_cols: int, Number of other questions
+    """
+    folder = tempfile.mkdtemp()
+    settings = synthetic_export(os.path.join(folder, 'export'), rows, extra_cols)
+    results = {}
+    for engine in ('pandas', 'polars'):
+        sweetgum = dp.Preprocessing(**settings, engine=engine)
+        start = time.perf_counter()
+        sweetgum.processing()
+        results[engine] = (time.perf_counter() - start, sweetgum.df)
+    for engine, (elapsed, df) in results.items():
+        print(f"{engine}: {elapsed:.3f}s for {rows} rows")
+
+    anon_col = settings['anon_col']
+    pandas_df, polars_df = results['pandas'][1], results['polars'][1]
+    same = (pandas_df.drop(columns=anon_col).equals(polars_df.drop(columns=anon_col))
+            and (pd.factorize(pandas_df[anon_col])[0] == pd.factorize(polars_df[anon_col])[0]).all())
+    print("Both engines give the same cleaned dataset" if same else "The engines give different cleaned datasets")
+    return same
+
+
+if __name__ == '__main__':
+    sys.exit(0 if engine_time(*map(int, sys.argv[1:2])) else 1)
@@ -12,22 +12,132 @@ Please download following Python Libraries:
 2. Numpy
 3. uuid
 4. openpyxl
+5. polars (only for engine='polars')
 """
 
+import glob
+import os
+import threading
 import pandas as pd
 import numpy as np
 import uuid
 from openpyxl import load_workbook
+import bodhi_bits as bb
+import bodhi_workers as bw
+import bodhi_codebook as bcb
+
+# Column with the name of the raw file of each data point (when several exports are combined)
+source_col = 'source_file'
+
+# Likert scale of the questionnaire, as written in the reports (other spellings are read as these labels, see bodhi_codebook)
+extent_scale = ['1 - Not at all', '2 - Slightly', '3 - Moderately', '4 - A Lot', '5 - Extremely']
+
+# Missing values of pandas.read_csv and rows used to infer the column types (Polars engine, see _read_polars)
+na_values = ['', '#N/A', '#N/A N/A', '#NA', '-1.#IND', '-1.#QNAN', '-NaN', '-nan', '1.#IND', '1.#QNAN', '<NA>', 'N/A',
+             'NA', 'NULL', 'NaN', 'None', 'n/a', 'nan', 'null']
+infer_rows = 10000
+
+def _read(file, file_type):
+    """
+    - To read one raw export
+    """
+    if file_type == 'csv':
+        return pd.read_csv(file)
+    return pd.read_excel(file)
+
+def _read_polars(pl, file):
+    """
+    - To read a csv export with Polars and the column types of pandas.read_csv
+    - The types are inferred from the first rows (from all rows when a later answer does not fit them), a column
+      without answers in those rows is numeric when all its answers are numbers
+    """
+    try:
+        df = pl.read_csv(file, infer_schema_length=infer_rows, null_values=na_values)
+    except pl.exceptions.ComputeError:
+        df = pl.read_csv(file, infer_schema_length=None, null_values=na_values)
+    sample = df.head(infer_rows)
+    for col in df.columns:
+        if df.schema[col] != pl.String or sample[col].null_count() < len(sample):
+            continue
+        for dtype in (pl.Int64, pl.Float64):
+            values = df[col].str.strip_chars().cast(dtype, strict=False)
+            if values.null_count() == df[col].null_count():
+                df = df.with_columns(values.alias(col))
+                break
+    return df
+
+def _write(df, path, file_type, background=False):
+    """
+    - To write a dataset (a failure of a background write is reported instead of raised)
+    """
+    try:
+        if file_type == 'csv':
+            df.to_csv(path, index=False)
+        else:
+            df.to_excel(path, index=False)
+    except Exception as e:
+        if not background:
+            raise
+        print(f"{path} has not been saved:", e)
+        return False
+    if background:
+        print(f"{path} has been saved")
+    return True
+
+def _write_polars(df, path, file_type):
+    """
+    - To write a Polars dataset in a background thread (a csv file is written by Polars, an Excel file by pandas)
+    """
+    if file_type != 'csv':
+        return _write(df.to_pandas(), path, file_type, True)
+    try:
+        df.write_csv(path)
+    except Exception as e:
+        print(f"{path} has not been saved:", e)
+        return False
+    print(f"{path} has been saved")
+    return True
+
+def _polars():
+    """
+    - To import Polars (only needed for the Polars engine)
+    """
+    try:
+        import polars
+    except ImportError:
+        raise ImportError("Please install polars to use the Polars engine (or use the default pandas engine)")
+    return polars
+
+def _equals(pl, schema, col, value):
+    """
+    - To compare a column with a value like pandas (missing values and values of another type are not equal)
+    """
+    if isinstance(value, str) != (schema[col] == pl.String):
+        return pl.lit(False)
+    return (pl.col(col) == value).fill_null(False)
+
+def _scores(pl, schema, col, score_map):
+    """
+    - To map the answers of a column to scores like bodhi_codebook.map_scores (the labels are normalised the same way,
+      answers out of the map are missing)
+    """
+    if schema[col] != pl.String:
+        return pl.lit(None, dtype=pl.Int64)
+    labels = (pl.col(col).str.to_lowercase().str.replace_all(bcb.dash_pattern, '-')
+              .str.replace_all(r'\s*-\s*', ' - ').str.replace_all(r'\s+', ' ').str.strip_chars())
+    return labels.replace_strict({bcb.normalise(label): score for label, score in score_map.items()}, default=None, return_dtype=pl.Int64)
 
 class Preprocessing:
     
     def __init__(self, name, file_path, file_path_others, list_del_cols, dates, miss_col, anon_col, identifiers, opened_cols, cols_new, new_cols_order, 
-                 age_col = None, diss_cols = None, del_type = 0, file_type='xlsx'):
+                 age_col = None, diss_cols = None, del_type = 0, file_type='xlsx', engine='pandas', codebook=None):
         """
         - Initialise the Performance Management Framework class
 
         name: str, Name of the project
-        file_path: str, Directory of the raw dataset
+        file_path: str/list, Directory of the raw dataset (excluding file extension)
+        -> A glob pattern ("Data/* Raw Dataset") or a list of directories combines several exports (e.g. one per country),
+           the outputs are then named after the project in the folder of the first export
         file_path_others: str, Directory of the opened-end questions' answers
         list_del_cols: list, Columns list for deleting
         dates: list, Dates on which the pilot test was conducted from the data
@@ -44,9 +154,18 @@ class Preprocessing:
         -> 1: First, remove columns where missing values make up 10% or more of the total data points
               Then, remove all remaining missing values from the columns where they are detected
         file_type: str, filetype of the raw dataset
+        engine: str, ['pandas' or 'polars']
+        -> pandas: Run each step on a pandas dataframe
+        -> polars: Run the steps as lazy Polars query plans (multi-threaded), the cleaned dataset is the same
+        codebook: Codebook, Likert scales and columns of the questionnaire (bodhi_codebook), see likert_codebook by default
         """
         self.name = name
-        self.file_path = file_path
+        self.raw_path = file_path
+        if isinstance(file_path, str) and not glob.has_magic(file_path):
+            self.file_path = file_path
+        else:
+            first = file_path if isinstance(file_path, str) else file_path[0]
+            self.file_path = os.path.join(os.path.dirname(first), name)
         self.file_path_others = file_path_others
         self.file_type = file_type
         self.list_del_cols = list_del_cols
@@ -60,25 +179,69 @@ class Preprocessing:
         self.age_col = age_col
         self.diss_cols = diss_cols
         self.del_type = del_type
+        self.engine = engine
+        self.codebook = codebook if codebook is not None else self.likert_codebook()
+        self.writers = []
         self.df = None
     
+    def raw_files(self):
+        """
+        - To list the raw exports (one file, a glob pattern or a list of files)
+        """
+        raw_path = self.raw_path
+        if isinstance(raw_path, str):
+            if glob.has_magic(raw_path):
+                return sorted(glob.glob(f"{raw_path}.{self.file_type}"))
+            raw_path = [raw_path]
+        return [f"{path}.{self.file_type}" for path in raw_path]
+
+    def relocate(self, folder):
+        """
+        - To resolve the directories of the settings from the folder of the data preprocessing, e.g. when the
+          preprocessing is run from the data analysis folder (absolute directories are kept)
+        folder: str, Folder the directories of the settings are relative to
+        """
+        folder = os.path.abspath(folder)
+        locate = lambda path: os.path.join(folder, path)
+        self.raw_path = locate(self.raw_path) if isinstance(self.raw_path, str) else [locate(path) for path in self.raw_path]
+        self.file_path = locate(self.file_path)
+        self.file_path_others = locate(self.file_path_others)
+        return True
+
     def data_load(self):
         """
         - To load a dataset
+        - The columns are checked against cols_new, several exports are read at once and combined with a source_file column
         """
-        file_path = self.file_path
         file_type = self.file_type
-        if file_type == 'xlsx' or file_type == 'xls':
-            df = pd.read_excel(f"{file_path}.{file_type}")
-            self.df = df
-            return True
-        elif file_type == 'csv':
-            df = pd.read_csv(f"{file_path}.{file_type}")
-            self.df = df
-            return True
-        else:
+        if file_type not in ('xlsx', 'xls', 'csv'):
             print("Please use 'xlsx', 'xls' or 'csv' file")
             return False
+        files = self.raw_files()
+        if len(files) == 0:
+            print(f"No raw dataset has been found: {self.raw_path}.{file_type}")
+            return False
+        # Excel files are parsed in Python, so several exports are read by worker processes (bodhi_workers)
+        frames = bw.run([(_read, (file, file_type)) for file in files], min(len(files), os.cpu_count() or 1))
+        columns = list(frames[0].columns)
+        if len(columns) != len(self.cols_new):
+            print(f"{files[0]} has {len(columns)} columns, cols_new has {len(self.cols_new)} names")
+            return False
+        if len(files) == 1:
+            self.df = frames[0]
+            return True
+        for file, frame in zip(files[1:], frames[1:]):
+            if list(frame.columns) != columns:
+                different = [col for col in frame.columns if col not in columns] + [col for col in columns if col not in frame.columns]
+                print(f"{file} does not have the same columns as {files[0]}: {different if different else 'different order'}")
+                return False
+        df = pd.concat(frames, ignore_index=True)
+        df[source_col] = np.repeat([os.path.basename(file) for file in files], [len(frame) for frame in frames])
+        for file, frame in zip(files, frames):
+            print(f"{os.path.basename(file)}: {len(frame)} data points")
+        print(f"{len(files)} raw datasets have been combined: {len(df)} data points")
+        self.df = df
+        return True
         
     def delete_columns(self):
         """
@@ -139,47 +302,42 @@ class Preprocessing:
         self.df = df_cleaned
         return True
     
-    def save_data(self):
+    def save_data(self, background=False):
         """
         - To save the new dataframe
+        background: True/False, Save a copy of the dataframe in a background thread (see wait)
         """
         df = self.df
         file_path = self.file_path
         file_type = self.file_type
-        if file_type == 'xlsx' or file_type == 'xls':
-            df.reset_index(drop=True, inplace = True)
-            df.to_excel(f"{file_path}.{file_type}", index=False)
-            self.df = df
-            print("The revised dataset has been saved")
-            return True
-        elif file_type == 'csv':
-            df.reset_index(drop=True, inplace = True)
-            df.to_csv(f"{file_path}.{file_type}", index=False)
-            self.df = df
-            print("The revised dataset has been saved")
-            return True
-        else: 
+        if file_type not in ('xlsx', 'xls', 'csv'):
             print("Please use 'xlsx', 'xls' or 'csv' file")
             return False
-        if file_type == 'xlsx':
-            df.reset_index(drop=True, inplace = True)
-            df.to_excel(f"{file_path}.{file_type}", index=False)
-            self.df = df
-            print("The revised dataset has been saved")
-            return True
-        elif file_type == 'csv':
-            df.reset_index(drop=True, inplace = True)
-            df.to_csv(f"{file_path}.{file_type}", index=False)
-            self.df = df
-            print("The revised dataset has been saved")
+        df.reset_index(drop=True, inplace = True)
+        self.df = df
+        if background:
+            writer = threading.Thread(target=_write, args=(df.copy(), f"{file_path}.{file_type}", file_type, True))
+            writer.start()
+            self.writers.append(writer)
+            print(f"The revised dataset is being saved in the background: {file_path}.{file_type}")
             return True
-        else: 
-            print("Please use 'xlsx' or 'csv' file")
-            return False
+        _write(df, f"{file_path}.{file_type}", file_type)
+        print("The revised dataset has been saved")
+        return True
+
+    def wait(self):
+        """
+        - To wait for the datasets being saved in the background
+        """
+        for writer in self.writers:
+            writer.join()
+        self.writers = []
+        return True
         
-    def data_anonymisation(self):
+    def data_anonymisation(self, background=False):
         """
         - To implement a dataframe anonymisation
+        background: True/False, Save the anonymised dataset in a background thread
         """
         df = self.df
         col1 = self.anon_col
@@ -193,7 +351,7 @@ class Preprocessing:
         df[col1], respondent_mapping = generate_unique_strings('respondent_', df[col1])
         original = self.file_path
         self.file_path = f'{file_path}_anonymised'
-        self.save_data()
+        self.save_data(background)
         self.file_path = original
         self.df = df
         print("The respondent name has been anonymised")
@@ -226,26 +384,27 @@ class Preprocessing:
         """
         df = self.df
         cols = self.opened_cols
+        unique_data = {col: df[col].dropna().unique() for col in cols}
+        self.open_ended_file(unique_data)
+        df = df.drop(columns=cols)
+        print(f'Number of columns: {len(df.columns)} | After removing the open-ended columns')
+        self.df = df
+        return True
+
+    def open_ended_file(self, unique_data):
+        """
+        - To save the answers of the opened-ended columns
+        unique_data: dic, Unique answers of each open-ended column {col: answers}
+        """
+        cols = self.opened_cols
         file_path = self.file_path_others
         empty_df = pd.DataFrame()
         with pd.ExcelWriter(file_path, engine='openpyxl') as writer:
             empty_df.to_excel(writer, sheet_name='basic', index=False)
-        
-            max_length = 0
-            unique_data = {}
-
-            for col in cols:
-                unique_values = df[col].dropna().unique()
-                unique_data[col] = unique_values
-                max_length = max(max_length, len(unique_values))
-        
             combined_df = pd.DataFrame({col: pd.Series(unique_data[col]) for col in cols})
             combined_df.to_excel(writer, sheet_name='open_ended', index=False)
         
         print(f"Open-ended columns have been saved to '{file_path}': {cols} ")
-        df = df.drop(columns=cols)
-        print(f'Number of columns: {len(df.columns)} | After removing the open-ended columns')
-        self.df = df
         return True
 
     def columns_redefine(self):
@@ -254,9 +413,20 @@ class Preprocessing:
         """
         df = self.df
         new_cols = self.cols_new
+        source = [source_col] if source_col in df.columns[len(new_cols):] else []
+        original_cols = [col for col in df.columns if col not in source]
+        df.columns = new_cols + source
+        self.columns_book(original_cols)
+        self.df = df
+        return True
+
+    def columns_book(self, original_cols):
+        """
+        - To save the new column names with the original ones
+        original_cols: list, Column names of the raw dataset
+        """
+        new_cols = self.cols_new
         file_path = f'{self.file_path}_columns_book.xlsx'
-        original_cols = list(df.columns)
-        df.columns = new_cols
     
         with pd.ExcelWriter(file_path, engine='openpyxl') as writer:
             empty_df = pd.DataFrame()
@@ -275,7 +445,6 @@ class Preprocessing:
                 worksheet.column_dimensions[col[0].column_letter].width = adjusted_width
 
         print(f"Column information has been saved: {file_path}")
-        self.df = df
         return True
     
     def re_order(self):
@@ -286,6 +455,8 @@ class Preprocessing:
         new_order = self.new_order
     
         cols_to_use = [col for col in new_order if col in df.columns]
+        if source_col in df.columns and source_col not in cols_to_use:
+            cols_to_use.append(source_col)
         df = df[cols_to_use]
     
         self.df = df
@@ -317,11 +488,9 @@ class Preprocessing:
         cols = ['a5_1', 'a5_2', 'a5_3', 'a5_4', 'a5_5', 'a5_6']
     
         try:
-            df['Disability'] = 'No Disability'
-    
-            df.loc[df['a5_5'] == 1, 'Disability'] = 'No Disability'
-    
-            df.loc[df[cols[:4]].eq(1).any(axis=1), 'Disability'] = 'Disability'
+            # The WG-SS answers are packed into one bitmask per respondent (bodhi_bits)
+            wgss = bb.OptionMask.pack(df, cols)
+            df['Disability'] = np.where(wgss.any(cols[:4]), 'Disability', 'No Disability')
     
             self.df = df
             print('New disability variable (Disability) has been created')
@@ -353,12 +522,11 @@ class Preprocessing:
         self.df = df
         return True
         
-    def indicator_calculation(self):
-
-        df = self.df
-        score_map = {'1 - Not at all': 1,'2 - Slightly': 2,'3 - Moderately': 3,'4 - A Lot': 4,'5 - Extremely': 5}
-        
-        cso_mapping = {
+    def cso_mapping(self):
+        """
+        - To get the standard names of the CSOs (different spellings of the same organisation in the raw dataset)
+        """
+        return {
 
     'DCI': 'Defence for Children International Ghana',
     'Defence for Children International-Ghana': 'Defence for Children International Ghana',
@@ -395,39 +563,52 @@ class Preprocessing:
     'GLOBAL LEARNING FOR SUSTAINABILITY': 'Global Learning for Sustainability (GLS)',
     'Global Learning for Sustainability(GLS)': 'Global Learning for Sustainability (GLS)'}
 
+    def likert_codebook(self):
+        """
+        - To get the codebook of the Likert questions (the scale is declared once, see extent_scale)
+        """
+        columns = ['b13a', 'b13b', 'b13c', 'b13d', 'b13e', 'b14a', 'b14b', 'b14c']
+        return bcb.Codebook({'extent': bcb.Scale(extent_scale)}, {col: 'extent' for col in columns})
+
+    def likert_codes(self):
+        """
+        - To code the Likert columns once with their scales (ordered categories, the indicators are scored from the codes)
+        - The labels which are not in the scales are listed (see Codebook.report)
+        """
+        self.df = self.codebook.compile(self.df)
+        self.codebook.report()
+        return True
+
+    def indicator_calculation(self):
 
-        df['cso'] = df['cso'].replace(cso_mapping)
+        df = self.df
+        
+        df['cso'] = df['cso'].replace(self.cso_mapping())
+        # Multi-select questions packed into bitmasks (bodhi_bits): b6_*, b8_*, b9_*, b10_*...
+        selected = bb.pack_questions(df, [col for col in df.columns if col.startswith('b')])
         
         # Outcome 2.2
-        df['Outcome2.2'] = df.apply(lambda row: 'Applicable' if row['b9_1'] == 1 or row['b9_3'] == 1 else 'Not applicable',axis=1)
+        df['Outcome2.2'] = np.where(selected['b9'].any(['b9_1', 'b9_3']), 'Applicable', 'Not applicable')
         
         # WRGE 2.2
-        df['WRGE2.2'] = df.apply(lambda row: 'Not applicable' if row['b6_2'] == 1 else 'Applicable',axis=1)
-        
-        # CA.2
-        for col in ['b13a', 'b13b', 'b13c', 'b13d', 'b13e']:
-            df[col + '_score'] = df[col].map(score_map)
+        df['WRGE2.2'] = np.where(selected['b6'].any(['b6_2']), 'Not applicable', 'Applicable')
         
-        df['CA.2'] = df[['b13a_score', 'b13b_score', 'b13c_score', 'b13d_score', 'b13e_score']].apply(
-            lambda x: 'Applicable' if  all(x >= 3) else 'Not applicable', axis=1)
-        df.drop(columns = ['b13a_score', 'b13b_score', 'b13c_score', 'b13d_score', 'b13e_score'], inplace = True)
+        # CA.2 (scores of the Likert codes, 0 for missing answers)
+        scores = self.codebook.scores(df, ['b13a', 'b13b', 'b13c', 'b13d', 'b13e'])
+        df['CA.2'] = np.where((scores >= 3).all(axis=1), 'Applicable', 'Not applicable')
         
         # PD.1
         df['PD.1'] = df.apply(lambda row: 'Applicable' if row['f4'] == "Yes – always" or row['f4'] == "Yes – sometimes" else 'Not applicable',axis=1)
 
         # LO.2
-        df['LO.2'] = df.apply(lambda row: 'Not applicable' if row['b8_1'] == 1 else 'Applicable',axis=1)
+        df['LO.2'] = np.where(selected['b8'].any(['b8_1']), 'Not applicable', 'Applicable')
 
         # WRGE5.1
-        for col in ['b14a', 'b14b', 'b14c']:
-            df[col + '_score'] = df[col].map(score_map)
-        
-        df['WRGE5.1'] = df[['b14a_score', 'b14b_score', 'b14c_score']].apply(
-            lambda x: 'Applicable' if  all(x >= 3) else 'Not applicable', axis=1)
-        df.drop(columns = ['b14a_score', 'b14b_score', 'b14c_score'], inplace = True)
+        scores = self.codebook.scores(df, ['b14a', 'b14b', 'b14c'])
+        df['WRGE5.1'] = np.where((scores >= 3).all(axis=1), 'Applicable', 'Not applicable')
         
         # SCS7
-        df['SCS7'] = df.apply(lambda row: 'Not applicable' if row['b10_4'] == 1 else 'Applicable',axis=1)
+        df['SCS7'] = np.where(selected['b10'].any(['b10_4']), 'Not applicable', 'Applicable')
         
             #lambda x: 'Applicable' if x.sum() >= 21 else 'Not applicable', axis=1)
         
@@ -435,7 +616,7 @@ class Preprocessing:
         print('All relevant indicators have been measured')        
 
         
-    def processing(self):
+    def processing(self, background=False):
         """
         - To conduct data pre-processing
         1. Load the raw dataset
@@ -447,14 +628,23 @@ class Preprocessing:
         7. Handle missing values
         8. Extract answers from open-ended questions
         9. Create age and disability groups
-        10. Save the cleaned dataset
+        10. Code the Likert answers with their scales (bodhi_codebook), the anonymised dataset keeps the raw answers
+        11. Save the cleaned dataset
+        background: True/False, Save the anonymised and cleaned datasets in background threads, self.df can be analysed
+                    in the meantime (see wait)
         """
-        self.data_load()
+        if self.engine == 'polars':
+            return self.processing_polars(background)
+        elif self.engine != 'pandas':
+            print("Please use 'pandas' or 'polars' engine")
+            return False
+        if not self.data_load():
+            return False
         self.columns_redefine()
         self.re_order()
         print(f'Initial data points: {len(self.df)}')
         self.duplicates()
-        self.data_anonymisation()
+        self.data_anonymisation(background)
         if len(self.dates) != 0:
             self.date_filter()
         print(f'Initial number of columns: {len(self.df.columns)}')
@@ -466,12 +656,285 @@ class Preprocessing:
             self.age_group()
         if self.diss_cols != None:
             self.disability()
+        self.likert_codes()
         self.indicator_calculation()
         original = self.file_path
         self.file_path = f'{self.file_path}_cleaned'
-        self.save_data()
+        self.save_data(background)
         self.file_path = original
         print("")
         print(f'Final number of data points: {len(self.df)}')
-        print(f"Cleaned dataframe has been saved: {self.file_path}_cleaned.{self.file_type}")
-        return True
\ No newline at end of file
+        if not background:
+            print(f"Cleaned dataframe has been saved: {self.file_path}_cleaned.{self.file_type}")
+        return True
+
+    # Polars engine: the same steps as lazy query plans (see processing_polars)
+
+    def lazy_load(self, pl):
+        """
+        - To load the raw dataset into a lazy Polars frame: a csv export is read by Polars (see _read_polars), an Excel
+          export is read by pandas
+        - Several exports are checked against the columns of cols_new and combined with a source_file column
+        """
+        if self.file_type != 'csv':
+            if not self.data_load():
+                return None
+            try:
+                return pl.from_pandas(self.df).lazy()
+            except Exception as e:
+                print('The raw dataset cannot be converted for the Polars engine:', e)
+                return None
+        files = self.raw_files()
+        if len(files) == 0:
+            print(f"No raw dataset has been found: {self.raw_path}.csv")
+            return None
+        try:
+            frames = [_read_polars(pl, file) for file in files]
+        except Exception as e:
+            print('The raw dataset cannot be read by the Polars engine:', e)
+            return None
+        columns = frames[0].columns
+        if len(columns) != len(self.cols_new):
+            print(f"{files[0]} has {len(columns)} columns, cols_new has {len(self.cols_new)} names")
+            return None
+        if len(files) == 1:
+            return frames[0].lazy()
+        for file, frame in zip(files[1:], frames[1:]):
+            if frame.columns != columns:
+                different = [col for col in frame.columns if col not in columns] + [col for col in columns if col not in frame.columns]
+                print(f"{file} does not have the same columns as {files[0]}: {different if different else 'different order'}")
+                return None
+        for file, frame in zip(files, frames):
+            print(f"{os.path.basename(file)}: {len(frame)} data points")
+        df = pl.concat([frame.with_columns(pl.lit(os.path.basename(file)).alias(source_col)) for file, frame in zip(files, frames)],
+                       how='vertical_relaxed')
+        print(f"{len(files)} raw datasets have been combined: {len(df)} data points")
+        return df.lazy()
+
+    def lazy_columns_redefine(self, pl, lf):
+        """
+        - To change column names for smoother data analysis (lazy)
+        """
+        original_cols = [col for col in lf.collect_schema().names() if col != source_col]
+        if len(original_cols) != len(self.cols_new):
+            raise ValueError(f"Length mismatch: the dataset has {len(original_cols)} columns, cols_new has {len(self.cols_new)} names")
+        self.columns_book(original_cols)
+        return lf.rename(dict(zip(original_cols, self.cols_new)))
+
+    def lazy_re_order(self, pl, lf):
+        """
+        - Reorder the columns according to self.new_order (lazy)
+        """
+        columns = lf.collect_schema().names()
+        cols_to_use = [col for col in self.new_order if col in columns]
+        if source_col in columns and source_col not in cols_to_use:
+            cols_to_use.append(source_col)
+        print(f"Columns have been reordered according to new_order: {cols_to_use}")
+        return lf.select(cols_to_use)
+
+    def lazy_duplicates(self, pl, lf):
+        """
+        - To detect and remove duplicates (the initial count, duplicates and cleaned dataset come from one plan)
+        """
+        col = self.identifiers
+        initial, duplicates, df = pl.collect_all([lf.select(pl.len()),
+                                                  lf.with_row_index('__index').filter(pl.struct(col).is_duplicated()),
+                                                  lf.unique(subset=col, keep='first', maintain_order=True)])
+        print(f'Initial data points: {initial.item()}')
+        print("")
+        print(f"Number of duplicate based on '{col}': {len(duplicates)}")
+        if len(duplicates) > 0:
+            print("Duplicate rows:")
+            print(duplicates.to_pandas().set_index('__index').rename_axis(None))
+        print(f"Number of data points: {len(df)} | After removing duplicates")
+        print("")
+        return df
+
+    def lazy_anonymisation(self, pl, df):
+        """
+        - To implement a dataframe anonymisation, the anonymised dataset is always saved in a background thread
+          (processing_polars waits for it unless background=True)
+        """
+        col1 = self.anon_col
+        unique_values = df[col1].unique(maintain_order=True).to_list()
+        new_values = [f"respondent_{uuid.uuid4()}" for _ in unique_values]
+        df = df.with_columns(pl.col(col1).replace_strict(unique_values, new_values, return_dtype=pl.String))
+        path = f"{self.file_path}_anonymised.{self.file_type}"
+        writer = threading.Thread(target=_write_polars, args=(df, path, self.file_type))
+        writer.start()
+        self.writers.append(writer)
+        print(f"The anonymised dataset is being saved in the background: {path}")
+        print("The respondent name has been anonymised")
+        return df
+
+    def lazy_date_filter(self, pl, lf):
+        """
+        - To remove dates on which the pilot test was conducted from the dataset (lazy)
+        """
+        temporal = lf.collect_schema()['today'].is_temporal()
+        for date in self.dates:
+            lf = lf.filter(pl.col('today').ne_missing(pl.lit(pd.Timestamp(date)) if temporal else date))
+        return lf
+
+    def lazy_missing_value_clean(self, pl, lf):
+        """
+        - To detect and remove missing values (only the columns of miss_col are read to count them)
+        """
+        miss_col = self.miss_col
+        counts = lf.select([pl.len().alias('__rows')] + [pl.col(col).null_count() for col in miss_col]).collect()
+        initial_data_points = counts['__rows'].item()
+        num_missing_cols = {}
+        print("")
+        for col in miss_col:
+            missing_count = counts[col].item()
+            num_missing_cols[col] = missing_count
+            print(f'Column {col} has {missing_count} missing values')
+
+        if self.del_type == 1:
+            threshold = 0.1 * initial_data_points
+            cols_to_drop = [col for col, missing_count in num_missing_cols.items() if missing_count > threshold]
+            print("")
+            print(f'Number of columns: {len(lf.collect_schema().names())} | After removing the columns that contained missing values more than 10% of data points')
+            print(f'Dropped columns = {cols_to_drop}')
+            lf = lf.drop(cols_to_drop)
+            miss_col = [col for col in miss_col if col not in cols_to_drop]
+        lf = lf.drop_nulls(subset=miss_col)
+
+        remaind_data_points = lf.select(pl.len()).collect().item()
+        print("")
+        print(f'Number of deleted missing values: {initial_data_points - remaind_data_points}')
+        print(f"Number of data points after missing value handling: {remaind_data_points}")
+        print("")
+        return lf
+
+    def lazy_region_group(self, pl, lf):
+        """
+        - To create new region group variable (lazy)
+        """
+        west_africa = ['Sierra Leone', 'Ghana', 'Liberia', 'Mali']
+        east_africa = ['Kenya', 'Uganda', 'Ethiopia']
+        mena = ['Lebanon', 'Jordan']
+        country = pl.col('country').cast(pl.String)
+        lf = lf.with_columns(pl.when(country.is_in(west_africa)).then(pl.lit('West Africa'))
+                             .when(country.is_in(east_africa)).then(pl.lit('East Africa'))
+                             .when(country.is_in(mena)).then(pl.lit('MENA'))
+                             .otherwise(pl.lit(None, dtype=pl.String)).alias('region_group'))
+        print('New region group variable (Age Group) has been created in this dataset')
+        return lf
+
+    def lazy_open_ended_cols(self, pl, lf):
+        """
+        - To save opened-ended columns and remove these from the dataset (only these columns are read to save them)
+        """
+        cols = self.opened_cols
+        answers = pl.collect_all([lf.select(pl.col(col).drop_nulls().unique(maintain_order=True)) for col in cols])
+        self.open_ended_file({col: frame[col].to_pandas().values for col, frame in zip(cols, answers)})
+        lf = lf.drop(cols)
+        print(f'Number of columns: {len(lf.collect_schema().names())} | After removing the open-ended columns')
+        return lf
+
+    def lazy_age_group(self, pl, lf):
+        """
+        - To create new age group variable (lazy, categories are set after the plan is collected)
+        """
+        col = self.age_col
+        bins = [17, 24, 34, 44, 54, 64]
+        labels = ['Below 18','18 - 24','25 - 34', '35 - 44', '45 - 54', '55 - 64', 'Above 65 years']
+        age = pl.col(col)
+        group = pl.when(age <= 0).then(pl.lit(None, dtype=pl.String))
+        for upper, label in zip(bins, labels):
+            group = group.when(age <= upper).then(pl.lit(label))
+        lf = lf.with_columns(age.cast(pl.Int64)).with_columns(group.otherwise(pl.lit(labels[-1])).alias('Age Group'))
+        print('New age group variable (Age Group) has been created in this dataset')
+        return lf
+
+    def lazy_disability(self, pl, lf):
+        """
+        - Simplified disability variable creation (lazy, see disability)
+        """
+        schema = lf.collect_schema()
+        cols = ['a5_1', 'a5_2', 'a5_3', 'a5_4', 'a5_5', 'a5_6']
+        missing = [col for col in cols[:4] + ['a5_5'] if col not in schema]
+        if missing:
+            print('New disability variable has not been created:', missing)
+            return lf
+        lf = lf.with_columns(pl.when(pl.any_horizontal([_equals(pl, schema, col, 1) for col in cols[:4]]))
+                             .then(pl.lit('Disability')).otherwise(pl.lit('No Disability')).alias('Disability'))
+        print('New disability variable (Disability) has been created')
+        return lf
+
+    def lazy_indicator_calculation(self, pl, lf):
+        """
+        - To measure the indicators (lazy, the same rules as indicator_calculation)
+        """
+        schema = lf.collect_schema()
+
+        def rule(condition, name, yes='Applicable', no='Not applicable'):
+            return pl.when(condition).then(pl.lit(yes)).otherwise(pl.lit(no)).alias(name)
+
+        def all_scores(cols, minimum):
+            return pl.all_horizontal([(_scores(pl, schema, col, self.codebook.scale(col).score_map()) >= minimum).fill_null(False)
+                                      for col in cols])
+
+        lf = lf.with_columns(pl.col('cso').replace(self.cso_mapping()) if schema['cso'] == pl.String else pl.col('cso'))
+        return lf.with_columns(
+            rule(_equals(pl, schema, 'b9_1', 1) | _equals(pl, schema, 'b9_3', 1), 'Outcome2.2'),
+            rule(_equals(pl, schema, 'b6_2', 1), 'WRGE2.2', 'Not applicable', 'Applicable'),
+            rule(all_scores(['b13a', 'b13b', 'b13c', 'b13d', 'b13e'], 3), 'CA.2'),
+            rule(_equals(pl, schema, 'f4', "Yes – always") | _equals(pl, schema, 'f4', "Yes – sometimes"), 'PD.1'),
+            rule(_equals(pl, schema, 'b8_1', 1), 'LO.2', 'Not applicable', 'Applicable'),
+            rule(all_scores(['b14a', 'b14b', 'b14c'], 3), 'WRGE5.1'),
+            rule(_equals(pl, schema, 'b10_4', 1), 'SCS7', 'Not applicable', 'Applicable'))
+
+    def processing_polars(self, background=False):
+        """
+        - To conduct data pre-processing with the Polars engine (the same steps and cleaned dataset as processing)
+        - The steps are lazy query plans run on all cores: helper columns (e.g. scores) are never materialised and
+          the counts and open-ended answers only read the columns they need
+        - A csv export is read by Polars, the dataset is collected once after the duplicates (the anonymised dataset
+          is written by Polars in the background) and once at the end
+        """
+        pl = _polars()
+        lf = self.lazy_load(pl)
+        if lf is None:
+            print("The pandas engine is used instead")
+            self.engine = 'pandas'
+            return self.processing(background)
+        lf = self.lazy_columns_redefine(pl, lf)
+        lf = self.lazy_re_order(pl, lf)
+        df = self.lazy_duplicates(pl, lf)
+        df = self.lazy_anonymisation(pl, df)
+        lf = df.lazy()
+        if len(self.dates) != 0:
+            lf = self.lazy_date_filter(pl, lf)
+        print(f'Initial number of columns: {len(df.columns)}')
+        lf = lf.drop(self.list_del_cols)
+        print(f'Number of columns: {len(lf.collect_schema().names())} | After removing the columns that are not needed for the analysis')
+        lf = self.lazy_missing_value_clean(pl, lf)
+        lf = self.lazy_region_group(pl, lf)
+        lf = self.lazy_open_ended_cols(pl, lf)
+        if self.age_col != None:
+            lf = self.lazy_age_group(pl, lf)
+        if self.diss_cols != None:
+            lf = self.lazy_disability(pl, lf)
+        lf = self.lazy_indicator_calculation(pl, lf)
+        print('All relevant indicators have been measured')
+
+        df = lf.collect().to_pandas()
+        if 'Age Group' in df.columns and self.age_col != None:
+            labels = ['Below 18','18 - 24','25 - 34', '35 - 44', '45 - 54', '55 - 64', 'Above 65 years']
+            df['Age Group'] = pd.Categorical(df['Age Group'], categories=labels, ordered=True)
+        self.df = df
+        # The Likert columns are coded on the collected dataset, as in processing (the query plans score the normalised labels)
+        self.likert_codes()
+        original = self.file_path
+        self.file_path = f'{self.file_path}_cleaned'
+        self.save_data(background)
+        self.file_path = original
+        if not background:
+            self.wait()
+        print("")
+        print(f'Final number of data points: {len(self.df)}')
+        if not background:
+            print(f"Cleaned dataframe has been saved: {self.file_path}_cleaned.{self.file_type}")
+        return True
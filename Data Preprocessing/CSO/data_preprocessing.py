@@ -16,6 +16,7 @@ file_type = 'xlsx'
 
 file_path = "Data/25-PI-GLO-1 - Raw Dataset (CSO)"
 # Original data location and name (excluding file extension): "Data/(name)"
+# Several exports (e.g. one per country) can be combined with a glob pattern "Data/* Raw Dataset" or a list of locations
 
 file_path_others = "Data/25-PI-GLO-1 - Open-End (CSO).xlsx"
 # Specify the path and name of the Excel sheet where the values from the open-ended columns will be saved (New file)
@@ -95,7 +96,11 @@ del_type = 0 or 1
 -> 0: Remove all missing values from the columns where missing values are detected
 -> 1: First, remove columns where missing values make up 10% or more of the total data points
       Then, remove all remaining missing values from the columns where they are detected
+engine = 'pandas' or 'polars'
+-> polars: Run the same steps as lazy Polars query plans (faster for large exports, the cleaned dataset is the same)
 """
 
-sweetgum = dp.Preprocessing(project_name, file_path, file_path_others, list_del_cols, dates, miss_col, respondent_name, identifiers, open_cols, cols_new, new_cols_order, age_col, diss_cols, del_type = 0, file_type=file_type)
-sweetgum.processing()
\ No newline at end of file
+sweetgum = dp.Preprocessing(project_name, file_path, file_path_others, list_del_cols, dates, miss_col, respondent_name, identifiers, open_cols, cols_new, new_cols_order, age_col, diss_cols, del_type = 0, file_type=file_type, engine='pandas')
+# The settings can be imported without running the pipeline (e.g. PerformanceManagementFramework.preprocess)
+if __name__ == '__main__':
+    sweetgum.processing()
@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@author: Bodhi Global Analysis (Jungyeon Lee)
+"""
+
+import re
+import numpy as np
+import pandas as pd
+
+# Number of set bits of every byte (popcount of wider masks sums their bytes)
+_bits_of_byte = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+
+def _mask_dtype(options):
+    """
+    - To choose the smallest unsigned integer holding one bit per option
+    """
+    for dtype in (np.uint8, np.uint16, np.uint32, np.uint64):
+        if options <= np.iinfo(dtype).bits:
+            return dtype
+    raise ValueError(f"A bitmask cannot hold more than 64 options ({options} options)")
+
+
+class OptionMask:
+
+    def __init__(self, options, selected, present, binary, index, value=1):
+        """
+        - Initialise the option mask (the options of a multi-select question packed into one bitmask per respondent)
+        - Bit i of a respondent is set when the option i was selected
+
+        options: list, Columns of the options (one bit each, in this order)
+        selected: array, Bitmask of the selected options (uint8/uint16/uint32/uint64)
+        present: array, Bitmask of the answered options (missing answers are not set)
+        binary: True/False, Whether all answers were the selected value or 0 (see option_counts)
+        index: index, Index of the dataset
+        value: int/str, Answer of a selected option
+        """
+        self.options = list(options)
+        self.selected = selected
+        self.present = present
+        self.binary = binary
+        self.index = index
+        self.value = value
+
+    @classmethod
+    def pack(cls, df, options, value=1):
+        """
+        - To pack the option columns of a question (e.g. b9_1..b9_5) into bitmasks
+        df: Dataframe, Dataset
+        options: list, Columns of the options
+        value: int/str, Answer of a selected option (1 for the expanded multi-select columns, 'Yes' for Yes/No questions)
+        """
+        dtype = _mask_dtype(len(options))
+        selected = np.zeros(len(df), dtype=dtype)
+        present = np.zeros(len(df), dtype=dtype)
+        binary = True
+        for i, col in enumerate(options):
+            bit = dtype(1) << dtype(i)
+            is_selected = df[col].eq(value).to_numpy(dtype=bool, na_value=False)
+            is_present = df[col].notna().to_numpy()
+            selected |= np.where(is_selected, bit, dtype(0)).astype(dtype)
+            present |= np.where(is_present, bit, dtype(0)).astype(dtype)
+            if binary and not (is_selected | df[col].eq(0).to_numpy(dtype=bool, na_value=False))[is_present].all():
+                binary = False
+        return cls(options, selected, present, binary, df.index, value)
+
+    def bits(self, options=None):
+        """
+        - To get the bitmask of some options (all options by default)
+        options: list, Columns of the options
+        """
+        dtype = self.selected.dtype.type
+        if options is None:
+            return dtype(np.iinfo(dtype).max >> (np.iinfo(dtype).bits - len(self.options)))
+        bits = dtype(0)
+        for col in options:
+            bits |= dtype(1) << dtype(self.options.index(col))
+        return bits
+
+    def any(self, options=None):
+        """
+        - To check whether at least one of the options was selected
+        options: list, Columns of the options (all options by default)
+        """
+        return pd.Series((self.selected & self.bits(options)) != 0, index=self.index)
+
+    def all(self, options=None):
+        """
+        - To check whether all the options were selected
+        options: list, Columns of the options (all options by default)
+        """
+        bits = self.bits(options)
+        return pd.Series((self.selected & bits) == bits, index=self.index)
+
+    def count(self, options=None):
+        """
+        - To count the selected options of each respondent (popcount)
+        options: list, Columns of the options (all options by default)
+        """
+        masked = self.selected & self.bits(options)
+        counts = _bits_of_byte[masked.view(np.uint8).reshape(len(masked), -1)].sum(axis=1, dtype=np.int64)
+        return pd.Series(counts, index=self.index)
+
+    def option_counts(self, categories=(1, 0)):
+        """
+        - To count the answers of each option (a multi-table, the same as value_counts of each option column)
+        - Only for options answered with the selected value or 0
+        categories: list, Categories of the indices (the selected value and/or 0)
+        """
+        if not self.binary:
+            raise ValueError("Only options answered with 0 or the selected value can be counted from the bitmask")
+        selected = np.array([np.count_nonzero(self.selected & self.bits([col])) for col in self.options], dtype=np.int64)
+        present = np.array([np.count_nonzero(self.present & self.bits([col])) for col in self.options], dtype=np.int64)
+        zeros = np.zeros(len(self.options), dtype=np.int64)
+        rows = [selected if category == self.value else present - selected if category == 0 else zeros for category in categories]
+        return pd.DataFrame(np.array(rows, dtype=np.int64).reshape(len(rows), len(self.options)),
+                            index=pd.Index(categories), columns=self.options)
+
+    def unpack(self):
+        """
+        - To get the option columns back (1 when selected, 0 when not selected, missing when not answered)
+        """
+        columns = {}
+        for col in self.options:
+            bit = self.bits([col])
+            columns[col] = np.where(self.present & bit, np.where(self.selected & bit, 1.0, 0.0), np.nan)
+        return pd.DataFrame(columns, index=self.index)
+
+    def nbytes(self):
+        """
+        - To get the memory used by the bitmasks (bytes)
+        """
+        return self.selected.nbytes + self.present.nbytes
+
+
+def pack_questions(df, columns=None, value=1):
+    """
+    - To pack the expanded multi-select questions of a dataset (columns named question_1, question_2...)
+    - Returns {question: option mask}
+    df: Dataframe, Dataset
+    columns: list, Columns to look at (all columns by default)
+    value: int/str, Answer of a selected option
+    """
+    questions = {}
+    for col in (df.columns if columns is None else columns):
+        match = re.fullmatch(r'(.+)_(\d+)', str(col))
+        if match:
+            questions.setdefault(match.group(1), []).append(col)
+    return {question: OptionMask.pack(df, options, value) for question, options in questions.items()}
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@author: Bodhi Global Analysis (Jungyeon Lee)
+"""
+
+"""
+Tests of the option bitmasks (bodhi_bits) against the row-by-row rules they replaced
+- Every copy of the module (data analysis and data preprocessing folders) is tested
+"""
+
+import importlib.util
+import os
+import numpy as np
+import pandas as pd
+import pytest
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+folders = ['Data Analysis/CSO', 'Data Analysis/GYW', 'Data Preprocessing/CSO', 'Data Preprocessing/GYW']
+
+
+def load(folder, name):
+    """
+    - To import a module from one of the project folders (the folders have modules with the same names)
+    """
+    spec = importlib.util.spec_from_file_location(f"{name}_{folder.replace('/', '_').replace(' ', '_')}",
+                                                  os.path.join(root, folder, f'{name}.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+@pytest.fixture(params=folders)
+def bb(request):
+    return load(request.param, 'bodhi_bits')
+
+@pytest.fixture
+def options():
+    # Expanded multi-select answers with missing answers, floats read from Excel and answers other than 0/1
+    return pd.DataFrame({'b9_1': [1, 0, np.nan, 1, 0, 1.0],
+                         'b9_2': [0, 0, 1, np.nan, 0, 1],
+                         'b9_3': [1, 2, 0, 0, np.nan, 1],
+                         'b9_4': [0, 1, '1', 0, 0, np.nan]}, index=[10, 11, 12, 13, 14, 15])
+
+@pytest.fixture
+def yes_no():
+    return pd.DataFrame({'c1': ['Yes', 'No', 'Yes', np.nan, 'No', 'Yes'],
+                         'c2': ['Yes', 'No', 'No', 'Yes', np.nan, 'Not sure'],
+                         'c3': ['Yes', 'No', 'Yes', 'Yes', 'No', 'Yes']})
+
+
+@pytest.mark.parametrize('subset', [None, ['b9_1'], ['b9_1', 'b9_3'], ['b9_2', 'b9_4']])
+def test_any_all_match_row_rules(bb, options, subset):
+    columns = list(options.columns) if subset is None else subset
+    mask = bb.OptionMask.pack(options, list(options.columns))
+    # Rules of the row-by-row apply, e.g. row['b9_1'] == 1 or row['b9_3'] == 1
+    expected_any = options.apply(lambda row: any(row[col] == 1 for col in columns), axis=1)
+    expected_all = options.apply(lambda row: all(row[col] == 1 for col in columns), axis=1)
+    pd.testing.assert_series_equal(mask.any(subset), expected_any, check_names=False)
+    pd.testing.assert_series_equal(mask.all(subset), expected_all, check_names=False)
+
+@pytest.mark.parametrize('value', ['Yes', 'No'])
+def test_score_select_rules(bb, yes_no, value):
+    columns = list(yes_no.columns)
+    mask = bb.OptionMask.pack(yes_no, columns, value)
+    # score_select_allyes/allno/anyyes/anyno before the bitmasks
+    expected_all = yes_no.apply(lambda row: all(row[var] == value for var in columns), axis=1)
+    expected_any = yes_no.apply(lambda row: any(row[var] == value for var in columns), axis=1)
+    assert mask.all().tolist() == expected_all.tolist()
+    assert mask.any().tolist() == expected_any.tolist()
+
+def test_disability_rule(bb):
+    df = pd.DataFrame({'a5_1': [1, 0, np.nan, 0], 'a5_2': [0, 0, 0, np.nan], 'a5_3': [0, 1, 0, np.nan],
+                       'a5_4': [0, 0, np.nan, np.nan], 'a5_5': [0, 0, 1, np.nan], 'a5_6': [0, 0, 0, 1]})
+    cols = list(df.columns)
+    expected = pd.Series('No Disability', index=df.index)
+    expected[df[cols[:4]].eq(1).any(axis=1)] = 'Disability'
+    wgss = bb.OptionMask.pack(df, cols)
+    assert np.where(wgss.any(cols[:4]), 'Disability', 'No Disability').tolist() == expected.tolist()
+
+def test_binary_and_option_counts(bb, options):
+    assert not bb.OptionMask.pack(options, list(options.columns)).binary
+    columns = ['b9_1', 'b9_2']
+    mask = bb.OptionMask.pack(options, columns)
+    assert mask.binary
+    # The same as the value_counts of each option column reindexed to the categories (multi_counts)
+    expected = pd.DataFrame({col: options[col].value_counts().reindex([1, 0], fill_value=0) for col in columns})
+    pd.testing.assert_frame_equal(mask.option_counts([1, 0]), expected, check_dtype=False)
+    assert mask.option_counts([0]).loc[0].tolist() == [2, 3]
+    with pytest.raises(ValueError):
+        bb.OptionMask.pack(options, list(options.columns)).option_counts()
+
+def test_count(bb, options):
+    columns = list(options.columns)
+    mask = bb.OptionMask.pack(options, columns)
+    expected = options.apply(lambda row: sum(row[col] == 1 for col in columns), axis=1)
+    assert mask.count().tolist() == expected.tolist()
+    assert mask.count(['b9_1', 'b9_3']).tolist() == [2, 0, 0, 1, 0, 2]
+
+def test_unpack(bb, options):
+    columns = ['b9_1', 'b9_2']
+    unpacked = bb.OptionMask.pack(options, columns).unpack()
+    pd.testing.assert_frame_equal(unpacked, options[columns].astype(float))
+    # Answers other than the selected value are unpacked as not selected, missing answers stay missing
+    other = bb.OptionMask.pack(options, ['b9_3', 'b9_4']).unpack()
+    assert other['b9_3'].tolist()[:2] == [1.0, 0.0]
+    assert np.isnan(other['b9_3'].iloc[4]) and other['b9_4'].iloc[2] == 0.0
+
+def test_mask_dtype(bb):
+    df = pd.DataFrame({f'q_{i}': [1, 0] for i in range(1, 66)})
+    assert bb.OptionMask.pack(df, list(df.columns)[:8]).selected.dtype == np.uint8
+    assert bb.OptionMask.pack(df, list(df.columns)[:9]).selected.dtype == np.uint16
+    assert bb.OptionMask.pack(df, list(df.columns)[:64]).all().tolist() == [True, False]
+    with pytest.raises(ValueError):
+        bb.OptionMask.pack(df, list(df.columns))
+
+def test_pack_questions(bb, options):
+    df = options.assign(b10_1=[1, 0, 0, 1, np.nan, 0], b10_2=[0, 0, 1, 1, 0, 0], country='Kenya')
+    questions = bb.pack_questions(df)
+    assert set(questions) == {'b9', 'b10'}
+    assert questions['b10'].options == ['b10_1', 'b10_2']
+    # Rules of the preprocessing, e.g. row['b10_4'] == 1 -> 'Not applicable'
+    expected = df.apply(lambda row: row['b10_1'] == 1 or row['b10_2'] == 1, axis=1)
+    assert questions['b10'].any().tolist() == expected.tolist()
+    assert set(bb.pack_questions(df, ['b10_1', 'b10_2', 'country'])) == {'b10'}
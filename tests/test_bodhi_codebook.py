@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@author: Bodhi Global Analysis (Jungyeon Lee)
+"""
+
+"""
+Tests of the Likert codebook (bodhi_codebook): label variants, labels out of the scales and scores of missing answers
+- Every copy of the module (data analysis and data preprocessing folders) is tested
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+from test_bodhi_bits import folders, load
+
+extent_scale = ['1 - Not at all', '2 - Slightly', '3 - Moderately', '4 - A Lot', '5 - Extremely']
+
+
+@pytest.fixture(params=folders)
+def bcb(request):
+    return load(request.param, 'bodhi_codebook')
+
+@pytest.fixture
+def answers():
+    # Spellings of the exports (en dash, case, spaces), a label out of the scale and missing answers
+    return pd.DataFrame({'b13a': ['4 - A Lot', '4 – a lot ', '4-A lot', '1 - Not at all', np.nan, "Don't know", '5 - Extremely'],
+                         'b13b': ['3 - Moderately', '3 — MODERATELY', np.nan, np.nan, '2 - slightly', '2 - Slightly', "Don't know"],
+                         'other': list('abcdefg')})
+
+def codebook(bcb):
+    return bcb.Codebook({'extent': bcb.Scale(extent_scale)}, {'b13a': 'extent', 'b13b': 'extent'})
+
+
+@pytest.mark.parametrize('label', ['4 - A Lot', '4 – a lot ', '4-A lot', '4 —  A  LOT', '4−a lot', ' 4 -a lot'])
+def test_normalise_variants(bcb, label):
+    assert bcb.normalise(label) == '4 - a lot'
+
+def test_normalise_other_values(bcb):
+    assert bcb.normalise(3) == 3
+    assert np.isnan(bcb.normalise(np.nan))
+    assert bcb.normalise('4 - A Lot') != bcb.normalise('3 - Moderately')
+
+def test_scale(bcb):
+    scale = bcb.Scale(extent_scale)
+    assert scale.position('4 – a lot') == 3
+    assert scale.position("Don't know") is None
+    assert scale.score_map() == {label: i + 1 for i, label in enumerate(extent_scale)}
+    assert bcb.Scale(['No', 'Yes'], [0, 10]).score_map() == {'No': 0, 'Yes': 10}
+
+def test_compile_labels_and_unmapped(bcb, answers):
+    book = codebook(bcb)
+    df = book.compile(answers.copy())
+    assert df['b13a'].cat.ordered
+    # Variants are written as the labels of the scale, labels out of the scale are kept after them
+    assert list(df['b13a'].cat.categories) == extent_scale + ["Don't know"]
+    assert df['b13a'].tolist()[:3] == ['4 - A Lot'] * 3
+    assert df['b13b'].tolist()[1] == '3 - Moderately'
+    assert df['b13a'].isna().tolist() == answers['b13a'].isna().tolist()
+    assert df['other'].tolist() == list('abcdefg')
+    assert book.unmapped['b13a'].to_dict() == {"Don't know": 1}
+    report = book.report()
+    assert report.values.tolist() == [['b13a', "Don't know", 1], ['b13b', "Don't know", 1]]
+
+def test_compile_again(bcb, answers):
+    book = codebook(bcb)
+    once = book.compile(answers.copy())
+    twice = book.compile(once.copy())
+    pd.testing.assert_frame_equal(once, twice)
+    assert set(book.unmapped) == {'b13a', 'b13b'}
+
+def test_all_labels_in_scale(bcb, answers):
+    book = codebook(bcb)
+    df = answers.copy()
+    df['b13a'] = df['b13a'].replace("Don't know", np.nan)
+    df['b13b'] = df['b13b'].replace("Don't know", '1 - Not at all')
+    book.compile(df)
+    assert book.unmapped == {}
+    assert book.report().empty
+
+def test_scores_of_missing_and_unmapped(bcb, answers):
+    book = codebook(bcb)
+    df = book.compile(answers.copy())
+    scores = book.scores(df, ['b13a', 'b13b'])
+    # Missing answers and labels out of the scale score 0
+    assert scores[:, 0].tolist() == [4, 4, 4, 1, 0, 0, 5]
+    assert scores[:, 1].tolist() == [3, 3, 0, 0, 2, 2, 0]
+    # The raw answers are scored the same way without compiling them
+    assert bcb.map_scores(answers['b13a'], book.scale('b13a').score_map()).tolist() == scores[:, 0].tolist()
+    assert bcb.map_scores(answers['b13b'], book.scale('b13b').score_map(), default=-1).tolist() == [3, 3, -1, -1, 2, 2, -1]
+    assert book.scores(df, []).shape == (len(df), 0)
+
+def test_scores_match_score_map_rule(bcb, answers):
+    book = codebook(bcb)
+    df = book.compile(answers.copy())
+    score_map = {'1 - Not at all': 1, '2 - Slightly': 2, '3 - Moderately': 3, '4 - A Lot': 4, '5 - Extremely': 5}
+    # CA.2 before the codebook: Series.map of the exact labels, then all(x >= 3) (a missing score is not >= 3)
+    exact = answers[['b13a', 'b13b']].apply(lambda column: column.map(bcb.normalise).map({bcb.normalise(k): v for k, v in score_map.items()}))
+    expected = exact.apply(lambda x: 'Applicable' if all(x >= 3) else 'Not applicable', axis=1)
+    result = np.where((book.scores(df, ['b13a', 'b13b']) >= 3).all(axis=1), 'Applicable', 'Not applicable')
+    assert result.tolist() == expected.tolist()